@@ -0,0 +1,173 @@
+#!/usr/bin/env python3.9
+
+"""Measure the cost of indexer operations on synthetic data
+
+This is a development aid, run against an installed (or checked out) Pbench
+Server package, to compare the indexer's optimized code paths against the
+straightforward implementations they replace. It reports the timings and
+leaves the judgement to the reader: unlike the unit tests, which verify that
+the two produce the same results, it asserts nothing.
+
+`pbench-indexer-benchmark.py members` compares tool data file lookups in a
+synthetic tar ball of over 500,000 members using the member index against
+scanning the members.
+
+`pbench-indexer-benchmark.py encoders` compares the documents per second of
+serializing each tool data source for its ID and again for the bulk request
+against encoding it once with each available SourceEncoder.
+"""
+from argparse import ArgumentParser
+import sys
+import tarfile
+import time
+from types import SimpleNamespace
+
+from elasticsearch.serializer import JSONSerializer
+
+import pbench.server.indexer
+from pbench.server.indexer import MemberIndex, PbenchData, SourceEncoder, ToolData
+
+
+def make_members(dirs: list[str], files: list[str]) -> list[tarfile.TarInfo]:
+    """Construct TarInfo records for the given directory and file paths"""
+    members = []
+    for name in dirs:
+        member = tarfile.TarInfo(name)
+        member.type = tarfile.DIRTYPE
+        members.append(member)
+    for name in files:
+        members.append(tarfile.TarInfo(name))
+    return members
+
+
+def scan(members: list[tarfile.TarInfo], path: str) -> list[str]:
+    """The linear scan of the members which the member index replaces"""
+    return [m.name for m in members if m.isfile() and m.name.find(path) >= 0]
+
+
+def members(args) -> int:
+    """Compare member index lookups against scanning the members"""
+    dirs, files = ["run"], []
+    for i in range(args.iterations):
+        dirs.append(f"run/{i}-default")
+        for s in range(5):
+            dirs.append(f"run/{i}-default/sample{s}")
+            for h in range(10):
+                base = f"run/{i}-default/sample{s}/tools-default/host{h}"
+                for t in range(10):
+                    files.extend(f"{base}/tool{t}/csv/f{f}.csv" for f in range(49))
+                    files.append(f"{base}/tool{t}-stdout.txt")
+    tar_members = make_members(dirs, files)
+    paths = [
+        f"run/{i}-default/sample{i % 5}/tools-default/host{i}/tool{i}/csv"
+        for i in range(min(10, args.iterations))
+    ]
+
+    start = time.perf_counter()
+    scanned = [scan(tar_members, path) for path in paths]
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = MemberIndex(tar_members)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    found = [list(index.files_by_prefix(path)) for path in paths]
+    lookup_time = time.perf_counter() - start
+
+    if found != [sorted(s) for s in scanned]:
+        print("The member index lookups don't match the scans", file=sys.stderr)
+        return 1
+    print(
+        f"{len(tar_members)} members, {len(paths)} lookups: scan {scan_time:.3f}s,"
+        f" index build {build_time:.3f}s, index lookups {lookup_time:.6f}s"
+    )
+    return 0
+
+
+def make_tool_data(encoder: SourceEncoder) -> ToolData:
+    """Construct just enough of a ToolData object to encode its documents"""
+    td = object.__new__(ToolData)
+    td.idxctx = SimpleNamespace(encoder=encoder)
+    td.toolname = "pidstat"
+    td.run_metadata = {"id": "abc", "controller": "ctrl", "toolsgroup": "default"}
+    td.iteration_metadata = {"name": "1-default", "number": 1}
+    td.sample_metadata = {"name": "sample1", "hostname": "hosté"}
+    return td
+
+
+def make_datum(td: ToolData, idx: int) -> dict:
+    """Construct a tool data document like those built from .csv files"""
+    return {
+        "@timestamp": "2020-01-01T00:00:00.000000",
+        "@timestamp_original": str(1577836800000 + idx),
+        "run": td.run_metadata,
+        "iteration": td.iteration_metadata,
+        "sample": td.sample_metadata,
+        "pidstat": {"id": "1234", "@idx": idx, "cpu": {"user": 1.5, "sys": 0}},
+    }
+
+
+def encoders(args) -> int:
+    """Compare encoding tool data documents once against serializing twice"""
+    serializer = JSONSerializer()
+    extra = {"@generated-by": "tracking", "authorization": {"owner": "1"}}
+    count = args.documents
+
+    td = make_tool_data(SourceEncoder())
+    start = time.perf_counter()
+    for idx in range(count):
+        source = make_datum(td, idx)
+        PbenchData.make_source_id(source)
+        source.update(extra)
+        serializer.dumps(source)
+    rates = {"twice": count / (time.perf_counter() - start)}
+
+    names = ["json"] + (["orjson"] if pbench.server.indexer.orjson else [])
+    for name in names:
+        encoder = SourceEncoder(name)
+        td = make_tool_data(encoder)
+        encode_source = td._source_encoder()
+        start = time.perf_counter()
+        fields = encoder.encode(extra)
+        for idx in range(count):
+            encoded = encode_source(make_datum(td, idx))
+            encoder.source_id(encoded)
+            serializer.dumps(encoder.extend(encoded, fields))
+        rates[name] = count / (time.perf_counter() - start)
+
+    print(
+        f"{count} documents: "
+        + ", ".join(f"{k} {v:.0f} docs/s" for k, v in rates.items())
+    )
+    return 0
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Measure the cost of indexer operations")
+    subparsers = parser.add_subparsers(required=True)
+    member_parser = subparsers.add_parser(
+        "members", help="Compare member index lookups against member scans"
+    )
+    member_parser.add_argument(
+        "--iterations",
+        type=int,
+        default=20,
+        help="The number of benchmark iterations in the synthetic tar ball",
+    )
+    member_parser.set_defaults(func=members)
+    encoder_parser = subparsers.add_parser(
+        "encoders", help="Compare tool data document encoding throughput"
+    )
+    encoder_parser.add_argument(
+        "--documents",
+        type=int,
+        default=20000,
+        help="The number of tool data documents to encode",
+    )
+    encoder_parser.set_defaults(func=encoders)
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
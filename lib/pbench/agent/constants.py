@@ -21,6 +21,8 @@ tm_channel_suffix_to_tms = "to-tms"
 tm_channel_suffix_from_tms = "from-tms"
 # Channel suffix for the Tool Meister logging channel
 tm_channel_suffix_to_logging = "to-logging"
+# Channel suffix for the Tool Data Sink's progress reports on received data
+tm_channel_suffix_progress = "progress"
 # Tool-Meisters info key
 tm_data_key = "tool-meister-data-key"
 
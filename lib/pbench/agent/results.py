@@ -17,7 +17,7 @@ from pbench.agent import PbenchAgentConfig
 from pbench.cli import CliContext
 from pbench.common import MetadataLog
 from pbench.common.exceptions import BadMDLogFormat
-from pbench.common.utils import md5sum, validate_hostname
+from pbench.common.utils import validate_hostname
 
 TarballRecord = collections.namedtuple("TarballRecord", ["name", "length", "md5"])
 
@@ -190,7 +190,9 @@ class MakeResultTb:
         sure it is valid, and then the "run.raw_size" and the
         "pbench.tar-ball-creation-timestamp" fields are added.
 
-        The tar ball is created, verified, and the MD5 sum value is generated.
+        The tar ball is created, and its length and MD5 sum value are
+        generated from the compressed stream as it is written, in a single
+        pass.
 
         Returns a named tuple consisting of the Path object of the created tar
         ball, its length, and its MD5 checksum value.
@@ -213,9 +215,13 @@ class MakeResultTb:
         if single_threaded:
             args.append("--xz")
         args.append(pbench_run_name)
+        tar_len = 0
+        tar_md5 = hashlib.md5()
         try:
-            # Invoke tar directly for efficiency.
-            with tarball.open("w") as ofp, e_file.open("w") as efp:
+            # Invoke tar directly for efficiency, and read the compressed
+            # stream as it is produced so that we can compute its length and
+            # MD5 while writing the tar ball, rather than reading it back.
+            with tarball.open("wb") as ofp, e_file.open("w") as efp:
                 if single_threaded:
                     xz_proc = None
                 else:
@@ -223,21 +229,31 @@ class MakeResultTb:
                         [self.xz_path, "-T0"],
                         cwd=str(self.target_dir),
                         stdin=subprocess.PIPE,
-                        stdout=ofp,
+                        stdout=subprocess.PIPE,
                         stderr=efp,
                     )
                 tar_proc = subprocess.Popen(
                     args,
                     cwd=str(self.result_dir.parent),
                     stdin=None,
-                    stdout=xz_proc.stdin if xz_proc else ofp,
+                    stdout=xz_proc.stdin if xz_proc else subprocess.PIPE,
                     stderr=efp,
                 )
-                tar_proc.wait()
                 if xz_proc:
-                    # Now that the `tar` command has exited, we close the
-                    # `stdin` of the `xz` command to shut it down.
+                    # The `tar` command now holds the `stdin` of the `xz`
+                    # command, so we close our copy in order that `xz` sees
+                    # the end of its input when `tar` exits.
                     xz_proc.stdin.close()
+                    stream = xz_proc.stdout
+                else:
+                    stream = tar_proc.stdout
+                for buf in iter(partial(stream.read, 2**20), b""):
+                    ofp.write(buf)
+                    tar_md5.update(buf)
+                    tar_len += len(buf)
+                stream.close()
+                tar_proc.wait()
+                if xz_proc:
                     xz_proc.wait()
         except Exception as exc:
             msg = self._unlink_tarball(
@@ -270,16 +286,8 @@ class MakeResultTb:
                     f"Failed to create tar ball; 'tar' return code: {tar_proc.returncode:d}",
                 )
                 raise RuntimeError(msg)
-        try:
-            (tar_len, tar_md5) = md5sum(tarball)
-        except Exception:
-            msg = self._unlink_tarball(
-                tarball,
-                f"Failed to verify and generate MD5 for created tar ball, '{tarball}'",
-            )
-            raise RuntimeError(msg)
 
-        return TarballRecord(name=tarball, length=tar_len, md5=tar_md5)
+        return TarballRecord(name=tarball, length=tar_len, md5=tar_md5.hexdigest())
 
 
 class CopyResult:
@@ -19,12 +19,14 @@ import logging
 import os
 from pathlib import Path
 import shutil
+from socketserver import ThreadingMixIn
 import subprocess
 import sys
 import tempfile
-from threading import Condition, Lock, Thread
-from typing import Any, Dict, List, NamedTuple, Tuple
-from wsgiref.simple_server import make_server, WSGIRequestHandler
+from threading import BoundedSemaphore, Condition, Lock, Thread
+import time
+from typing import Any, Dict, IO, Iterator, List, NamedTuple, Tuple
+from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
 
 from bottle import abort, Bottle, request, ServerAdapter
 from daemon import DaemonContext
@@ -36,6 +38,7 @@ import state_signals
 from pbench.agent.constants import (
     tm_allowed_actions,
     tm_channel_suffix_from_tms,
+    tm_channel_suffix_progress,
     tm_channel_suffix_to_client,
     tm_channel_suffix_to_logging,
     tm_channel_suffix_to_tms,
@@ -43,7 +46,7 @@ from pbench.agent.constants import (
 )
 from pbench.agent.redis_utils import RedisChannelSubscriber, wait_for_conn_and_key
 from pbench.agent.toolmetadata import ToolMetadata
-from pbench.agent.utils import collect_local_info
+from pbench.agent.utils import collect_local_info, Compression
 from pbench.common import MetadataLog
 from pbench.common.utils import canonicalize
 
@@ -58,6 +61,11 @@ _BUFFER_SIZE = 65536
 # Maximum size of the tar ball for collected tool data.
 _MAX_TOOL_DATA_SIZE = 2**30
 
+# Maximum number of received tar balls unpacked at the same time; unpacking is
+# CPU bound (decompression), so we don't run more "tar" processes than there
+# are CPUs to run them.
+_MAX_EXTRACTIONS = os.cpu_count() or 1
+
 # Expected metadata from received state signals
 METADATA_KEYS = {"group", "directory", "args"}
 
@@ -77,6 +85,76 @@ def _now(when):
         return datetime.utcnow().isoformat()
 
 
+class ChunkedReader:
+    """Decode a request body sent with "Transfer-Encoding: chunked".
+
+    Iterating over the reader yields the data of each chunk, in pieces of at
+    most _BUFFER_SIZE bytes. Once the body has been completely read, the
+    `trailers` attribute holds the trailer fields which followed the last
+    chunk, with lower-case names.
+
+    A ValueError is raised for a malformed body, or if the total length of
+    the data exceeds the given limit.
+    """
+
+    def __init__(self, stream: IO[bytes], limit: int):
+        self.stream = stream
+        self.limit = limit
+        self.length = 0
+        self.trailers: Dict[str, str] = {}
+
+    def _line(self) -> bytes:
+        line = self.stream.readline(_BUFFER_SIZE)
+        if not line.endswith(b"\n"):
+            raise ValueError("truncated or overlong line")
+        return line.rstrip(b"\r\n")
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            size_field = self._line().split(b";", 1)[0].strip()
+            try:
+                size = int(size_field, 16)
+            except ValueError:
+                raise ValueError(f"invalid chunk size {size_field!r}")
+            if size < 0:
+                raise ValueError(f"invalid chunk size {size_field!r}")
+            if size == 0:
+                break
+            self.length += size
+            if self.length > self.limit:
+                raise ValueError("content object too large")
+            while size > 0:
+                buf = self.stream.read(min(size, _BUFFER_SIZE))
+                if not buf:
+                    raise ValueError("truncated chunk")
+                size -= len(buf)
+                yield buf
+            if self._line():
+                raise ValueError("missing chunk terminator")
+        while True:
+            line = self._line()
+            if not line:
+                break
+            name, sep, value = line.decode("latin-1").partition(":")
+            if not sep:
+                raise ValueError(f"invalid trailer {line!r}")
+            self.trailers[name.strip().lower()] = value.strip()
+
+
+class DataSinkThreadingWsgiServer(ThreadingMixIn, WSGIServer):
+    """DataSinkThreadingWsgiServer - a WSGIServer which handles each request
+    in its own thread, so that the data from many Tool Meisters can be
+    received at the same time.
+    """
+
+    # Don't make the process wait on in-flight requests at exit.
+    daemon_threads = True
+
+    # All the Tool Meisters tend to connect at once when a sample ends, so
+    # allow for a deeper queue of pending connections than the default of 5.
+    request_queue_size = 128
+
+
 class DataSinkWsgiServer(ServerAdapter):
     """DataSinkWsgiServer - a re-implementation of Bottle's WSGIRefServer
     where we have access to the underlying WSGIServer instance in order to
@@ -125,6 +203,7 @@ class DataSinkWsgiServer(ServerAdapter):
                 )
 
         self.options["handler_class"] = DataSinkWsgiRequestHandler
+        self.options.setdefault("server_class", DataSinkThreadingWsgiServer)
         self._server = None
         self._err_code = None
         self._err_text = None
@@ -842,6 +921,11 @@ class ToolDataSink(Bottle):
         self._to_client_channel = (
             f"{self.params.channel_prefix}-{tm_channel_suffix_to_client}"
         )
+        self._progress_channel = (
+            f"{self.params.channel_prefix}-{tm_channel_suffix_progress}"
+        )
+        # Limits the number of received tar balls being unpacked at once.
+        self._extractions = BoundedSemaphore(_MAX_EXTRACTIONS)
 
         self._lock = Lock()
         self._cv = Condition(lock=self._lock)
@@ -1693,20 +1777,287 @@ class ToolDataSink(Bottle):
         self.sig_resp.respond(client, action, int(status == "success"), status)
         return int(status != "success")
 
+    def _receive_tarball(
+        self, hostname: str, target_dir: Path, compression: Compression
+    ) -> int:
+        """Receive a tar ball of tool data with a known length and MD5, and
+        unpack it into the target directory.
+
+        The tar ball is first spooled to the target directory, and then
+        unpacked once one of the extraction slots is available, so that many
+        tar balls can be received at once without over-committing the CPUs.
+
+        Returns the number of bytes received, calls the Bottle abort() method
+        for error handling.
+        """
+        content_length = 0
+        exp_md5 = ""
+
+        try:
+            content_length = int(request["CONTENT_LENGTH"])
+        except ValueError:
+            abort(400, "Invalid content-length header, not an integer")
+        except Exception:
+            abort(400, "Missing required content-length header")
+        else:
+            if content_length > _MAX_TOOL_DATA_SIZE:
+                abort(400, "Content object too large")
+
+        try:
+            exp_md5 = request["HTTP_MD5SUM"]
+        except Exception:
+            self.logger.exception(request.keys())
+            abort(400, "Missing required md5sum header")
+
+        host_data_tb_name = target_dir / f"{hostname}.tar{compression.suffix}"
+        if host_data_tb_name.exists():
+            abort(409, f"{host_data_tb_name} already uploaded")
+        host_data_tb_md5 = Path(f"{host_data_tb_name}.md5")
+
+        with tempfile.NamedTemporaryFile(mode="wb", dir=target_dir) as ofp:
+            total_bytes = 0
+            iostr = request["wsgi.input"]
+            h = hashlib.md5()
+            remaining_bytes = content_length
+            while remaining_bytes > 0:
+                buf = iostr.read(
+                    _BUFFER_SIZE if remaining_bytes > _BUFFER_SIZE else remaining_bytes
+                )
+                bytes_read = len(buf)
+                total_bytes += bytes_read
+                remaining_bytes -= bytes_read
+                h.update(buf)
+                ofp.write(buf)
+            cur_md5 = h.hexdigest()
+            if cur_md5 != exp_md5:
+                abort(
+                    400,
+                    f"Content, {cur_md5}, does not match its MD5SUM header,"
+                    f" {exp_md5}",
+                )
+            if total_bytes <= 0:
+                abort(400, "No data received")
+
+            # First write the .md5
+            try:
+                with host_data_tb_md5.open("w") as md5fp:
+                    md5fp.write(f"{exp_md5} {host_data_tb_name.name}\n")
+            except Exception:
+                try:
+                    os.remove(host_data_tb_md5)
+                except Exception as exc:
+                    self.logger.warning(
+                        "Failed to remove .md5 %s when trying to clean up: %s",
+                        host_data_tb_md5,
+                        exc,
+                    )
+                self.logger.exception(
+                    "Failed to write .md5 file, '%s'", host_data_tb_md5
+                )
+                raise
+
+            # Then create the final filename link to the temporary file.
+            try:
+                os.link(ofp.name, host_data_tb_name)
+            except Exception:
+                try:
+                    os.remove(host_data_tb_md5)
+                except Exception as exc:
+                    self.logger.warning(
+                        "Failed to remove .md5 %s when trying to clean up: %s",
+                        host_data_tb_md5,
+                        exc,
+                    )
+                self.logger.exception(
+                    "Failed to rename tar ball '%s' to '%s'",
+                    ofp.name,
+                    host_data_tb_md5,
+                )
+                raise
+            else:
+                self.logger.debug(
+                    "Successfully wrote %s (%s.md5)",
+                    host_data_tb_name,
+                    host_data_tb_name,
+                )
+
+        # Now unpack that tar ball
+        command = [self.tar_path, "--extract", f"--file={host_data_tb_name}"]
+        if compression.program != "none":
+            command.append(f"--use-compress-program={compression.program}")
+        o_file = target_dir / f"{hostname}.tar.out"
+        e_file = target_dir / f"{hostname}.tar.err"
+        try:
+            # Invoke tar directly for efficiency.
+            with self._extractions, o_file.open("w") as ofp, e_file.open("w") as efp:
+                cp = subprocess.run(
+                    command,
+                    cwd=target_dir,
+                    stdin=None,
+                    stdout=ofp,
+                    stderr=efp,
+                )
+        except Exception:
+            self.logger.exception("Failed to extract tar ball, '%s'", host_data_tb_name)
+            abort(500, "INTERNAL ERROR")
+        else:
+            if cp.returncode != 0:
+                self.logger.error(
+                    "Failed to create tar ball; return code: %d", cp.returncode
+                )
+                abort(500, "INTERNAL ERROR")
+            else:
+                self.logger.debug("Successfully unpacked %s", host_data_tb_name)
+                try:
+                    o_file.unlink()
+                    e_file.unlink()
+                    host_data_tb_md5.unlink()
+                    host_data_tb_name.unlink()
+                except Exception:
+                    self.logger.exception(
+                        "Error removing unpacked tar ball '%s' and it's .md5",
+                        host_data_tb_name,
+                    )
+        return total_bytes
+
+    def _receive_stream(
+        self, hostname: str, target_dir: Path, compression: Compression
+    ) -> int:
+        """Receive a chunked stream of compressed tar data, unpacking it as it
+        arrives, and verifying it against its "md5sum" trailer.
+
+        The data is unpacked into a private temporary directory, and only
+        moved into the target directory once the stream has been completely
+        received and verified.
+
+        Returns the number of bytes received, calls the Bottle abort() method
+        for error handling.
+        """
+        command = [self.tar_path, "--extract", "--file=-"]
+        if compression.program != "none":
+            command.append(f"--use-compress-program={compression.program}")
+        unpack_dir = Path(tempfile.mkdtemp(prefix=f".{hostname}.", dir=target_dir))
+        try:
+            o_file = target_dir / f"{hostname}.tar.out"
+            e_file = target_dir / f"{hostname}.tar.err"
+            reader = ChunkedReader(request["wsgi.input"], _MAX_TOOL_DATA_SIZE)
+            h = hashlib.md5()
+            with o_file.open("w") as ofp, e_file.open("w") as efp:
+                tar = subprocess.Popen(
+                    command,
+                    cwd=unpack_dir,
+                    stdin=subprocess.PIPE,
+                    stdout=ofp,
+                    stderr=efp,
+                )
+                try:
+                    for buf in reader:
+                        h.update(buf)
+                        tar.stdin.write(buf)
+                except BrokenPipeError:
+                    # tar exited early, which we'll report below
+                    pass
+                except ValueError as exc:
+                    abort(400, f"Invalid chunked data: {exc}")
+                finally:
+                    try:
+                        tar.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                    returncode = tar.wait()
+            exp_md5 = reader.trailers.get("md5sum")
+            if not exp_md5:
+                abort(400, "Missing required md5sum trailer")
+            cur_md5 = h.hexdigest()
+            if cur_md5 != exp_md5:
+                abort(
+                    400,
+                    f"Content, {cur_md5}, does not match its MD5SUM trailer,"
+                    f" {exp_md5}",
+                )
+            if reader.length <= 0:
+                abort(400, "No data received")
+            if returncode != 0:
+                self.logger.error(
+                    "Failed to extract tar stream; return code: %d", returncode
+                )
+                abort(500, "INTERNAL ERROR")
+            for entry in unpack_dir.iterdir():
+                entry.rename(target_dir / entry.name)
+            self.logger.debug(
+                "Successfully unpacked %d bytes from %s", reader.length, hostname
+            )
+            try:
+                o_file.unlink()
+                e_file.unlink()
+            except Exception:
+                self.logger.exception(
+                    "Error removing tar output files for '%s'", hostname
+                )
+        finally:
+            shutil.rmtree(unpack_dir, ignore_errors=True)
+        return reader.length
+
+    def _report_progress(self, hostname: str, length: int, elapsed: float):
+        """_report_progress - publish the transfer statistics for the data
+        received from a Tool Meister, along with how many of the Tool
+        Meisters have sent their data so far.
+
+        Assumes self._lock is already acquired by our caller.
+
+        The published message is a JSON document:
+
+          {
+            "kind": "ds",
+            "action": "<send|sysinfo>",
+            "hostname": "<host which sent the data>",
+            "bytes": <number of bytes received>,
+            "seconds": <time to receive and unpack the data>,
+            "throughput": <bytes per second>,
+            "received": <number of Tool Meisters which have sent their data>,
+            "expected": <number of Tool Meisters expected to send data>
+          }
+
+        Failures to publish are logged and otherwise ignored.
+        """
+        expected = [tm for tm in self._tm_tracking.values() if tm["posted"]]
+        received = sum(1 for tm in expected if tm["posted"] == "dormant")
+        throughput = length / elapsed if elapsed > 0 else 0.0
+        self.logger.info(
+            "Received %d bytes from %s in %.3f seconds (%.0f bytes/sec), %d of %d",
+            length,
+            hostname,
+            elapsed,
+            throughput,
+            received,
+            len(expected),
+        )
+        progress = dict(
+            kind="ds",
+            action=self.action,
+            hostname=hostname,
+            bytes=length,
+            seconds=round(elapsed, 3),
+            throughput=round(throughput),
+            received=received,
+            expected=len(expected),
+        )
+        try:
+            self.redis_server.publish(self._progress_channel, json.dumps(progress))
+        except Exception:
+            self.logger.exception("Failed to publish progress for %s", hostname)
+
     def put_document(self, data_ctx, hostname):
         """put_document - PUT callback method for Bottle web server end point
 
-        The put_document method is called by threads serving web requests.
-        There can be N threads configured at one time calling this method.
+        The put_document method is called by threads serving web requests,
+        one for each Tool Meister sending its data at the same time.
 
         Public method, returns None, raises no exceptions directly, calls the
         Bottle abort() method for error handling.
 
         """
         try:
-            content_length = 0
-            exp_md5 = ""
-
             with self._lock:
                 if self.action not in self._data_actions:
                     abort(400, f"Can't accept PUT requests in action '{self.action}'")
@@ -1740,136 +2091,20 @@ class ToolDataSink(Bottle):
                         if not tm_tracker["transient_tools"]:
                             abort(400, "Not expecting tool data from Tool Meister")
 
-            try:
-                content_length = int(request["CONTENT_LENGTH"])
-            except ValueError:
-                abort(400, "Invalid content-length header, not an integer")
-            except Exception:
-                abort(400, "Missing required content-length header")
-            else:
-                if content_length > _MAX_TOOL_DATA_SIZE:
-                    abort(400, "Content object too large")
-
-            try:
-                exp_md5 = request["HTTP_MD5SUM"]
-            except Exception:
-                self.logger.exception(request.keys())
-                abort(400, "Missing required md5sum header")
-
             target_dir = self.directory
             if not target_dir.is_dir():
                 self.logger.error("ERROR - directory, '%s', does not exist", target_dir)
                 abort(500, "INTERNAL ERROR")
-            host_data_tb_name = target_dir / f"{hostname}.tar.xz"
-            if host_data_tb_name.exists():
-                abort(409, f"{host_data_tb_name} already uploaded")
-            host_data_tb_md5 = Path(f"{host_data_tb_name}.md5")
-
-            with tempfile.NamedTemporaryFile(mode="wb", dir=target_dir) as ofp:
-                total_bytes = 0
-                iostr = request["wsgi.input"]
-                h = hashlib.md5()
-                remaining_bytes = content_length
-                while remaining_bytes > 0:
-                    buf = iostr.read(
-                        _BUFFER_SIZE
-                        if remaining_bytes > _BUFFER_SIZE
-                        else remaining_bytes
-                    )
-                    bytes_read = len(buf)
-                    total_bytes += bytes_read
-                    remaining_bytes -= bytes_read
-                    h.update(buf)
-                    ofp.write(buf)
-                cur_md5 = h.hexdigest()
-                if cur_md5 != exp_md5:
-                    abort(
-                        400,
-                        f"Content, {cur_md5}, does not match its MD5SUM header,"
-                        f" {exp_md5}",
-                    )
-                if total_bytes <= 0:
-                    abort(400, "No data received")
-
-                # First write the .md5
-                try:
-                    with host_data_tb_md5.open("w") as md5fp:
-                        md5fp.write(f"{exp_md5} {host_data_tb_name.name}\n")
-                except Exception:
-                    try:
-                        os.remove(host_data_tb_md5)
-                    except Exception as exc:
-                        self.logger.warning(
-                            "Failed to remove .md5 %s when trying to clean up: %s",
-                            host_data_tb_md5,
-                            exc,
-                        )
-                    self.logger.exception(
-                        "Failed to write .md5 file, '%s'", host_data_tb_md5
-                    )
-                    raise
-
-                # Then create the final filename link to the temporary file.
-                try:
-                    os.link(ofp.name, host_data_tb_name)
-                except Exception:
-                    try:
-                        os.remove(host_data_tb_md5)
-                    except Exception as exc:
-                        self.logger.warning(
-                            "Failed to remove .md5 %s when trying to clean up: %s",
-                            host_data_tb_md5,
-                            exc,
-                        )
-                    self.logger.exception(
-                        "Failed to rename tar ball '%s' to '%s'",
-                        ofp.name,
-                        host_data_tb_md5,
-                    )
-                    raise
-                else:
-                    self.logger.debug(
-                        "Successfully wrote %s (%s.md5)",
-                        host_data_tb_name,
-                        host_data_tb_name,
-                    )
-
-            # Now unpack that tar ball
-            o_file = target_dir / f"{hostname}.tar.out"
-            e_file = target_dir / f"{hostname}.tar.err"
             try:
-                # Invoke tar directly for efficiency.
-                with o_file.open("w") as ofp, e_file.open("w") as efp:
-                    cp = subprocess.run(
-                        [self.tar_path, "-xf", host_data_tb_name],
-                        cwd=target_dir,
-                        stdin=None,
-                        stdout=ofp,
-                        stderr=efp,
-                    )
-            except Exception:
-                self.logger.exception(
-                    "Failed to extract tar ball, '%s'", host_data_tb_name
-                )
-                abort(500, "INTERNAL ERROR")
+                compression = Compression.parse(request.get("HTTP_COMPRESSION", "xz"))
+            except ValueError as exc:
+                abort(400, f"Invalid compression header, {exc}")
+            start = time.perf_counter()
+            if request.get("HTTP_TRANSFER_ENCODING", "").lower() == "chunked":
+                length = self._receive_stream(hostname, target_dir, compression)
             else:
-                if cp.returncode != 0:
-                    self.logger.error(
-                        "Failed to create tar ball; return code: %d", cp.returncode
-                    )
-                    abort(500, "INTERNAL ERROR")
-                else:
-                    self.logger.debug("Successfully unpacked %s", host_data_tb_name)
-                    try:
-                        o_file.unlink()
-                        e_file.unlink()
-                        host_data_tb_md5.unlink()
-                        host_data_tb_name.unlink()
-                    except Exception:
-                        self.logger.exception(
-                            "Error removing unpacked tar ball '%s' and it's .md5",
-                            host_data_tb_name,
-                        )
+                length = self._receive_tarball(hostname, target_dir, compression)
+            elapsed = time.perf_counter() - start
 
             # Tell the waiting "watcher" thread that another PUT document has
             # arrived.
@@ -1877,6 +2112,7 @@ class ToolDataSink(Bottle):
                 tm_tracker = self._tm_tracking[hostname]
                 assert tm_tracker["posted"] == "waiting", f"tm_tracker = {tm_tracker!r}"
                 tm_tracker["posted"] = "dormant"
+                self._report_progress(hostname, length, elapsed)
                 self._cv.notify()
         except Exception:
             self.logger.exception("Uncaught error")
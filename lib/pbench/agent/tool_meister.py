@@ -35,6 +35,8 @@ and the redis key to fetch its configuration from for its operation.
 
 import errno
 import hashlib
+from http import HTTPStatus
+import http.client
 import io
 import json
 import logging
@@ -49,7 +51,7 @@ import sys
 import tempfile
 import threading
 import time
-from typing import Any, Dict, List, NamedTuple, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 from daemon import DaemonContext
 import pidfile
@@ -70,13 +72,16 @@ from pbench.agent.redis_utils import (
     wait_for_conn_and_key,
 )
 from pbench.agent.toolmetadata import ToolMetadata
-from pbench.agent.utils import collect_local_info
+from pbench.agent.utils import collect_local_info, Compression
 from pbench.common.utils import canonicalize, md5sum
 
 # Logging format string for unit tests
 fmtstr_ut = "%(levelname)s %(name)s %(funcName)s -- %(message)s"
 fmtstr = "%(asctime)s %(levelname)s %(process)s %(thread)s %(name)s %(funcName)s %(lineno)d -- %(message)s"
 
+# Size of the chunks of tool data streamed to the Tool Data Sink.
+_BUFFER_SIZE = 65536
+
 
 def log_raw_io_output(iob: io.IOBase, logger: logging.Logger):
     """Thread start function to log raw output from a given IOBase object."""
@@ -684,6 +689,8 @@ class ToolMeisterParams(NamedTuple):
     tool_metadata: ToolMetadata
     tools: Dict[str, str]
     instance_uuid: str
+    compression: str = "xz"
+    stream: bool = False
 
     def __str__(self) -> str:
         """A string containing a deterministic representation of the params"""
@@ -730,7 +737,13 @@ class ToolMeister:
                 "tool-1": [ "--opt-0", "--opt-1", ..., "--opt-N" ],
                 ...,
                 "tool-N": [ "--opt-0", "--opt-1", ..., "--opt-N" ]
-            }
+            },
+            "compression": "<optional compression used for tool data sent"
+                          " to the Tool Data Sink, '<program>[:<level>]',"
+                          " default 'xz'>",
+            "stream":     "<optional boolean, true to stream tool data to"
+                          " the Tool Data Sink as it is compressed rather than"
+                          " creating a local tar ball first>"
         }
 
     Each action message should contain three pieces of data: the action to
@@ -776,9 +789,13 @@ class ToolMeister:
                 tool_metadata=ToolMetadata.tool_md_from_dict(params["tool_metadata"]),
                 tools=params["tools"],
                 instance_uuid=params["instance_uuid"],
+                compression=str(Compression.parse(params.get("compression", "xz"))),
+                stream=bool(params.get("stream", False)),
             )
         except KeyError as exc:
             raise ToolMeisterError(f"Invalid parameter block, missing key {exc}")
+        except ValueError as exc:
+            raise ToolMeisterError(f"Invalid parameter block, {exc}")
 
     _valid_states = frozenset(["startup", "idle", "running", "shutdown"])
     _message_keys = frozenset(["action", "args", "directory", "group"])
@@ -820,6 +837,7 @@ class ToolMeister:
         self.tar_path = tar_path
         self.sysinfo_dump = sysinfo_dump
         self._params = tm_params
+        self._compression = Compression.parse(tm_params.compression)
         self._rs = redis_server
         self.logger = logger
         self._usable_tools = dict()
@@ -1350,14 +1368,18 @@ class ToolMeister:
                 stderr=subprocess.STDOUT,
             )
 
-        tar_args = [
-            self.tar_path,
-            "--create",
-            "--xz",
-            "--force-local",
-            f"--file={tar_file}",
-            directory.name,
-        ]
+        command = self._compression.command()
+        if self._compression == Compression("xz"):
+            compress_args = ["--xz"]
+        elif command:
+            compress_args = [f"--use-compress-program={shlex.join(command)}"]
+        else:
+            compress_args = []
+        tar_args = (
+            [self.tar_path, "--create"]
+            + compress_args
+            + ["--force-local", f"--file={tar_file}", directory.name]
+        )
 
         cp = tar(tar_args)
         if cp.returncode != 0:
@@ -1403,10 +1425,13 @@ class ToolMeister:
                 directory.name == self._params.hostname
             ), f"Expected directory target with <hostname>, '{directory}'"
 
+        if self._params.stream:
+            return self._stream_directory(directory, uri, ctx)
+
         failures = 0
         target_dir = directory.name
         parent_dir = directory.parent
-        tar_file = parent_dir / f"{target_dir}.tar.xz"
+        tar_file = parent_dir / f"{target_dir}.tar{self._compression.suffix}"
 
         try:
             if self._create_tar(directory, tar_file).returncode != 0:
@@ -1443,7 +1468,10 @@ class ToolMeister:
                     self._params.tool_group,
                     self._directory,
                 )
-                headers = {"md5sum": tar_md5}
+                headers = {
+                    "md5sum": tar_md5,
+                    "compression": self._compression.program,
+                }
                 url = (
                     f"http://{self._params.tds_hostname}:{self._params.tds_port}/{uri}"
                     f"/{ctx}/{self._params.hostname}"
@@ -1516,6 +1544,171 @@ class ToolMeister:
                 )
         return failures
 
+    def _put_stream(
+        self, directory: Path, host: str, port: int, path: str
+    ) -> Tuple[bool, Optional[int], str]:
+        """Stream a compressed tar of the given directory to the Tool Data
+        Sink in a single chunked PUT request.
+
+        The tar and compression commands run concurrently with the transfer,
+        and the MD5 of the compressed stream is sent as the "md5sum" trailer
+        of the request; the trailer is omitted if the tar stream couldn't be
+        created successfully, so that the Tool Data Sink rejects it.
+
+        Arguments:
+
+            directory:  a Path object for the directory to send
+            host:       the Tool Data Sink host
+            port:       the Tool Data Sink port
+            path:       the URL path of the PUT request
+
+        Returns a tuple of whether the tar stream was created successfully,
+        and the HTTP status and text of the response (None and the error if
+        the request failed).
+        """
+        retries = 200
+        while True:
+            conn = http.client.HTTPConnection(host, port)
+            try:
+                conn.connect()
+            except (ConnectionRefusedError, OSError) as exc:
+                self.logger.debug("%s", exc)
+                # Try until we get a connection.
+                conn.close()
+                time.sleep(0.1)
+                retries -= 1
+                if retries <= 0:
+                    raise
+            else:
+                break
+
+        errors = tempfile.TemporaryFile()
+        procs = []
+        try:
+            tar = subprocess.Popen(
+                [
+                    self.tar_path,
+                    "--create",
+                    "--force-local",
+                    "--file=-",
+                    directory.name,
+                ],
+                cwd=directory.parent,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=errors,
+            )
+            procs.append(tar)
+            data = tar.stdout
+            command = self._compression.command()
+            if command:
+                compressor = subprocess.Popen(
+                    command, stdin=tar.stdout, stdout=subprocess.PIPE, stderr=errors
+                )
+                procs.append(compressor)
+                # Only the compressor should hold the read end of the pipe
+                # from tar, so that tar sees if the compressor exits early.
+                tar.stdout.close()
+                data = compressor.stdout
+
+            hash_md5 = hashlib.md5()
+            try:
+                conn.putrequest("PUT", path)
+                conn.putheader("Transfer-Encoding", "chunked")
+                conn.putheader("Trailer", "md5sum")
+                conn.putheader("compression", self._compression.program)
+                conn.endheaders()
+                while True:
+                    chunk = data.read(_BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    hash_md5.update(chunk)
+                    conn.send(b"%x\r\n%b\r\n" % (len(chunk), chunk))
+                data.close()
+                returncodes = [proc.wait() for proc in procs]
+                # GNU tar exits with 1 if a file changed while being archived,
+                # but the archive is still complete.
+                created = returncodes[0] in (0, 1) and all(
+                    rc == 0 for rc in returncodes[1:]
+                )
+                if not created or returncodes[0] != 0:
+                    errors.seek(0)
+                    self.logger.warning(
+                        "Tar stream of %s exited with %s: '%s'",
+                        directory,
+                        returncodes,
+                        errors.read().decode("utf-8", errors="replace"),
+                    )
+                trailer = f"md5sum: {hash_md5.hexdigest()}\r\n" if created else ""
+                conn.send(f"0\r\n{trailer}\r\n".encode())
+            except OSError as exc:
+                # The Tool Data Sink may have rejected the request without
+                # reading it; if so, report its response.
+                self.logger.debug("%s", exc)
+                created = False
+            try:
+                response = conn.getresponse()
+                return created, response.status, response.read().decode()
+            except (http.client.HTTPException, OSError) as exc:
+                return created, None, str(exc)
+        finally:
+            for proc in procs:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+            errors.close()
+            conn.close()
+
+    def _stream_directory(self, directory: Path, uri: str, ctx: str) -> int:
+        """Stream a compressed tar of the given directory to the Tool Data
+        Sink via a PUT to the URL constructed from the "uri" fragment, using
+        the provided context, without creating a local tar ball.
+
+        If the tar stream can't be created, an empty tar is sent instead, as
+        _send_directory() does, so that the Tool Data Sink doesn't wait
+        forever.
+
+        Returns 0 on success, # of failures otherwise.
+        """
+        failures = 0
+        host = self._params.tds_hostname
+        port = int(self._params.tds_port)
+        path = f"/{uri}/{ctx}/{self._params.hostname}"
+        url = f"http://{host}:{port}{path}"
+        self.logger.debug(
+            "%s: starting stream send_data group=%s, directory=%s",
+            self._params.hostname,
+            self._params.tool_group,
+            self._directory,
+        )
+        created, status, text = self._put_stream(directory, host, port, path)
+        if not created and status != HTTPStatus.OK:
+            created, status, text = self._put_stream(
+                Path("/dev/null"), host, port, path
+            )
+            if not created:
+                raise ToolMeisterError(f"Failed to stream an empty tar for {url}")
+        if status != HTTPStatus.OK:
+            self.logger.error("PUT '%s' failed with '%s', '%s'", url, status, text)
+            failures += 1
+        else:
+            self.logger.debug("PUT '%s' succeeded ('%d', '%s')", url, status, text)
+            try:
+                shutil.rmtree(directory.parent)
+            except Exception:
+                self.logger.exception(
+                    "Failed to remove tool data hierarchy, '%s'", directory.parent
+                )
+                failures += 1
+        self.logger.info(
+            "%s: PUT %s completed %s %s",
+            self._params.hostname,
+            uri,
+            self._params.tool_group,
+            directory,
+        )
+        return failures
+
     def send_tools(self, data: Dict[str, str]) -> int:
         """Send any collected tool data to the Tool Data Sink.
 
@@ -100,6 +100,13 @@ There are also optional environment variables to affect the network operation
 of the Pbench Tool Meister servers and clients:
 
   - ssh-opts
+  - PBENCH_SSH_CONCURRENCY maximum number of concurrent ssh sessions
+  - PBENCH_TOOL_DATA_COMPRESSION compression of tool data sent by remote
+    Tool Meisters, "<program>[:<level>]" where the program is one of "xz"
+    (the default), "zstd", "lz4", "gzip", or "none"
+  - PBENCH_TOOL_DATA_STREAM set to "1" to have remote Tool Meisters stream
+    their tool data to the Tool Data Sink, rather than first creating a local
+    tar ball
   - PBENCH_TOOL_DATA_SINK connection information for TDS
   - PBENCH_REDIS_SERVER connection information for Redis
 
@@ -134,8 +141,9 @@ import shlex
 import shutil
 import socket
 import sys
+import tempfile
 import time
-from typing import Dict, Union
+from typing import Dict, Optional, Union
 import uuid
 
 import redis
@@ -158,6 +166,7 @@ from pbench.agent.utils import (
     BaseReturnCode,
     BaseServer,
     cli_verify_sysinfo,
+    Compression,
     error_log,
     info_log,
     LocalRemoteHost,
@@ -179,6 +188,10 @@ assert _def_orchestrate_choice in _orchestrate_choices, (
 # logging sink channel.
 _TDS_STARTUP_TIMEOUT = 60
 
+# The default maximum number of concurrent ssh sessions used to reach the
+# remote hosts.
+_DEF_SSH_CONCURRENCY = 64
+
 
 class ReturnCode(BaseReturnCode):
     """ReturnCode - symbolic return codes for the main program of
@@ -229,6 +242,8 @@ class ReturnCode(BaseReturnCode):
     INVALIDTMDATA = 42
     TOOLINSTALLFAILURES = 43
     EXCCREATEUUID = 44
+    BADSSHCONCURRENCY = 45
+    BADCOMPRESSION = 46
 
 
 class CleanupTime(Exception):
@@ -285,10 +300,16 @@ def start_tms_via_ssh(
     redis_server: RedisServerCommon,
     instance_uuid: str,
     logger: logging.Logger,
+    control_dir: Optional[Path] = None,
+    max_sessions: Optional[int] = None,
 ) -> None:
     """Orchestrate the creation of local and remote Tool Meister instances using
     ssh for those that are remote.
 
+    The optional control directory and maximum number of sessions are passed
+    to the TemplateSsh object used to reach the remote hosts, allowing it to
+    reuse the multiplexed connections established while probing them.
+
     Raises a StartTmsErr on failure.
 
     NOTE: all local and remote Tool Meisters are started even if failures
@@ -304,7 +325,13 @@ def start_tms_via_ssh(
     cmd = f"{tool_meister_cmd} {redis_server.host} {redis_server.port} {{tm_param_key}} {instance_uuid} yes"
     if debug_level:
         cmd += f" {debug_level}"
-    template = TemplateSsh(ssh_cmd, shlex.split(ssh_opts), cmd)
+    template = TemplateSsh(
+        ssh_cmd,
+        shlex.split(ssh_opts),
+        cmd,
+        control_dir=control_dir,
+        max_sessions=max_sessions,
+    )
     tms: Dict[str, Union[str, int, Dict[str, str]]] = {}
     tm_count = 0
     for host in tool_group.hostnames.keys():
@@ -382,6 +409,11 @@ def start_tms_via_ssh(
                     successes += 1
         elif tm_proc["status"] == "spawned":
             status = template.wait(host)
+            logger.debug(
+                "remote tool meister on %s completed in %.3f seconds",
+                host,
+                status.elapsed,
+            )
             if status.status != 0:
                 failures += 1
                 logger.error(
@@ -750,7 +782,7 @@ def terminate_no_wait(
 def start(_prog: str, cli_params: Namespace) -> int:
     """Main program for tool meister start.
 
-    :cli_params: expects a CLI parameters object which has five attributes:
+    :cli_params: expects a CLI parameters object which has eight attributes:
 
         * orchestrate    - Keyword value of either "create" or "existing" to
                            indicate if tool meister start should create the
@@ -764,6 +796,12 @@ def start(_prog: str, cli_params: Namespace) -> int:
                            use to connect to an existing instance
         * sysinfo        - The system information set to be collected during the
                            start sequence
+        * ssh_concurrency - The maximum number of concurrent ssh sessions
+                           used to reach the remote hosts
+        * compression    - The compression of tool data sent by remote Tool
+                           Meisters, "<program>[:<level>]"
+        * stream         - Whether remote Tool Meisters stream their tool data
+                           to the Tool Data Sink
         * tool_data_sink - The IP/port specification of the Tool Data Sink;
                            follows the same pattern as 'redis_server'
         * tool_group     - The tool group from which to load the registered tools
@@ -785,6 +823,7 @@ def start(_prog: str, cli_params: Namespace) -> int:
     logger.addHandler(sh)
     tm_dir = None
     ssh_cmd = None
+    control_dir = None
 
     # +
     # Step 1. - Load the tool group data for the requested tool group
@@ -917,6 +956,15 @@ def start(_prog: str, cli_params: Namespace) -> int:
 
     # See if anybody told us to use certain options with SSH commands.
     ssh_opts = os.environ.get("ssh_opts", "")
+    ssh_concurrency = cli_params.ssh_concurrency
+    if ssh_concurrency < 1:
+        logger.error("invalid --ssh-concurrency, %d, must be >= 1", ssh_concurrency)
+        return ReturnCode.BADSSHCONCURRENCY
+    try:
+        compression = Compression.parse(cli_params.compression)
+    except ValueError as exc:
+        logger.error("invalid --compression, %s", exc)
+        return ReturnCode.BADCOMPRESSION
 
     # Load optional metadata environment variables
     optional_md = dict(
@@ -945,14 +993,42 @@ def start(_prog: str, cli_params: Namespace) -> int:
             #
             # If we can connect, they'll tell us the IP address from which they see
             # us connecting, and we'll use that (by default) as the server address.
+            #
+            # The ssh connections are multiplexed through a master connection
+            # to each remote, which persists briefly so that starting the Tool
+            # Meisters below doesn't need to repeat the ssh handshake. The
+            # control sockets live in a private directory with a short name,
+            # since socket paths are limited in length.
+            try:
+                control_dir = Path(tempfile.mkdtemp(prefix="pbt."))
+            except Exception as exc:
+                logger.warning(
+                    "unable to create ssh control directory, not multiplexing"
+                    " ssh connections: %s",
+                    exc,
+                )
+            else:
+                if not TemplateSsh.control_path(control_dir):
+                    logger.warning(
+                        "ssh control directory '%s' path is too long, not"
+                        " multiplexing ssh connections",
+                        control_dir,
+                    )
+                    control_dir.rmdir()
+                    control_dir = None
             localhost = LocalRemoteHost()
             origin_ip = set()
             any_remote = False
             template = TemplateSsh(
-                ssh_cmd, shlex.split(ssh_opts), "echo ${SSH_CONNECTION}"
+                ssh_cmd,
+                shlex.split(ssh_opts),
+                "echo ${SSH_CONNECTION}",
+                control_dir=control_dir,
+                max_sessions=ssh_concurrency,
             )
             recovery.add(template.abort, "stop TM clients")
 
+            probe_start = time.monotonic()
             for host in tool_group.hostnames.keys():
                 if not localhost.is_local(host):
                     any_remote = True
@@ -983,6 +1059,11 @@ def start(_prog: str, cli_params: Namespace) -> int:
                             ReturnCode.REMOTENOTREACHABLE,
                             f"Host {host} reports {connection}",
                         )
+            if any_remote:
+                logger.debug(
+                    "reached remote hosts in %.3f seconds",
+                    time.monotonic() - probe_start,
+                )
 
             # Process the collected origin addresses from our remotes. Ideally we
             # have only a single entry here, since the current BaseServer init
@@ -1116,6 +1197,8 @@ def start(_prog: str, cli_params: Namespace) -> int:
                 tool_metadata=tool_metadata.getFullData(),
                 tools=tools,
                 instance_uuid=instance_uuid,
+                compression=str(compression),
+                stream=cli_params.stream,
             )
             # Create a separate key for the Tool Meister that will be on that host
             tm_param_key = f"tm-{tool_group.name}-{host}"
@@ -1209,6 +1292,8 @@ def start(_prog: str, cli_params: Namespace) -> int:
                     redis_server,
                     instance_uuid,
                     logger,
+                    control_dir=control_dir,
+                    max_sessions=ssh_concurrency,
                 )
             except StartTmsErr as exc:
                 raise CleanupTime(
@@ -1332,6 +1417,11 @@ def start(_prog: str, cli_params: Namespace) -> int:
         logger.exception("Unexpected exception in outer try")
         recovery.cleanup()
         return ReturnCode.INITFAILED
+    finally:
+        # Any multiplexed master connections remaining will exit on their own
+        # once idle, so we only need to remove their control directory.
+        if control_dir:
+            shutil.rmtree(control_dir, ignore_errors=True)
 
 
 _NAME_ = "pbench-tool-meister-start"
@@ -1393,6 +1483,43 @@ def main():
             " The binding is not used with --orchestrate=existing."
         ),
     )
+    parser.add_argument(
+        "--ssh-concurrency",
+        dest="ssh_concurrency",
+        type=int,
+        default=os.environ.get("PBENCH_SSH_CONCURRENCY", _DEF_SSH_CONCURRENCY),
+        help=(
+            "The maximum number of concurrent ssh sessions used to reach the"
+            " remote hosts of the tool group. If not present (and if not"
+            " supplied via the PBENCH_SSH_CONCURRENCY environment variable),"
+            f" the default is {_DEF_SSH_CONCURRENCY}."
+        ),
+    )
+    parser.add_argument(
+        "--compression",
+        dest="compression",
+        default=os.environ.get("PBENCH_TOOL_DATA_COMPRESSION", "xz"),
+        help=(
+            "The compression of tool data sent by remote Tool Meisters to the"
+            " Tool Data Sink, in the form `<program>[:<level>]`, where the"
+            " program is one of `xz`, `zstd`, `lz4`, `gzip`, or `none`; e.g.,"
+            " `zstd:3` for fast compression of large tool data. If not present"
+            " (and if not supplied via the PBENCH_TOOL_DATA_COMPRESSION"
+            " environment variable), the default is `xz`."
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        dest="stream",
+        action="store_true",
+        default=os.environ.get("PBENCH_TOOL_DATA_STREAM") == "1",
+        help=(
+            "Remote Tool Meisters stream their compressed tool data to the"
+            " Tool Data Sink, which unpacks it as it arrives, rather than"
+            " first creating a local tar ball. This can also be selected by"
+            " setting the PBENCH_TOOL_DATA_STREAM environment variable to 1."
+        ),
+    )
     parser.add_argument(
         "tool_group",
         help="The tool group name of tools to be run by the Tool Meisters.",
@@ -2,12 +2,13 @@ from datetime import datetime
 import ipaddress
 import logging
 import os
+from pathlib import Path
 import signal
 import socket
 import subprocess
 import sys
 import time
-from typing import Any, Dict, List, NamedTuple, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 import ifaddr
 
@@ -385,18 +386,119 @@ def collect_local_info(pbench_bin):
     return version, seqno, sha1, hostdata
 
 
+class Compression(NamedTuple):
+    """A compression method for tool data sent to the Tool Data Sink, parsed
+    from a "<program>[:<level>]" specification such as "xz", "zstd:3", or
+    "none".
+    """
+
+    program: str
+    level: Optional[int] = None
+
+    # The supported compression programs, with their file suffix, range of
+    # compression levels, and any additional arguments used to compress.
+    PROGRAMS = {
+        "none": ("", None, []),
+        "gzip": (".gz", (1, 9), []),
+        "lz4": (".lz4", (1, 12), ["-q"]),
+        "xz": (".xz", (0, 9), []),
+        "zstd": (".zst", (1, 19), ["-q", "-T0"]),
+    }
+
+    @classmethod
+    def parse(cls, spec: str) -> "Compression":
+        """Parse a compression specification
+
+        Args:
+            spec: A "<program>[:<level>]" string
+
+        Raises:
+            ValueError if the program or level is not supported
+
+        Returns:
+            A Compression object
+        """
+        program, _, level = spec.partition(":")
+        try:
+            _, levels, _ = cls.PROGRAMS[program]
+        except KeyError:
+            raise ValueError(
+                f"unsupported compression program {program!r}, expected one of"
+                f" {', '.join(sorted(cls.PROGRAMS))}"
+            )
+        if not level:
+            return cls(program)
+        try:
+            value = int(level)
+        except ValueError:
+            value = None
+        if not levels or value is None or not levels[0] <= value <= levels[1]:
+            raise ValueError(f"unsupported {program} compression level {level!r}")
+        return cls(program, value)
+
+    def __str__(self) -> str:
+        return self.program if self.level is None else f"{self.program}:{self.level}"
+
+    @property
+    def suffix(self) -> str:
+        """The file suffix of a tar ball compressed by this method"""
+        return self.PROGRAMS[self.program][0]
+
+    def command(self) -> Optional[List[str]]:
+        """The command to compress standard input to standard output, or None
+        if no compression is to be performed.
+        """
+        if self.program == "none":
+            return None
+        args = [self.program, "-c"] + self.PROGRAMS[self.program][2]
+        if self.level is not None:
+            args.append(f"-{self.level}")
+        return args
+
+
 class TemplateSsh:
     """
     Set up to easily launch repeated asynchronous ssh commands from a template
     and acquire the stdout and stderr streams along with the completion status.
+
+    If a control directory is given, the ssh commands share a multiplexed
+    master connection to each remote host (see the ssh_config "ControlMaster"
+    option), so that successive commands on the same host, from this or any
+    other template using the same control directory, avoid repeating the ssh
+    connection handshake.
+
+    If a maximum number of sessions is given, starting a command when that
+    many are running first waits for the oldest to complete.
     """
 
+    # How long, in seconds, an idle multiplexed master connection persists
+    # after its last session completes.
+    CONTROL_PERSIST = 30
+
+    # The control socket name within the control directory: ssh expands "%C"
+    # to a hash of the connection parameters, 40 hexadecimal digits long.
+    CONTROL_NAME = ("%C", 40)
+
+    # A master connection binds its control socket at the ControlPath with a
+    # "." and 16 random characters appended, and the whole path must fit in
+    # a Unix domain socket address of 108 bytes, including a trailing NUL.
+    SOCKET_PATH_MAX = 108
+    SOCKET_PATH_SUFFIX = 17
+
     class Return(NamedTuple):
         status: int
         stdout: str
         stderr: str
-
-    def __init__(self, ssh_cmd: str, ssh_args: List[str], cmd: str):
+        elapsed: float = 0.0
+
+    def __init__(
+        self,
+        ssh_cmd: str,
+        ssh_args: List[str],
+        cmd: str,
+        control_dir: Optional[Path] = None,
+        max_sessions: Optional[int] = None,
+    ):
         """
         Create an SSH template object
 
@@ -404,10 +506,50 @@ class TemplateSsh:
             ssh_cmd: file path of the ssh command
             ssh_args: A partial argv representing ssh command options
             cmd: A templated string representing a remote command to be executed
+            control_dir: An optional directory for multiplexed connection
+                control sockets, ignored if its path is too long (see
+                control_path())
+            max_sessions: An optional limit on the number of concurrent ssh
+                commands
         """
         self.command = cmd
         self.procs: Dict[str, subprocess.Popen] = {}
+        self.started: Dict[str, float] = {}
+        self.done: Dict[str, TemplateSsh.Return] = {}
+        self.max_sessions = max_sessions
+        # Note that ssh uses the first value given for an option, so the
+        # caller's ssh arguments can override (e.g., disable) multiplexing.
         self.base_args = [ssh_cmd] + ssh_args
+        control_path = self.control_path(control_dir) if control_dir else None
+        if control_path:
+            self.base_args += [
+                "-o",
+                "ControlMaster=auto",
+                "-o",
+                f"ControlPath={control_path}",
+                "-o",
+                f"ControlPersist={self.CONTROL_PERSIST}",
+            ]
+
+    @classmethod
+    def control_path(cls, control_dir: Path) -> Optional[str]:
+        """
+        Construct the ssh ControlPath for control sockets in a directory
+
+        Args:
+            control_dir: The directory for the control sockets
+
+        Returns:
+            The ControlPath, or None if ssh could not bind a control socket
+            there because the path would be too long
+        """
+        name, length = cls.CONTROL_NAME
+        if (
+            len(str(control_dir)) + 1 + length + cls.SOCKET_PATH_SUFFIX
+            >= cls.SOCKET_PATH_MAX
+        ):
+            return None
+        return f"{control_dir}/{name}"
 
     def start(self, host: str, **kwargs):
         """
@@ -417,8 +559,13 @@ class TemplateSsh:
             host: hostname or IP
             kwargs: key/value pairs to expand cmd template
         """
+        if self.max_sessions:
+            while len(self.procs) >= self.max_sessions:
+                oldest = next(iter(self.procs))
+                self.done[oldest] = self._complete(oldest)
         cmd = self.command.format(**kwargs) if kwargs else self.command
         args = self.base_args + [host, cmd]
+        self.started[host] = time.monotonic()
         popen = subprocess.Popen(args, stdout=subprocess.PIPE, universal_newlines=True)
         self.procs[host] = popen
 
@@ -434,26 +581,42 @@ class TemplateSsh:
             except subprocess.TimeoutExpired:
                 pass
 
-    def wait(self, host: str) -> Return:
+    def _complete(self, host: str) -> Return:
         """
-        Wait for an asynchronous ssh command to complete, returning the
-        completion status, stdout and stderr streams as strings.
+        Wait for an asynchronous ssh command to complete
 
         Args:
             host: Remote host
 
         Returns:
-            Tuple of completion status, stdout, stderr
+            Tuple of completion status, stdout, stderr, and elapsed seconds
         """
-        popen: subprocess.Popen = self.procs[host]
+        popen: subprocess.Popen = self.procs.pop(host)
         try:
             out, err = popen.communicate(timeout=10)
         except subprocess.TimeoutExpired:
             popen.kill()
             out, err = popen.communicate()
-        status = popen.returncode
-        del self.procs[host]
-        return self.Return(status=status, stdout=out, stderr=err)
+        elapsed = time.monotonic() - self.started.pop(host)
+        return self.Return(
+            status=popen.returncode, stdout=out, stderr=err, elapsed=elapsed
+        )
+
+    def wait(self, host: str) -> Return:
+        """
+        Wait for an asynchronous ssh command to complete, returning the
+        completion status, stdout and stderr streams as strings, and the
+        elapsed time of the command in seconds.
+
+        Args:
+            host: Remote host
+
+        Returns:
+            Tuple of completion status, stdout, stderr, elapsed
+        """
+        if host in self.done:
+            return self.done.pop(host)
+        return self._complete(host)
 
 
 class LocalRemoteHost:
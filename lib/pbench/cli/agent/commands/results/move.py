@@ -1,8 +1,11 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
+from pathlib import Path
 import shutil
 import socket
 import tempfile
-from typing import List
+from typing import Deque, List, Tuple
 
 import click
 
@@ -31,15 +34,140 @@ class MoveResults(BaseCommand):
     def __init__(self, context: CliContext):
         super().__init__(context)
 
-    def execute(self, single_threaded: bool, delete: bool = True) -> int:
+    def execute(self, single_threaded: bool, delete: bool = True, jobs: int = 1) -> int:
+        """Move (or copy) each result directory to the Pbench Server.
+
+        Tar balls are made by a pool of `jobs` worker threads, while the main
+        thread uploads the finished tar balls one at a time, in order. This
+        overlaps the compression of the following result directories with the
+        upload of the current one, while holding at most `jobs + 1` tar balls
+        in the temporary directory.
+
+        Args:
+            single_threaded: use single threaded 'xz' compression
+            delete: remove each result directory once it has been copied
+            jobs: the number of result directories to compress concurrently
+
+        Returns:
+            0 if all result directories were moved, 1 otherwise
+        """
         runs_copied = 0
         failures = 0
         no_of_tb = 0
         crt = CopyResult.cli_create(self.context, self.config, self.logger)
+        pending: Deque[Tuple[Path, Future]] = deque()
+
+        def finish(result_dir: Path, tarball: Future) -> bool:
+            """Upload a result tar ball once it is made, and mark or remove
+            its result directory.
+
+            Returns:
+                True if no further result directories should be processed
+            """
+            nonlocal runs_copied, failures
+
+            try:
+                result_tb_name, _, result_tb_md5 = tarball.result()
+            except BadMDLogFormat as exc:
+                self.logger.warning(str(exc))
+                failures += 1
+                return False
+            except FileNotFoundError as exc:
+                self.logger.error(str(exc))
+                failures += 1
+                return False
+            except RuntimeError as exc:
+                self.logger.warning("Error encountered making tar ball, '%s'", exc)
+                failures += 1
+                return False
+            except Exception as exc:
+                self.logger.error(
+                    "Unexpected error occurred making tar ball for '%s', '%s'",
+                    result_dir,
+                    exc,
+                )
+                failures += 1
+                return False
+
+            try:
+                res = crt.push(result_tb_name, result_tb_md5)
+                if not res.ok:
+                    try:
+                        msg = res.json()["message"]
+                    except Exception:
+                        msg = res.text if res.text else res.reason
+                    raise CopyResult.FileUploadError(msg)
+                if self.context.relay:
+                    if self.context.brief:
+                        click.echo(res.url)
+                    else:
+                        click.echo(f"RELAY {result_tb_name.name}: {res.url}")
+            except Exception as exc:
+                if isinstance(exc, (CopyResult.FileUploadError, RuntimeError)):
+                    msg = "Error uploading file"
+                else:
+                    msg = "Unexpected error occurred copying tar ball remotely"
+                self.logger.error("%s, '%s', %s", msg, result_tb_name, exc)
+                failures += 1
+                # We don't know why this operation failed; regardless,
+                # trying to copy another tar ball remotely does not have
+                # much chance of success.
+                return True
+            else:
+                runs_copied += 1
+            finally:
+                try:
+                    # We always remove the constructed tar ball, regardless of success
+                    # or failure, since we keep the result directory below on failure.
+                    os.remove(result_tb_name)
+                except OSError as exc:
+                    self.logger.error(
+                        "Failed to remove '%s', '%s'", result_tb_name, exc
+                    )
 
+            if delete:
+                try:
+                    shutil.rmtree(result_dir)
+                except OSError:
+                    self.logger.error(
+                        "Failed to remove the %s directory hierarchy", result_dir
+                    )
+                    failures += 1
+                    # If we can't hold up the contract of removing the
+                    # local directory tree that was copied, we exit the
+                    # loop that is processing result directories.  Not
+                    # being able to remove the local directory tree will
+                    # usually indicate a serious problem that needs to be
+                    # resolved before doing anything else.
+                    return True
+            else:
+                copied = result_dir.parent / f"{result_dir.name}.copied"
+                try:
+                    copied.touch()
+                except OSError as exc:
+                    self.logger.error(
+                        "Failed to create '.copied' file marker for '%s', '%s'",
+                        result_dir,
+                        exc,
+                    )
+                    failures += 1
+                    # If we can't hold up the contract of marking a
+                    # directory as copied remotely, we exit the loop that
+                    # is processing result directories.  If we can't
+                    # create an empty file on the file system where the
+                    # result directory lives, it likely indicates bigger
+                    # problems.
+                    return True
+            return False
+
+        # NOTE: the pool is shut down, waiting for any tar balls still being
+        # made, before the temporary directory is removed.
         with tempfile.TemporaryDirectory(
             dir=self.config.pbench_tmp, prefix="pbench-results-move."
-        ) as temp_dir:
+        ) as temp_dir, ThreadPoolExecutor(
+            max_workers=jobs, thread_name_prefix="pbench-results-move"
+        ) as pool:
+            stop = False
             for dirent in self.config.pbench_run.iterdir():
                 if not dirent.is_dir():
                     continue
@@ -72,101 +200,29 @@ class MoveResults(BaseCommand):
                     failures += 1
                     continue
 
-                try:
-                    result_tb_name, _, result_tb_md5 = mrt.make_result_tb(
-                        single_threaded=single_threaded
-                    )
-                except BadMDLogFormat as exc:
-                    self.logger.warning(str(exc))
-                    failures += 1
-                    continue
-                except FileNotFoundError as exc:
-                    self.logger.error(str(exc))
-                    failures += 1
-                    continue
-                except RuntimeError as exc:
-                    self.logger.warning("Error encountered making tar ball, '%s'", exc)
-                    failures += 1
-                    continue
-                except Exception as exc:
-                    self.logger.error(
-                        "Unexpected error occurred making tar ball for '%s', '%s'",
+                pending.append(
+                    (
                         result_dir,
-                        exc,
+                        pool.submit(
+                            mrt.make_result_tb, single_threaded=single_threaded
+                        ),
                     )
-                    failures += 1
-                    continue
-
-                try:
-                    res = crt.push(result_tb_name, result_tb_md5)
-                    if not res.ok:
-                        try:
-                            msg = res.json()["message"]
-                        except Exception:
-                            msg = res.text if res.text else res.reason
-                        raise CopyResult.FileUploadError(msg)
-                    if self.context.relay:
-                        if self.context.brief:
-                            click.echo(res.url)
-                        else:
-                            click.echo(f"RELAY {result_tb_name.name}: {res.url}")
-                except Exception as exc:
-                    if isinstance(exc, (CopyResult.FileUploadError, RuntimeError)):
-                        msg = "Error uploading file"
-                    else:
-                        msg = "Unexpected error occurred copying tar ball remotely"
-                    self.logger.error("%s, '%s', %s", msg, result_tb_name, exc)
-                    failures += 1
-                    # We don't know why this operation failed; regardless,
-                    # trying to copy another tar ball remotely does not have
-                    # much chance of success.
-                    break
-                else:
-                    runs_copied += 1
-                finally:
-                    try:
-                        # We always remove the constructed tar ball, regardless of success
-                        # or failure, since we keep the result directory below on failure.
-                        os.remove(result_tb_name)
-                    except OSError as exc:
-                        self.logger.error(
-                            "Failed to remove '%s', '%s'", result_tb_name, exc
-                        )
-
-                if delete:
-                    try:
-                        shutil.rmtree(result_dir)
-                    except OSError:
-                        self.logger.error(
-                            "Failed to remove the %s directory hierarchy", result_dir
-                        )
-                        failures += 1
-                        # If we can't hold up the contract of removing the
-                        # local directory tree that was copied, we exit the
-                        # loop that is processing result directories.  Not
-                        # being able to remove the local directory tree will
-                        # usually indicate a serious problem that needs to be
-                        # resolved before doing anything else.
-                        break
-                else:
-                    copied = result_dir.parent / f"{result_dir.name}.copied"
-                    try:
-                        copied.touch()
-                    except OSError as exc:
-                        self.logger.error(
-                            "Failed to create '.copied' file marker for '%s', '%s'",
-                            result_dir,
-                            exc,
-                        )
-                        failures += 1
-                        # If we can't hold up the contract of marking a
-                        # directory as copied remotely, we exit the loop that
-                        # is processing result directories.  If we can't
-                        # create an empty file on the file system where the
-                        # result directory lives, it likely indicates bigger
-                        # problems.
+                )
+                if len(pending) > jobs:
+                    stop = finish(*pending.popleft())
+                    if stop:
                         break
 
+            while pending and not stop:
+                stop = finish(*pending.popleft())
+
+            # Any result directories still pending after an error which stops
+            # the move are not considered further; their tar balls, if made,
+            # are removed with the temporary directory.
+            for _, tarball in pending:
+                tarball.cancel()
+            no_of_tb -= len(pending)
+
         if not self.context.brief:
             action = "moved" if delete else "copied"
             click.echo(
@@ -196,6 +252,13 @@ class MoveResults(BaseCommand):
     show_default=True,
     help="Remove local data after successful copy",
 )
+@click.option(
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of result directories to compress while uploading",
+)
 @click.option(
     "--xz-single-threaded",
     is_flag=True,
@@ -209,6 +272,7 @@ def main(
     access: str,
     token: str,
     delete: bool,
+    jobs: int,
     metadata: List,
     xz_single_threaded: bool,
     server: str,
@@ -249,7 +313,7 @@ def main(
     context.relay = relay
 
     try:
-        rv = MoveResults(context).execute(xz_single_threaded, delete=delete)
+        rv = MoveResults(context).execute(xz_single_threaded, delete=delete, jobs=jobs)
     except Exception as exc:
         click.echo(exc, err=True)
         rv = 1
@@ -39,6 +39,7 @@ from pbench.server.api.resources.relay import Relay
 from pbench.server.api.resources.server_audit import ServerAudit
 from pbench.server.api.resources.server_settings import ServerSettings
 from pbench.server.api.resources.upload import Upload
+from pbench.server.api.resources.upload_session import UploadSession
 import pbench.server.auth.auth as Auth
 from pbench.server.database import init_db
 from pbench.server.database.database import Database
@@ -173,6 +174,13 @@ def register_endpoints(api: Api, app: Flask, config: PbenchServerConfig):
         endpoint="upload",
         resource_class_args=(config,),
     )
+    api.add_resource(
+        UploadSession,
+        f"{base_uri}/upload/session",
+        f"{base_uri}/upload/session/<string:session>",
+        endpoint="upload_session",
+        resource_class_args=(config,),
+    )
 
 
 def get_server_config() -> PbenchServerConfig:
@@ -232,6 +240,13 @@ def create_app(server_config: PbenchServerConfig) -> Flask:
 
     app.teardown_appcontext(shutdown_session)
 
+    # Each server worker runs this as it starts, so that dataset operations
+    # left behind by a worker that has since exited are recovered.
+    try:
+        Datasets(server_config).abandon_tasks(app)
+    except Exception:
+        app.logger.exception("Unable to recover abandoned Elasticsearch tasks")
+
     class InsufficientStorage(werkzeug.exceptions.HTTPException):
         code = HTTPStatus.INSUFFICIENT_STORAGE.value
         description = HTTPStatus.INSUFFICIENT_STORAGE.phrase
@@ -1809,6 +1809,35 @@ class ApiBase(Resource):
 
         return metadata
 
+    @staticmethod
+    def _get_datasets_metadata(
+        datasets: list[Dataset], requested_items: list[str]
+    ) -> dict[int, JSON]:
+        """Get requested metadata for a list of Datasets
+
+        This is equivalent to calling `_get_dataset_metadata` for each of the
+        datasets, but collects the metadata of all the datasets together with
+        a constant number of SQL queries.
+
+        Args:
+            datasets : List of Dataset objects
+            requested_items : List of metadata key names
+
+        Raises:
+            MetadataError : SQL error in retrieval
+
+        Returns:
+            A dict mapping each dataset's row ID to a JSON object (Python dict)
+            containing a key-value pair for each requested metadata key.
+        """
+        if not requested_items:
+            return {d.id: {} for d in datasets}
+
+        user: Optional[User] = None
+        if any(Metadata.get_native_key(i) == Metadata.USER for i in requested_items):
+            user = Auth.token_auth.current_user()
+        return Metadata.getvalues(datasets, requested_items, user)
+
     @staticmethod
     def _set_dataset_metadata(
         dataset: Dataset, metadata: dict[str, JSONVALUE]
@@ -164,6 +164,7 @@ class APIKeyManage(ApiBase):
         try:
             context["auditing"]["attributes"] = key.as_json()
             key.delete()
+            Auth.token_cache.invalidate(key.key)
             return "deleted", HTTPStatus.OK
         except Exception as e:
             raise APIInternalError(str(e)) from e
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 from urllib.request import Request
 
@@ -21,6 +22,7 @@ from pbench.server.api.resources import (
     Schema,
 )
 from pbench.server.cache_manager import CacheManager, CacheManagerError
+from pbench.server.database.database import Database
 from pbench.server.database.models.datasets import Dataset, Metadata
 
 
@@ -58,6 +60,25 @@ class DatasetsCompare(ApiBase):
                 benchmark = Metadata.SERVER_BENCHMARK_UNKNOWN
         return benchmark
 
+    @staticmethod
+    def get_result_csv(cache_m: CacheManager, dataset_id: str) -> str:
+        """Extract a dataset's result.csv file in a worker thread
+
+        Each worker thread has its own database session, which we close when
+        we're done so that the connection goes back to the pool.
+
+        Args:
+            cache_m: the cache manager
+            dataset_id: the dataset resource ID
+
+        Returns:
+            The contents of the result.csv file
+        """
+        try:
+            return cache_m.get_inventory_bytes(dataset_id, "result.csv")
+        finally:
+            Database.db_session.remove()
+
     def __init__(self, config: PbenchServerConfig):
         super().__init__(
             config,
@@ -125,21 +146,47 @@ class DatasetsCompare(ApiBase):
                 HTTPStatus.BAD_REQUEST, f"Unsupported Benchmark: {benchmark}"
             )
 
-        cache_m = CacheManager(self.config, current_app.logger)
+        # Extracting result.csv may require unpacking each dataset tarball, so
+        # fetch them concurrently (with a bounded number of threads) rather
+        # than one after another. Datasets that are already unpacked in the
+        # cache are read directly.
+        cache_m = CacheManager.shared(self.config, current_app.logger)
+        workers = self.config.getint(
+            "pbench-server", "compare-extract-workers", fallback=4
+        )
         stream_file = {}
-        for dataset in datasets:
-            try:
-                file = cache_m.get_inventory_bytes(dataset.resource_id, "result.csv")
-            except CacheManagerError as e:
-                raise APIAbort(
-                    HTTPStatus.BAD_REQUEST,
-                    "unable to extract postprocessed data from {dataset.name}",
-                ) from e
-            except Exception as e:
-                raise APIInternalError(
-                    f"Unexpected error extracting postprocessed data from {dataset.name}"
-                ) from e
-            stream_file[dataset.name] = file
+        pool = ThreadPoolExecutor(
+            max_workers=max(1, min(workers, len(datasets))),
+            thread_name_prefix="compare",
+        )
+
+        # Our threads' cache locks don't conflict with each other, so a
+        # thread reclaiming cache space to unpack one dataset could otherwise
+        # remove the cache of another that we're reading.
+        in_use = [d.resource_id for d in datasets]
+        cache_m.mark_in_use(in_use)
+        try:
+            futures = {
+                d.resource_id: pool.submit(self.get_result_csv, cache_m, d.resource_id)
+                for d in datasets
+            }
+            for dataset in datasets:
+                try:
+                    file = futures[dataset.resource_id].result()
+                except CacheManagerError as e:
+                    raise APIAbort(
+                        HTTPStatus.BAD_REQUEST,
+                        f"unable to extract postprocessed data from {dataset.name}",
+                    ) from e
+                except Exception as e:
+                    raise APIInternalError(
+                        f"Unexpected error extracting postprocessed data from {dataset.name}"
+                    ) from e
+                stream_file[dataset.name] = file
+        finally:
+            # Don't wait for extractions we no longer need if one failed.
+            pool.shutdown(cancel_futures=True)
+            cache_m.release_in_use(in_use)
 
         try:
             quisby_response = QuisbyProcessing().compare_csv_to_json(
@@ -69,7 +69,7 @@ class DatasetsContents(ApiBase):
             f"{self._get_uri_base(req).host}{prefix}/datasets/{dataset.resource_id}"
         )
 
-        cache_m = CacheManager(self.config, current_app.logger)
+        cache_m = CacheManager.shared(self.config, current_app.logger)
         try:
             info = cache_m.get_contents(dataset.resource_id, path, origin)
         except (BadDirpath, CacheExtractBadPath, TarballNotFound) as e:
@@ -1,11 +1,33 @@
+import base64
+from datetime import datetime
 from http import HTTPStatus
-from typing import Any
+import json as jsonlib
+from threading import Lock
+import time
+from typing import Any, Callable
 from urllib.parse import urlencode, urlparse
 
 from flask import current_app
 from flask.json import jsonify
 from flask.wrappers import Request, Response
-from sqlalchemy import and_, asc, BigInteger, Boolean, cast, desc, func, or_, String
+from sqlalchemy import (
+    and_,
+    asc,
+    BigInteger,
+    Boolean,
+    case,
+    cast,
+    desc,
+    false,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    String,
+    Text,
+    true,
+)
 from sqlalchemy.exc import ProgrammingError, StatementError
 from sqlalchemy.orm import aliased, Query
 from sqlalchemy.sql.expression import Alias, BinaryExpression, ColumnElement
@@ -85,10 +107,106 @@ def urlencode_json(json: JSON) -> str:
     """We must properly encode the metadata query parameter as a list of keys."""
     new_json = {}
     for k, v in sorted(json.items()):
-        new_json[k] = ",".join(v) if k in ("metadata", "filter") else v
+        new_json[k] = ",".join(v) if k in ("metadata", "filter", "sort") else v
     return urlencode(new_json)
 
 
+# The separator between the key names of a Metadata key path reported by the
+# keyspace query: this can't appear in a key name.
+KEY_SEPARATOR = "\x1f"
+
+# Cache the keyspace aggregations of recent queries. Each entry is keyed by the
+# compiled SQL query and holds the Metadata generation and the time at which
+# the aggregation was computed, along with the aggregation.
+KEYSPACE_CACHE_SIZE = 64
+KEYSPACE_CACHE_TTL = 60.0
+keyspace_cache: dict[str, tuple[int, float, JSONOBJECT]] = {}
+keyspace_lock = Lock()
+
+
+def encode_cursor(sort: list[str], values: list[Any]) -> str:
+    """Construct an opaque keyset pagination cursor.
+
+    The cursor records the sort expressions of the query along with the sort
+    key values of the last dataset returned, so that the next page can start
+    right after it. Date-time values are tagged so that they can be restored
+    as date-time objects.
+
+    Args:
+        sort: The list of sort expressions of the query
+        values: The sort key values of the last dataset on the page
+
+    Returns:
+        A URL-safe cursor string
+    """
+    keys = [{"date": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    the_bytes = jsonlib.dumps({"sort": sort, "keys": keys}).encode("utf-8")
+    return base64.urlsafe_b64encode(the_bytes).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: list[str], count: int) -> list[Any]:
+    """Recover the sort key values from a keyset pagination cursor.
+
+    Args:
+        cursor: A cursor string constructed by encode_cursor
+        sort: The list of sort expressions of the current query
+        count: The number of sort keys of the current query
+
+    Raises:
+        APIAbort(BAD_REQUEST) if the cursor is malformed or was built for
+        a different set of sort expressions
+
+    Returns:
+        The list of sort key values
+    """
+    try:
+        decoded = jsonlib.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        keys = decoded["keys"]
+        if decoded["sort"] != sort or len(keys) != count:
+            raise ValueError("cursor doesn't match the query sort keys")
+        return [
+            datetime.fromisoformat(v["date"]) if isinstance(v, dict) else v
+            for v in keys
+        ]
+    except Exception as e:
+        raise APIAbort(
+            HTTPStatus.BAD_REQUEST, f"Invalid pagination cursor {cursor!r}"
+        ) from e
+
+
+def keyset_filter(
+    keys: list[tuple[ColumnElement, Callable]], values: list[Any]
+) -> ColumnElement:
+    """Construct a filter selecting the rows ordered after a keyset cursor.
+
+    For sort keys k1..kn with cursor values v1..vn, a row follows the cursor
+    if, for some i, it matches v1..v(i-1) and its ki value sorts after vi.
+    NULL values are sorted last regardless of the sort order, so a NULL key
+    sorts after any value, and nothing sorts after a NULL key.
+
+    Args:
+        keys: The (expression, order) sort keys of the query
+        values: The sort key values recovered from the cursor
+
+    Returns:
+        A SQLAlchemy filter expression
+    """
+    terms = []
+    equal = []
+    for (expression, order), value in zip(keys, values):
+        if value is None:
+            after = false()
+            match = expression.is_(None)
+        else:
+            value = literal(value, expression.type)
+            beyond = expression > value if order is asc else expression < value
+            after = or_(beyond, expression.is_(None))
+            match = expression == value
+        terms.append(and_(*equal, after))
+        equal.append(match)
+    return or_(*terms)
+
+
 class DatasetsList(ApiBase):
     """API class to list datasets based on database metadata."""
 
@@ -115,6 +233,9 @@ class DatasetsList(ApiBase):
                     # Pagination
                     Parameter("offset", ParamType.INT),
                     Parameter("limit", ParamType.INT),
+                    Parameter("keyset", ParamType.BOOLEAN),
+                    Parameter("cursor", ParamType.STRING),
+                    Parameter("count", ParamType.BOOLEAN),
                     # Output control
                     Parameter("daterange", ParamType.BOOLEAN),
                     Parameter("keysummary", ParamType.BOOLEAN),
@@ -138,6 +259,31 @@ class DatasetsList(ApiBase):
             ),
         )
 
+    @staticmethod
+    def count_query(query: Query, json: JSON) -> int:
+        """Count the datasets selected by the query.
+
+        This is usually the first actual query: so if we've constructed a
+        query that the DB engine can't handle, we'll fail here. Try to report
+        as much detail as possible in the log.
+
+        Args:
+            query: A SQLAlchemy query object
+            json: The query parameters in normalized JSON form
+
+        Returns:
+            The number of datasets selected
+        """
+        try:
+            return query.count()
+        except Exception as e:
+            try:
+                q = str(query.statement.compile(compile_kwargs={"literal_binds": True}))
+                msg = f"problem executing {q!r}: {str(e)!r}"
+            except Exception as uhoh:
+                msg = f"Unable to compile query for {json} -> {str(uhoh)!r} after {str(e)!r}"
+            raise APIInternalError(msg)
+
     def get_paginated_obj(
         self, query: Query, json: JSON, raw_params: ApiParams, url: str
     ) -> tuple[list[JSONOBJECT], dict[str, str]]:
@@ -152,6 +298,10 @@ class DatasetsList(ApiBase):
             "limit": 10 -> dataset[0: 10]
             "offset": 20 -> dataset[20: total_items_count]
 
+        When the "count" parameter is false, the total items count is neither
+        computed nor reported; instead we fetch one item past the limit to
+        decide whether there's a next page.
+
         Args:
             query: A SQLAlchemy query object
             json: The query parameters in normalized JSON form
@@ -167,18 +317,9 @@ class DatasetsList(ApiBase):
 
         Database.dump_query(query, current_app.logger)
 
-        # This is the first actual query: so if we've constructed a query that
-        # the DB engine can't handle, we'll fail here. Try to report as much
-        # detail as possible in the log.
-        try:
-            total_count = query.count()
-        except Exception as e:
-            try:
-                q = str(query.statement.compile(compile_kwargs={"literal_binds": True}))
-                msg = f"problem executing {q!r}: {str(e)!r}"
-            except Exception as uhoh:
-                msg = f"Unable to compile query for {json} -> {str(uhoh)!r} after {str(e)!r}"
-            raise APIInternalError(msg)
+        counted = json.get("count", True)
+        if counted:
+            total_count = self.count_query(query, json)
 
         # Shift the query search by user specified offset value,
         # otherwise return the batch of results starting from the
@@ -190,9 +331,13 @@ class DatasetsList(ApiBase):
         # Get the user specified limit, otherwise return all the items
         limit = json.get("limit")
         if limit:
-            query = query.limit(limit)
+            query = query.limit(limit if counted else limit + 1)
 
         items = query.all()
+        if not counted:
+            more = bool(limit) and len(items) > limit
+            items = items[:limit] if limit else items
+            total_count = offset + len(items) + (1 if more else 0)
         raw = raw_params.query.copy()
         next_offset = offset + len(items)
         if next_offset < total_count:
@@ -207,7 +352,79 @@ class DatasetsList(ApiBase):
 
         paginated_result["parameters"] = raw
         paginated_result["next_url"] = next_url
-        paginated_result["total"] = total_count
+        if counted:
+            paginated_result["total"] = total_count
+        return items, paginated_result
+
+    def get_keyset_obj(
+        self,
+        query: Query,
+        keys: list[tuple[ColumnElement, Callable]],
+        json: JSON,
+        raw_params: ApiParams,
+        url: str,
+    ) -> tuple[list[JSONOBJECT], dict[str, str]]:
+        """Helper function to return a page of datasets using keyset
+        pagination, and a paginated object containing the next page url and
+        (optionally) the total items count.
+
+        Instead of skipping an offset number of datasets, which requires the
+        database to scan all of them, each page is selected by filtering on
+        the sort key values of the last dataset of the previous page, which
+        are carried in an opaque "cursor" query parameter. The cost of a page
+        therefore doesn't depend on how deep into the collection it is.
+
+        The query is expected to select the values of the sort keys as its
+        trailing columns, in order.
+
+        Args:
+            query: A SQLAlchemy query object
+            keys: The (expression, order) sort keys of the query
+            json: The query parameters in normalized JSON form
+            raw_params: The original API parameters for reference
+            url: The API URL
+
+        Returns:
+            The list of Dataset objects matched by the query and a pagination
+            framework object.
+        """
+        paginated_result = {}
+        query = query.distinct()
+        sort = json.get("sort", [])
+
+        Database.dump_query(query, current_app.logger)
+
+        counted = json.get("count", True)
+        if counted:
+            paginated_result["total"] = self.count_query(query, json)
+
+        cursor = json.get("cursor")
+        if cursor:
+            values = decode_cursor(cursor, sort, len(keys))
+            query = query.filter(keyset_filter(keys, values))
+
+        # Get the user specified limit, otherwise return all the items. We
+        # fetch one item past the limit to decide whether there's a next page.
+        limit = json.get("limit")
+        if limit:
+            query = query.limit(limit + 1)
+
+        items = query.all()
+        raw = raw_params.query.copy()
+        if limit and len(items) > limit:
+            items = items[:limit]
+            # The next page repeats the caller's own query parameters rather
+            # than the normalized values (e.g., an owner's user ID instead of
+            # the username), which wouldn't validate as query parameters.
+            next_query = raw.copy()
+            next_query["cursor"] = encode_cursor(sort, list(items[-1][-len(keys) :]))
+            parsed_url = urlparse(url)
+            next_url = parsed_url._replace(query=urlencode_json(next_query)).geturl()
+        else:
+            next_url = ""
+
+        paginated_result["parameters"] = raw
+        paginated_result["next_url"] = next_url
         return items, paginated_result
 
     @staticmethod
@@ -391,40 +608,72 @@ class DatasetsList(ApiBase):
 
         return query.filter(and_(*and_list))
 
-    def accumulate(self, aggregate: JSONOBJECT, key: str, value: Any):
-        """Recursive helper to accumulate the metadata namespace
+    @staticmethod
+    def keyspace_paths(query: Query) -> list[tuple[str, str, bool]]:
+        """Aggregate the metadata key paths of the selected datasets in SQL.
 
-        Iterate through a list of metadata key/value pairs to construct a
-        hierarchical aggregation of all metadata keys across the selected
-        datasets. Each key in the hierarchy is represented as a key in a
-        nested JSON object. "Leaf" keys have the value None. E.g.,
+        A recursive query walks the JSON values of all Metadata rows attached
+        to the selected datasets, reporting each distinct key path once along
+        with whether its value is a nested JSON object. This avoids loading
+        every dataset and its metadata into Python.
 
-            {
-                "dataset": {"name": None, "metalog": {"pbench": {"script": None}}},
-                "server": {"deletion": None, "tarball-path": None},
-                "global": {"server": {"legacy": {"sha1": None}}}
-            }
+        Each path is represented as the key names of the path, each preceded
+        by the KEY_SEPARATOR character; the top level Metadata value has an
+        empty path.
+
+        PostgreSQL and SQLite share the json_each() table-valued function, but
+        report the JSON type of a value differently.
 
         Args:
-            aggregate: a JSONOBJECT to update with the recursive key/value
-            key: the current metadata key path element
-            value: the current metadata key's value
+            query: The basic filtered SQLAlchemy query object
+
+        Returns:
+            A list of (metadata key, path, object) tuples
         """
-        if isinstance(value, dict):
-            p = aggregate.get(key)
-            if p is None:
-                p = {}
-                aggregate[key] = p
-            for k, v in value.items():
-                self.accumulate(p, k, v)
-        elif key not in aggregate:
-            aggregate[key] = None
+        sqlite = Database.db_session.get_bind().dialect.name == "sqlite"
+        json_type = func.json_type if sqlite else func.json_typeof
+        selected = query.with_entities(Dataset.id).subquery()
+        base = select(
+            Metadata.key.label("key"),
+            cast(literal(""), Text).label("path"),
+            Metadata.value.label("value"),
+            json_type(Metadata.value).label("type"),
+        ).where(Metadata.dataset_ref.in_(select(selected.c.id)))
+        tree = base.cte("keyspace", recursive=True)
+
+        # Only JSON objects have keys to walk; make sure that json_each sees
+        # an empty object in place of any other value.
+        columns = ("key", "value", "type") if sqlite else ("key", "value")
+        each = func.json_each(
+            case((tree.c.type == "object", tree.c.value), else_=literal_column("'{}'"))
+        ).table_valued(*columns)
+        child = select(
+            tree.c.key,
+            cast(tree.c.path + KEY_SEPARATOR + each.c.key, Text),
+            each.c.value,
+            each.c.type if sqlite else json_type(each.c.value),
+        ).select_from(tree.join(each, true()))
+        tree = tree.union_all(child)
+        paths = select(tree.c.key, tree.c.path, tree.c.type == "object").distinct()
+        return Database.db_session.execute(paths).all()
 
     def keyspace(self, query: Query) -> JSONOBJECT:
         """Aggregate the dataset metadata keyspace
 
-        Run the query we've compiled, and process the metadata collections
-        attached to each dataset.
+        Construct a hierarchical aggregation of all metadata keys across the
+        selected datasets. Each key in the hierarchy is represented as a key in
+        a nested JSON object. "Leaf" keys have the value None. E.g.,
+
+            {
+                "dataset": {"name": None, "metalog": {"pbench": {"script": None}}},
+                "server": {"deletion": None, "tarball-path": None},
+                "global": {"server": {"legacy": {"sha1": None}}}
+            }
+
+        The aggregation is cached by query, and reused until any Metadata is
+        written by this process or until KEYSPACE_CACHE_TTL seconds have
+        passed, which bounds the staleness of the cache with respect to the
+        Metadata writes of other server processes.
 
         Args:
             query: The basic filtered SQLAlchemy query object
@@ -433,25 +682,48 @@ class DatasetsList(ApiBase):
             The aggregated keyspace JSON object
         """
         Database.dump_query(query, current_app.logger)
-        aggregate: JSONOBJECT = {}
+        try:
+            cache_key = str(
+                query.statement.compile(compile_kwargs={"literal_binds": True})
+            )
+        except Exception:
+            cache_key = None
+        now = time.time()
+        generation = Metadata.generation
+        with keyspace_lock:
+            cached = keyspace_cache.get(cache_key)
+        if cached and cached[0] == generation and now - cached[1] < KEYSPACE_CACHE_TTL:
+            return {"keys": cached[2]}
 
-        results = query.all()
-        for result in results:
-            # NOTE: to allow sorting by User.username, our query is defined to
-            # return (Dataset, User), so we need to isolate the Dataset from
-            # the tuple.
-            dataset = result[0]
-            if not aggregate:
-                columns = {c.name: None for c in Dataset.__table__._columns}
-                columns["owner"] = None
-                aggregate.update({"dataset": columns})
-            for m in dataset.metadatas:
-                # "metalog" is a top-level key in the Metadata schema, but we
-                # report it as a sub-key of "dataset".
-                if m.key == Metadata.METALOG:
-                    self.accumulate(aggregate["dataset"], m.key, m.value)
-                else:
-                    self.accumulate(aggregate, m.key, m.value)
+        aggregate: JSONOBJECT = {}
+        paths = self.keyspace_paths(query)
+        if paths or query.first():
+            columns = {c.name: None for c in Dataset.__table__._columns}
+            columns["owner"] = None
+            aggregate["dataset"] = columns
+        for key, path, is_object in paths:
+            # "metalog" is a top-level key in the Metadata schema, but we
+            # report it as a sub-key of "dataset".
+            p = aggregate["dataset"] if key == Metadata.METALOG else aggregate
+            names = [key] + path.split(KEY_SEPARATOR)[1:]
+            leaf = names.pop()
+            for name in names:
+                # A key which is a JSON object for one dataset may be a leaf
+                # for another: the object wins.
+                if not isinstance(p.get(name), dict):
+                    p[name] = {}
+                p = p[name]
+            if is_object:
+                if not isinstance(p.get(leaf), dict):
+                    p[leaf] = {}
+            elif leaf not in p:
+                p[leaf] = None
+
+        if cache_key:
+            with keyspace_lock:
+                keyspace_cache[cache_key] = (generation, now, aggregate)
+                while len(keyspace_cache) > KEYSPACE_CACHE_SIZE:
+                    del keyspace_cache[next(iter(keyspace_cache))]
         return {"keys": aggregate}
 
     def daterange(self, query: Query) -> JSONOBJECT:
@@ -500,9 +772,19 @@ class DatasetsList(ApiBase):
             The paginated dataset listing
         """
 
+        # Keyset pagination is selected explicitly for the first page, and
+        # implied by the cursor on subsequent pages.
+        keyset = json.get("keyset") or "cursor" in json
+        if keyset and "offset" in json:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST,
+                "Keyset pagination cannot be used with an 'offset'",
+            )
+
         # Process a possible list of sort terms. By default, we sort by the
         # dataset resource_id.
         sorters = []
+        sort_keys = []
         for sort in json.get("sort", ["dataset.resource_id"]):
             if ":" not in sort:
                 k = sort
@@ -546,6 +828,7 @@ class DatasetsList(ApiBase):
                     native_key = keys.pop(0).lower()
                 elif second == "owner":
                     sorter = order(User.username)
+                    sort_keys.append((User.username, order))
                 else:
                     try:
                         c = getattr(Dataset, second)
@@ -556,20 +839,41 @@ class DatasetsList(ApiBase):
 
                     # For native SQL columns, use the SQL type unless
                     # explicitly overridden.
-                    sorter = order(c if defaulted_type else c.cast(cast_to))
+                    column = c if defaulted_type else c.cast(cast_to)
+                    sorter = order(column)
+                    sort_keys.append((column, order))
             if sorter is None:
                 casted = cast(aliases[native_key].value[keys].as_string(), cast_to)
-                query = query.add_column(casted)
+                if not keyset:
+                    query = query.add_column(casted)
                 sorter = order(casted)
+                sort_keys.append((casted, order))
             sorters.append(sorter)
 
-        # Apply our list of sort terms
-        query = query.order_by(*sorters)
-
         try:
-            results, paginated_result = self.get_paginated_obj(
-                query=query, json=json, raw_params=raw_params, url=request.url
-            )
+            if keyset:
+                # Select the sort key values, with the unique dataset ID as a
+                # final tie-breaker, so that the last dataset of a page can
+                # be located precisely by the next page's cursor. NULL values
+                # sort last so that the cursor comparisons are well defined.
+                sort_keys.append((Dataset.id, asc))
+                query = query.add_columns(*(k for k, _ in sort_keys))
+                query = query.order_by(*(o(k).nulls_last() for k, o in sort_keys))
+                results, paginated_result = self.get_keyset_obj(
+                    query=query,
+                    keys=sort_keys,
+                    json=json,
+                    raw_params=raw_params,
+                    url=request.url,
+                )
+            else:
+                # Apply our list of sort terms
+                query = query.order_by(*sorters)
+                results, paginated_result = self.get_paginated_obj(
+                    query=query, json=json, raw_params=raw_params, url=request.url
+                )
+        except APIAbort:
+            raise
         except (AttributeError, ProgrammingError, StatementError) as e:
             raise APIInternalError(
                 f"Constructed SQL for {json} isn't executable"
@@ -579,21 +883,27 @@ class DatasetsList(ApiBase):
 
         keys = json.get("metadata")
 
+        # NOTE: to allow sorting by User.username, our query is defined to
+        # return (Dataset, User), so we need to isolate the Dataset from the
+        # tuple.
+        datasets = [result[0] for result in results]
+
+        # Collect the requested metadata for the whole page at once rather
+        # than querying each dataset's metadata separately.
+        try:
+            metadata = self._get_datasets_metadata(datasets, keys)
+        except MetadataError:
+            metadata = {}
+
         response = []
-        for result in results:
-            # NOTE: to allow sorting by User.username, our query is defined to
-            # return (Dataset, User), so we need to isolate the Dataset from
-            # the tuple.
-            dataset = result[0]
-            d = {
-                "name": dataset.name,
-                "resource_id": dataset.resource_id,
-            }
-            try:
-                d["metadata"] = self._get_dataset_metadata(dataset, keys)
-            except MetadataError:
-                d["metadata"] = None
-            response.append(d)
+        for dataset in datasets:
+            response.append(
+                {
+                    "name": dataset.name,
+                    "resource_id": dataset.resource_id,
+                    "metadata": metadata.get(dataset.id),
+                }
+            )
 
         paginated_result["results"] = response
         return paginated_result
@@ -64,7 +64,7 @@ class DatasetsVisualize(ApiBase):
                 HTTPStatus.BAD_REQUEST, f"Unsupported Benchmark: {benchmark}"
             )
 
-        cache_m = CacheManager(self.config, current_app.logger)
+        cache_m = CacheManager.shared(self.config, current_app.logger)
         try:
             file = cache_m.get_inventory_bytes(dataset.resource_id, "result.csv")
         except CacheManagerError as e:
@@ -105,8 +105,8 @@ class IntakeBase(ApiBase):
 
     CHUNK_SIZE = 65536
 
-    def __init__(self, config: PbenchServerConfig, schema: ApiSchema):
-        super().__init__(config, schema)
+    def __init__(self, config: PbenchServerConfig, *schemas: ApiSchema):
+        super().__init__(config, *schemas)
         self.temporary = config.ARCHIVE / CacheManager.TEMPORARY
         self.backup_dir = config.BACKUP
         self.temporary.mkdir(mode=0o755, parents=True, exist_ok=True)
@@ -487,7 +487,7 @@ class IntakeBase(ApiBase):
 
             # Create a cache manager object
             try:
-                cache_m = CacheManager(self.config, current_app.logger)
+                cache_m = CacheManager.shared(self.config, current_app.logger)
             except Exception as e:
                 raise APIInternalError("Unable to map the cache manager") from e
 
@@ -516,7 +516,8 @@ class IntakeBase(ApiBase):
                 ) from exc
 
             # From this point, failure will remove the tarball from the cache
-            # manager.
+            # manager, and drop it from the shared cache manager's registry.
+            recovery.add(lambda: cache_m.forget(tarball.resource_id))
             recovery.add(tarball.delete)
 
             # Add the processed tarball metadata.log file contents, if any.
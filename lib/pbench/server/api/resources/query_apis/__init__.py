@@ -1,5 +1,6 @@
 from datetime import datetime
 from http import HTTPStatus
+from threading import Lock
 from typing import Callable, List, Optional
 from urllib.parse import urljoin
 from urllib.request import Request
@@ -9,6 +10,7 @@ from dateutil.relativedelta import relativedelta
 from flask import current_app
 from flask.wrappers import Response
 import requests
+from requests.adapters import HTTPAdapter
 
 from pbench.server import JSONOBJECT, PbenchServerConfig
 from pbench.server.api.resources import (
@@ -57,6 +59,78 @@ class PostprocessError(Exception):
         self.data = data
 
 
+class ElasticSession:
+    """A pooled HTTP session for the Elasticsearch calls of the server APIs.
+
+    All ElasticBase APIs of a server process share one requests Session, so
+    that the connections (and the TLS handshakes) to Elasticsearch are kept
+    alive and reused across API calls rather than made for each call. The
+    size of the connection pool and the call timeouts are configurable in the
+    "Indexing" section of the server configuration.
+    """
+
+    _shared: Optional["ElasticSession"] = None
+    _shared_lock = Lock()
+
+    def __init__(self, config: PbenchServerConfig):
+        """Construct the session and its connection pool.
+
+        Args:
+            config: server configuration
+        """
+        self.config = config
+        self.pool_size = config.getint("Indexing", "query_pool_size", fallback=10)
+        self.timeout = (
+            config.getint("Indexing", "query_connect_timeout", fallback=10),
+            config.getint("Indexing", "query_read_timeout", fallback=None),
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, pool_block=False
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    @classmethod
+    def shared(cls, config: PbenchServerConfig) -> "ElasticSession":
+        """Return the server process's shared session, constructing it on
+        first use.
+
+        Args:
+            config: server configuration
+
+        Returns:
+            The shared ElasticSession
+        """
+        with cls._shared_lock:
+            if cls._shared is None or cls._shared.config is not config:
+                cls._shared = cls(config)
+            return cls._shared
+
+    def stats(self) -> dict[str, JSONOBJECT]:
+        """Report the utilization of the connection pool of each Elasticsearch
+        host, for monitoring.
+
+        Returns:
+            A JSON object for each host, reporting the number of connections
+            opened, the number of requests made, and the number of idle
+            connections available for reuse.
+        """
+        pools = self.adapter.poolmanager.pools
+        stats = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": sum(1 for c in list(pool.pool.queue) if c) if pool.pool else 0,
+                "size": self.pool_size,
+            }
+        return stats
+
+
 class ElasticBase(ApiBase):
     """
     A base class for Elasticsearch queries that allows subclasses to provide
@@ -104,6 +178,11 @@ class ElasticBase(ApiBase):
         self.es_url = config.get("Indexing", "uri")
         self.ca_bundle = config.get("Indexing", "ca_bundle")
 
+    @property
+    def es_session(self) -> ElasticSession:
+        """The server process's shared Elasticsearch session."""
+        return ElasticSession.shared(self.config)
+
     @staticmethod
     def _build_elasticsearch_query(
         user: Optional[str], access: Optional[str], terms: List[JSONOBJECT]
@@ -359,7 +438,7 @@ class ElasticBase(ApiBase):
         Perform the requested call to Elasticsearch, and handle any exceptions.
 
         Args:
-            method: requests package callable (e.g., requests.get)
+            method: requests Session callable (e.g., Session.get)
             params: Type-normalized client parameters
             context: API context dictionary
 
@@ -399,13 +478,15 @@ class ElasticBase(ApiBase):
         if es_request:
             try:
                 # perform the Elasticsearch query
+                kwargs = {"timeout": self.es_session.timeout, **es_request["kwargs"]}
                 es_response: requests.Response = method(
-                    url, **es_request["kwargs"], verify=self.ca_bundle
+                    url, **kwargs, verify=self.ca_bundle
                 )
                 current_app.logger.debug(
-                    "ES query response {}:{}",
+                    "ES query response {}:{}, connection pool {}",
                     es_response.reason,
                     es_response.status_code,
+                    self.es_session.stats(),
                 )
                 es_response.raise_for_status()
                 json_response = es_response.json()
@@ -467,7 +548,7 @@ class ElasticBase(ApiBase):
             context: The API context dictionary
         """
         context["request"] = req
-        return self._call(requests.post, params, context)
+        return self._call(self.es_session.session.post, params, context)
 
     def _delete(self, params: ApiParams, req: Request, context: ApiContext) -> Response:
         """Handle a Pbench server DELETE operation involving Elasticsearch
@@ -483,7 +564,7 @@ class ElasticBase(ApiBase):
             context: The API context dictionary
         """
         context["request"] = req
-        return self._call(requests.post, params, context)
+        return self._call(self.es_session.session.post, params, context)
 
     def _get(self, params: ApiParams, req: Request, context: ApiContext) -> Response:
         """Handle a GET operation involving a call to Elasticsearch
@@ -499,4 +580,4 @@ class ElasticBase(ApiBase):
             context: The API context dictionary
         """
         context["request"] = req
-        return self._call(requests.get, params, context)
+        return self._call(self.es_session.session.get, params, context)
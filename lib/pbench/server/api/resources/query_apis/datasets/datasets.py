@@ -1,7 +1,14 @@
 from collections import defaultdict
 from http import HTTPStatus
+import os
+import re
+import socket
+from threading import Thread
+import time
+from typing import Optional
+from urllib.parse import urljoin
 
-from flask import current_app, jsonify, Response
+from flask import current_app, Flask, jsonify, Response
 
 from pbench.server import JSONOBJECT, OperationCode, PbenchServerConfig
 from pbench.server.api.resources import (
@@ -21,8 +28,15 @@ from pbench.server.api.resources.query_apis import ApiContext
 from pbench.server.api.resources.query_apis.datasets import IndexMapBase
 import pbench.server.auth.auth as Auth
 from pbench.server.cache_manager import CacheManager
-from pbench.server.database.models.audit import AuditReason, AuditStatus, AuditType
+from pbench.server.database.database import Database
+from pbench.server.database.models.audit import (
+    Audit,
+    AuditReason,
+    AuditStatus,
+    AuditType,
+)
 from pbench.server.database.models.datasets import (
+    Dataset,
     Operation,
     OperationName,
     OperationState,
@@ -39,8 +53,29 @@ class Datasets(IndexMapBase):
 
     Called as `POST /api/v1/datasets/{resource_id}?access=public&owner=user`
     or DELETE /api/v1/datasets/{resource_id}
+
+    With `?wait=false`, the Elasticsearch update or delete is submitted as a
+    sliced background task, and the API returns 202 (ACCEPTED) immediately.
+    The dataset's operation state remains WORKING, with the Elasticsearch task
+    ID as its message, until a tracking thread sees the task complete and
+    finishes the operation, including the audit record.
+
+    The message also identifies the server process tracking the task, and
+    the root audit record; if that process goes away before the task is
+    done, the next server worker to start fails the operation (see
+    `abandon_tasks`) so that it can be retried.
     """
 
+    # Consecutive failures to check on an Elasticsearch task before giving up
+    TASK_CHECK_RETRIES = 10
+
+    # The WORKING operation message for an Elasticsearch task, identifying
+    # the tracking process by host, gunicorn master PID, and worker PID.
+    TASK_MESSAGE = re.compile(
+        r"Elasticsearch task (?P<task>\S+) \(tracker (?P<host>[^/\s]+)/"
+        r"(?P<ppid>\d+)/(?P<pid>\d+), audit (?P<audit>\d+)\)"
+    )
+
     def __init__(self, config: PbenchServerConfig):
         super().__init__(
             config,
@@ -53,6 +88,7 @@ class Datasets(IndexMapBase):
                 query_schema=Schema(
                     Parameter("access", ParamType.ACCESS, required=False),
                     Parameter("owner", ParamType.USER, required=False),
+                    Parameter("wait", ParamType.BOOLEAN, required=False),
                 ),
                 audit_type=AuditType.DATASET,
                 audit_name="update",
@@ -70,6 +106,9 @@ class Datasets(IndexMapBase):
                 uri_schema=Schema(
                     Parameter("dataset", ParamType.DATASET, required=True),
                 ),
+                query_schema=Schema(
+                    Parameter("wait", ParamType.BOOLEAN, required=False),
+                ),
                 audit_type=AuditType.DATASET,
                 audit_name="delete",
                 authorization=ApiAuthorizationType.DATASET,
@@ -118,6 +157,10 @@ class Datasets(IndexMapBase):
         NOTE: while most index document templates record the owning dataset
         resource_id as "run.id", the TOC document records it as
         "run_data_parent", and we need to match against either.
+
+        When the client specifies `wait=false` for an update or delete, we ask
+        Elasticsearch to run the operation as an automatically sliced task,
+        which returns a task ID immediately instead of the results.
         """
 
         dataset = context["dataset"]
@@ -130,6 +173,10 @@ class Datasets(IndexMapBase):
 
         if action != "get":
             elastic_options["refresh"] = "true"
+            if params.query.get("wait") is False:
+                elastic_options["wait_for_completion"] = "false"
+                elastic_options["slices"] = "auto"
+                context["task"] = True
             operations = Operation.by_state(dataset, OperationState.WORKING)
             if context["attributes"].require_stable and operations:
                 raise APIAbort(
@@ -235,6 +282,9 @@ class Datasets(IndexMapBase):
           100% successful (before updating or deleting the dataset), but
           we also summarize the results for the client.
         * For get, we directly return the "hit list".
+        * For an update or delete submitted as an Elasticsearch task, this
+          is a document identifying the task; we start a thread to track the
+          task and return it to the client.
 
         Args:
             es_json: the Elasticsearch response document
@@ -246,7 +296,6 @@ class Datasets(IndexMapBase):
         action = context["action"]
         dataset = context["dataset"]
         current_app.logger.info("POSTPROCESS {}: {}", dataset.name, es_json)
-        failures = 0
         if action == "get":
             count = None
             hits = []
@@ -269,86 +318,348 @@ class Datasets(IndexMapBase):
             for hit in hits:
                 results[hit["_index"]] += 1
             return jsonify(results)
+        elif context.get("task") and es_json:
+            return self._start_task(es_json, context)
+        return jsonify(self.complete(es_json, context))
+
+    def complete(self, es_json: JSONOBJECT, context: ApiContext) -> JSONOBJECT:
+        """Complete an update or delete operation.
+
+        The Elasticsearch results document has a count of successful updates
+        and deletions, along with a list of failures and some other data. We
+        mostly want to determine whether it was 100% successful (before
+        updating or deleting the dataset), but we also summarize the results
+        for the client.
+
+        Args:
+            es_json: the Elasticsearch update or delete results document
+            context: the API context
+
+        Raises:
+            APIInternalError: the dataset or its operational state couldn't
+                be updated, or none of the indexed documents were updated.
+
+        Returns:
+            The summary of the Elasticsearch results
+        """
+        action = context["action"]
+        dataset = context["dataset"]
+
+        if es_json:
+            fields = ("deleted", "updated", "total", "version_conflicts")
+            results = {f: es_json.get(f, 0) for f in fields}
+            failures = len(es_json["failures"]) if "failures" in es_json else 0
+            results["failures"] = failures
         else:
-            if es_json:
-                fields = ("deleted", "updated", "total", "version_conflicts")
-                results = {f: es_json.get(f, 0) for f in fields}
-                failures = len(es_json["failures"]) if "failures" in es_json else 0
-                results["failures"] = failures
-            else:
-                results = {
-                    "deleted": 0,
-                    "updated": 0,
-                    "total": 0,
-                    "version_conflicts": 0,
-                    "failures": 0,
-                }
-            context["auditing"]["attributes"]["results"] = results
-
-            if failures == 0:
-                if action == "update":
-                    access = context.get("access")
-                    if access:
-                        dataset.access = access
-                    owner = context.get("owner")
-                    if owner:
-                        dataset.owner_id = owner
-                    try:
-                        dataset.update()
-                    except Exception as e:
-                        raise APIInternalError(
-                            f"Unable to update dataset {dataset.name}: {str(e)!r}"
-                        ) from e
-                elif action == "delete":
-                    try:
-                        cache_m = CacheManager(self.config, current_app.logger)
-                        cache_m.delete(dataset.resource_id)
-                        dataset.delete()
+            failures = 0
+            results = {
+                "deleted": 0,
+                "updated": 0,
+                "total": 0,
+                "version_conflicts": 0,
+                "failures": 0,
+            }
+        context["auditing"]["attributes"]["results"] = results
 
-                        # Tell caller not to update operational state for the deleted
-                        # dataset.
-                        del context["sync"]
-                    except Exception as e:
-                        raise APIInternalError(
-                            f"Unable to delete dataset {dataset.name}: {str(e)!r}"
-                        ) from e
-
-            # The DELETE API removes the "sync" context on success to signal
-            # that the operations table rows no longer exist, so check; but if
-            # it's still set then our `sync` local is valid and we want to get
-            # it out of "WORKING" state.
-            sync = context.get("sync")
-            auditing = context["auditing"]
-            if sync:
-                state = OperationState.OK if not failures else OperationState.FAILED
+        if failures == 0:
+            if action == "update":
+                access = context.get("access")
+                if access:
+                    dataset.access = access
+                owner = context.get("owner")
+                if owner:
+                    dataset.owner_id = owner
                 try:
-                    sync.update(dataset=dataset, state=state)
+                    dataset.update()
                 except Exception as e:
-                    auditing["attributes"] = {"message": str(e)}
-                    auditing["status"] = AuditStatus.WARNING
-                    auditing["reason"] = AuditReason.INTERNAL
                     raise APIInternalError(
-                        f"Unexpected sync error {dataset.name} {str(e)!r}"
+                        f"Unable to update dataset {dataset.name}: {str(e)!r}"
                     ) from e
+            elif action == "delete":
+                try:
+                    cache_m = CacheManager.shared(self.config, current_app.logger)
+                    cache_m.delete(dataset.resource_id)
+                    dataset.delete()
 
-            # Return the summary document as the success response, or abort with an
-            # internal error if we tried to operate on Elasticsearch documents but
-            # experienced total failure. Either way, the operation can be retried
-            # if some documents failed to update.
-            if results["failures"] and results["failures"] == results["total"]:
+                    # Tell caller not to update operational state for the deleted
+                    # dataset.
+                    del context["sync"]
+                except Exception as e:
+                    raise APIInternalError(
+                        f"Unable to delete dataset {dataset.name}: {str(e)!r}"
+                    ) from e
+
+        # The DELETE API removes the "sync" context on success to signal
+        # that the operations table rows no longer exist, so check; but if
+        # it's still set then our `sync` local is valid and we want to get
+        # it out of "WORKING" state.
+        sync = context.get("sync")
+        auditing = context["auditing"]
+        if sync:
+            state = OperationState.OK if not failures else OperationState.FAILED
+            try:
+                sync.update(dataset=dataset, state=state)
+            except Exception as e:
+                auditing["attributes"] = {"message": str(e)}
                 auditing["status"] = AuditStatus.WARNING
                 auditing["reason"] = AuditReason.INTERNAL
-                auditing["attributes"][
-                    "message"
-                ] = f"Unable to {action} some indexed documents"
                 raise APIInternalError(
-                    f"Failed to {action} any of {results['total']} "
-                    f"Elasticsearch documents: {es_json}"
-                )
-            elif sync:
-                sync.error(
-                    dataset=dataset,
-                    message=f"Unable to {action} some indexed documents",
+                    f"Unexpected sync error {dataset.name} {str(e)!r}"
+                ) from e
+
+        # Return the summary document as the success response, or abort with an
+        # internal error if we tried to operate on Elasticsearch documents but
+        # experienced total failure. Either way, the operation can be retried
+        # if some documents failed to update.
+        if results["failures"] and results["failures"] == results["total"]:
+            auditing["status"] = AuditStatus.WARNING
+            auditing["reason"] = AuditReason.INTERNAL
+            auditing["attributes"][
+                "message"
+            ] = f"Unable to {action} some indexed documents"
+            raise APIInternalError(
+                f"Failed to {action} any of {results['total']} "
+                f"Elasticsearch documents: {es_json}"
+            )
+        elif results["failures"] and sync:
+            sync.error(
+                dataset=dataset,
+                message=f"Unable to {action} some indexed documents",
+            )
+        return results
+
+    def _start_task(self, es_json: JSONOBJECT, context: ApiContext) -> Response:
+        """Start tracking an Elasticsearch update or delete task.
+
+        The dataset operation remains in the WORKING state, with the task ID
+        recorded in its message, while a thread waits for the task to finish
+        and then completes the operation. The final audit record will be
+        written by that thread rather than by the API dispatcher.
+
+        Args:
+            es_json: the Elasticsearch task document
+            context: the API context
+
+        Returns:
+            A Flask response object identifying the task with ACCEPTED status
+        """
+        dataset = context["dataset"]
+        task = es_json.get("task")
+        if not task:
+            raise APIInternalError(
+                f"Elasticsearch didn't start a task for {dataset.name}: {es_json}"
+            )
+        auditing = context["auditing"]
+        tracker = f"{socket.gethostname()}/{os.getppid()}/{os.getpid()}"
+        try:
+            context["sync"].update(
+                dataset=dataset,
+                state=OperationState.WORKING,
+                message=f"Elasticsearch task {task} (tracker {tracker}, "
+                f"audit {auditing['audit'].id})",
+            )
+        except Exception as e:
+            raise APIInternalError(
+                f"Unexpected sync error {dataset.name} {str(e)!r}"
+            ) from e
+
+        auditing["attributes"]["task"] = task
+        auditing["finalize"] = False
+        tracked = {
+            "action": context["action"],
+            "component": context["attributes"].operation_name,
+            "resource_id": dataset.resource_id,
+            "access": context.get("access"),
+            "owner": context.get("owner"),
+            "audit": auditing["audit"].id,
+            "attributes": auditing["attributes"],
+        }
+        current_app.logger.info(
+            "{} {} started task {}", tracked["action"], dataset.name, task
+        )
+        Thread(
+            target=self._track_task,
+            args=(current_app._get_current_object(), task, tracked),
+            name=f"task-{task}",
+            daemon=True,
+        ).start()
+        response = jsonify({"task": task})
+        response.status_code = HTTPStatus.ACCEPTED
+        return response
+
+    def _track_task(self, app: Flask, task: str, tracked: JSONOBJECT):
+        """Wait for an Elasticsearch task to finish, and complete the dataset
+        operation.
+
+        This runs in its own thread, with its own application context and
+        database session, which we close when we're done so that the
+        connection goes back to the pool.
+
+        Args:
+            app: the Flask application
+            task: the Elasticsearch task ID
+            tracked: the parts of the API context needed to complete the
+                operation
+        """
+        try:
+            with app.app_context():
+                self._wait_task(task, tracked)
+        finally:
+            Database.db_session.remove()
+
+    def _wait_task(self, task: str, tracked: JSONOBJECT):
+        """Wait for an Elasticsearch task to finish, and complete the dataset
+        operation, within the tracking thread's application context.
+
+        Args:
+            task: the Elasticsearch task ID
+            tracked: the parts of the API context needed to complete the
+                operation
+        """
+        logger = current_app.logger
+        interval = self.config.getint("Indexing", "task_poll_interval", fallback=5)
+        url = urljoin(self.es_url, f"/_tasks/{task}")
+        task_json: Optional[JSONOBJECT] = None
+        error = None
+        failures = 0
+        while task_json is None:
+            try:
+                response = self.es_session.session.get(
+                    url, timeout=self.es_session.timeout, verify=self.ca_bundle
                 )
-        # construct response object
-        return jsonify(results)
+                if response.status_code == HTTPStatus.NOT_FOUND:
+                    error = f"Elasticsearch task {task} was not found"
+                    break
+                response.raise_for_status()
+                status = response.json()
+                failures = 0
+                if status.get("completed"):
+                    task_json = status
+                    continue
+            except Exception as e:
+                failures += 1
+                logger.warning("Unable to check Elasticsearch task {}: {}", task, e)
+                if failures >= self.TASK_CHECK_RETRIES:
+                    error = f"Unable to check Elasticsearch task {task}: {e}"
+                    break
+            time.sleep(interval)
+
+        auditing = {
+            "status": AuditStatus.SUCCESS,
+            "reason": None,
+            "attributes": tracked["attributes"],
+        }
+        context = {
+            "action": tracked["action"],
+            "access": tracked["access"],
+            "owner": tracked["owner"],
+            "auditing": auditing,
+        }
+        try:
+            context["dataset"] = Dataset.query(resource_id=tracked["resource_id"])
+            context["sync"] = Sync(logger=logger, component=tracked["component"])
+            if not error and "error" in task_json:
+                error = f"Elasticsearch task {task} failed: {task_json['error']}"
+            if error:
+                raise APIInternalError(error)
+            self.complete(task_json.get("response", {}), context)
+        except Exception as e:
+            message = e.details if isinstance(e, APIInternalError) else str(e)
+            logger.error("{} task {} failed: {}", tracked["action"], task, message)
+            auditing["status"] = AuditStatus.FAILURE
+            auditing["reason"] = AuditReason.INTERNAL
+            auditing["attributes"]["message"] = message
+            if context.get("sync") and context.get("dataset"):
+                try:
+                    context["sync"].error(dataset=context["dataset"], message=message)
+                except Exception as s:
+                    logger.error("Unexpected sync error for task {}: {}", task, s)
+        try:
+            Audit.create(
+                root=Audit.query(id=tracked["audit"])[0],
+                status=auditing["status"],
+                reason=auditing["reason"],
+                attributes=auditing["attributes"],
+            )
+        except Exception as e:
+            logger.error("Unable to audit task {}: {}", task, e)
+
+    @staticmethod
+    def _is_tracking(host: str, ppid: int, pid: int) -> bool:
+        """Determine whether an Elasticsearch task tracker may still exist.
+
+        A tracker on another host is assumed to be alive. A tracker under
+        another gunicorn master belongs to an earlier server instance, and
+        a tracker with our own PID is a previous worker whose PID we've
+        inherited; otherwise the tracker exists if its PID does.
+
+        Args:
+            host: the tracker's host name
+            ppid: the tracker's gunicorn master PID
+            pid: the tracker's PID
+
+        Returns:
+            False if the tracker is known to be gone
+        """
+        if host != socket.gethostname():
+            return True
+        if ppid != os.getppid() or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def abandon_tasks(self, app: Flask):
+        """Fail dataset operations whose Elasticsearch task tracker is gone.
+
+        A dataset operation waiting for an Elasticsearch task is tracked only
+        by a thread of the server worker which started it. If that worker
+        exits (e.g., it's recycled, or the server is restarted) before the
+        task finishes, the operation would remain WORKING and block any later
+        update or delete of the dataset.
+
+        This is called as each server worker starts: we cancel the orphaned
+        Elasticsearch task, if it's still running, and fail the operation and
+        its audit sequence so that the client can retry. Workers starting at
+        the same time may see the same orphaned operations, but only one of
+        them will fail each.
+
+        Args:
+            app: the Flask application
+        """
+        with app.app_context():
+            logger = current_app.logger
+            for component in (OperationName.UPDATE, OperationName.DELETE):
+                sync = Sync(logger=logger, component=component)
+                for dataset, message in sync.working():
+                    match = self.TASK_MESSAGE.fullmatch(message or "")
+                    if not match or self._is_tracking(
+                        match["host"], int(match["ppid"]), int(match["pid"])
+                    ):
+                        continue
+                    task = match["task"]
+                    error = f"Elasticsearch task {task} was abandoned: please retry"
+                    if not sync.error(dataset, error, expected=message):
+                        continue
+                    logger.warning("{} {}: {}", component.name, dataset.name, error)
+                    try:
+                        self.es_session.session.post(
+                            urljoin(self.es_url, f"/_tasks/{task}/_cancel"),
+                            timeout=self.es_session.timeout,
+                            verify=self.ca_bundle,
+                        )
+                    except Exception as e:
+                        logger.warning("Unable to cancel task {}: {}", task, e)
+                    try:
+                        Audit.create(
+                            root=Audit.query(id=int(match["audit"]))[0],
+                            status=AuditStatus.FAILURE,
+                            reason=AuditReason.INTERNAL,
+                            attributes={"task": task, "message": error},
+                        )
+                    except Exception as e:
+                        logger.error("Unable to audit task {}: {}", task, e)
@@ -0,0 +1,504 @@
+import errno
+import hashlib
+from http import HTTPStatus
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+from flask import current_app, jsonify
+from flask.wrappers import Request, Response
+
+from pbench.server import JSONOBJECT, PbenchServerConfig
+from pbench.server.api.resources import (
+    APIAbort,
+    ApiAuthorizationType,
+    ApiContext,
+    APIInternalError,
+    ApiMethod,
+    ApiParams,
+    ApiSchema,
+    Parameter,
+    ParamType,
+    Schema,
+)
+from pbench.server.api.resources.intake_base import Access, Intake, IntakeBase
+import pbench.server.auth.auth as Auth
+from pbench.server.database.models.audit import AuditType, OperationCode
+from pbench.server.database.models.datasets import Dataset, DatasetNotFound
+
+
+class UploadSession(IntakeBase):
+    """Accept a dataset from a client in separately transferred pieces
+
+    A resumable upload proceeds in steps, each identified by the MD5 of the
+    complete tarball, which is the resource ID of the new dataset:
+
+        POST /api/v1/upload/session?filename=<name>&length=<bytes>
+            with the tarball MD5 as the "Content-MD5" header, creates (or
+            resumes) an upload session;
+        PUT /api/v1/upload/session/<md5>
+            with a "Content-Range" header transfers a range of bytes, which
+            is verified against an optional "Content-MD5" header for the
+            range;
+        GET /api/v1/upload/session/<md5>
+            reports the byte ranges received so far;
+        POST /api/v1/upload/session/<md5>
+            completes the upload once all ranges have been received, with
+            the same checks and processing as a single PUT upload;
+        DELETE /api/v1/upload/session/<md5>
+            abandons the upload session.
+
+    The session's tarball is assembled in the "sessions" subdirectory of the
+    intake temporary directory, with a marker file recording each range that
+    has been written and verified. A session which sees no activity for the
+    configured "upload-session-expiry" hours is removed.
+    """
+
+    SESSIONS = "sessions"
+    STATE = "session.json"
+    DATA = "data"
+    RANGES = "ranges"
+    CONTENT_RANGE = re.compile(r"bytes (?P<first>\d+)-(?P<last>\d+)/(?P<length>\d+)")
+
+    def __init__(self, config: PbenchServerConfig):
+        super().__init__(
+            config,
+            ApiSchema(
+                ApiMethod.POST,
+                OperationCode.CREATE,
+                uri_schema=Schema(
+                    Parameter("session", ParamType.STRING, required=False)
+                ),
+                query_schema=Schema(
+                    Parameter("filename", ParamType.STRING),
+                    Parameter("length", ParamType.INT),
+                    Parameter("access", ParamType.ACCESS),
+                    Parameter(
+                        "metadata", ParamType.LIST, element_type=ParamType.STRING
+                    ),
+                ),
+                audit_type=AuditType.NONE,
+                audit_name="upload",
+                authorization=ApiAuthorizationType.NONE,
+            ),
+            ApiSchema(
+                ApiMethod.PUT,
+                OperationCode.UPDATE,
+                uri_schema=Schema(
+                    Parameter("session", ParamType.STRING, required=True)
+                ),
+                audit_type=AuditType.NONE,
+                authorization=ApiAuthorizationType.NONE,
+            ),
+            ApiSchema(
+                ApiMethod.GET,
+                OperationCode.READ,
+                uri_schema=Schema(
+                    Parameter("session", ParamType.STRING, required=True)
+                ),
+                authorization=ApiAuthorizationType.NONE,
+            ),
+            ApiSchema(
+                ApiMethod.DELETE,
+                OperationCode.DELETE,
+                uri_schema=Schema(
+                    Parameter("session", ParamType.STRING, required=True)
+                ),
+                audit_type=AuditType.NONE,
+                authorization=ApiAuthorizationType.NONE,
+            ),
+        )
+        self.sessions = self.temporary / self.SESSIONS
+
+    @staticmethod
+    def _user_id() -> str:
+        """Identify the authenticated client
+
+        Returns:
+            The user ID of the authenticated client
+
+        Raises:
+            APIAbort(UNAUTHORIZED) if the client is not authenticated
+        """
+        user = Auth.token_auth.current_user()
+        if not user:
+            raise APIAbort(
+                HTTPStatus.UNAUTHORIZED,
+                "User provided access_token is invalid or expired",
+            )
+        return user.id
+
+    def _session(self, args: ApiParams) -> tuple[Path, JSONOBJECT]:
+        """Locate an upload session owned by the authenticated client
+
+        Args:
+            args: API parameters, including the "session" URI parameter
+
+        Returns:
+            The session directory and the session state
+
+        Raises:
+            APIAbort(NOT_FOUND) if the client has no such upload session
+        """
+        user_id = self._user_id()
+        session = args.uri["session"]
+        state = None
+        session_dir = self.sessions / session
+        if os.path.basename(session) == session and not session.startswith("."):
+            try:
+                state = json.loads((session_dir / self.STATE).read_text())
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                raise APIInternalError(
+                    f"Unable to read upload session {session}: {e}"
+                ) from e
+        if not state or state["user"] != user_id:
+            raise APIAbort(HTTPStatus.NOT_FOUND, f"No upload session {session!r}")
+        return session_dir, state
+
+    def _received(self, session_dir: Path) -> list[list[int]]:
+        """Report the byte ranges received by an upload session
+
+        Args:
+            session_dir: The session directory
+
+        Returns:
+            A sorted list of non-overlapping [first, last] byte ranges (each
+            inclusive, as in a "Content-Range" header)
+        """
+        ranges = []
+        for marker in (session_dir / self.RANGES).iterdir():
+            first, last = marker.name.split("-")
+            ranges.append((int(first), int(last)))
+        received = []
+        for first, last in sorted(ranges):
+            if received and first <= received[-1][1] + 1:
+                received[-1][1] = max(received[-1][1], last)
+            else:
+                received.append([first, last])
+        return received
+
+    def _status(self, session_dir: Path, state: JSONOBJECT) -> JSONOBJECT:
+        """Describe an upload session for the client
+
+        Args:
+            session_dir: The session directory
+            state: The session state
+
+        Returns:
+            A JSON object describing the session
+        """
+        return {
+            "name": state["name"],
+            "resource_id": state["md5"],
+            "length": state["length"],
+            "received": self._received(session_dir),
+        }
+
+    def _expire(self):
+        """Remove upload sessions which have been abandoned by their clients
+
+        Each range transferred updates the modification time of the session
+        directory (see _put), so we remove any session which hasn't been
+        modified within the configured number of hours.
+        """
+        hours = self.config.getint(
+            "pbench-server", "upload-session-expiry", fallback=48
+        )
+        cutoff = time.time() - hours * 60 * 60
+        try:
+            sessions = list(self.sessions.iterdir())
+        except FileNotFoundError:
+            return
+        for session_dir in sessions:
+            try:
+                if session_dir.stat().st_mtime < cutoff:
+                    shutil.rmtree(session_dir)
+                    current_app.logger.info(
+                        "INTAKE session {} expired", session_dir.name
+                    )
+            except Exception as e:
+                current_app.logger.warning(
+                    "Unable to expire upload session {}: {}", session_dir.name, e
+                )
+
+    def _create(self, args: ApiParams, request: Request) -> Response:
+        """Create, or resume, an upload session
+
+        Args:
+            args: API parameters
+                Query parameters
+                    filename: The name of the tarball
+                    length: The total length of the tarball in bytes
+                    access: The desired access policy (default is "private")
+                    metadata: Metadata key/value pairs to set on dataset
+            request: The Flask request object, with the tarball MD5 as the
+                "Content-MD5" header
+
+        Returns:
+            A response describing the session: 201 (CREATED) for a new
+            session, or 200 (OK) to resume an existing session.
+        """
+        user_id = self._user_id()
+        filename = args.query.get("filename")
+        length = args.query.get("length")
+        md5 = request.headers.get("Content-MD5")
+        if not filename or not md5 or length is None:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST,
+                "An upload session requires a filename, a length, and a 'Content-MD5' header",
+            )
+        if (
+            os.path.basename(filename) != filename
+            or os.path.basename(md5) != md5
+            or md5.startswith(".")
+        ):
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST, "Filename and MD5 must not contain a path"
+            )
+        if not Dataset.is_tarball(filename):
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST,
+                f"File extension not supported, must be {Dataset.TARBALL_SUFFIX}",
+            )
+        if length <= 0:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST, f"Length {length} must be greater than 0"
+            )
+        try:
+            Dataset.query(resource_id=md5)
+        except DatasetNotFound:
+            pass
+        else:
+            response = jsonify(
+                {
+                    "message": "Dataset already exists",
+                    "name": Dataset.stem(filename),
+                    "resource_id": md5,
+                }
+            )
+            response.status_code = HTTPStatus.OK
+            return response
+
+        # Validate the metadata now so that the client doesn't transfer the
+        # whole tarball only to have it rejected.
+        metadata = args.query.get("metadata", [])
+        self.process_metadata(metadata)
+
+        state = {
+            "name": filename,
+            "md5": md5,
+            "length": length,
+            "access": args.query.get("access", Dataset.PRIVATE_ACCESS),
+            "metadata": metadata,
+            "user": user_id,
+        }
+        self._expire()
+        session_dir = self.sessions / md5
+        status = HTTPStatus.CREATED
+        try:
+            self.sessions.mkdir(exist_ok=True)
+            session_dir.mkdir()
+        except FileExistsError:
+            try:
+                existing = json.loads((session_dir / self.STATE).read_text())
+            except Exception:
+                existing = None
+            if existing != state:
+                raise APIAbort(
+                    HTTPStatus.CONFLICT,
+                    "Dataset is currently being uploaded",
+                )
+            status = HTTPStatus.OK
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise APIAbort(HTTPStatus.INSUFFICIENT_STORAGE, "Out of space")
+            raise APIInternalError(f"Unable to create upload session: {e}") from e
+        else:
+            try:
+                (session_dir / self.RANGES).mkdir()
+                with (session_dir / self.DATA).open("wb") as f:
+                    f.truncate(length)
+                (session_dir / self.STATE).write_text(json.dumps(state))
+            except Exception as e:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                if isinstance(e, OSError) and e.errno == errno.ENOSPC:
+                    raise APIAbort(HTTPStatus.INSUFFICIENT_STORAGE, "Out of space")
+                raise APIInternalError(f"Unable to create upload session: {e}") from e
+            current_app.logger.info(
+                "INTAKE session {} for {} ({} bytes) by {}",
+                md5,
+                filename,
+                length,
+                user_id,
+            )
+
+        response = jsonify(self._status(session_dir, state))
+        response.headers["location"] = f"{request.base_url}/{md5}"
+        response.status_code = status
+        return response
+
+    def _identify(self, args: ApiParams, request: Request) -> Intake:
+        """Identify the tarball assembled by an upload session.
+
+        The "uri" of the Intake object is the path of the assembled tarball.
+
+        Args:
+            args: API parameters
+                URI parameters: the session
+            request: The original Request object
+
+        Returns:
+            An Intake object capturing the critical information
+        """
+        session_dir, state = self._session(args)
+        return Intake(
+            state["name"],
+            state["md5"],
+            state["access"],
+            state["metadata"],
+            uri=str(session_dir / self.DATA),
+        )
+
+    def _stream(self, intake: Intake, request: Request) -> Access:
+        """Access the tarball assembled by an upload session
+
+        Args:
+            intake: The Intake parameters produced by _identify
+            request: The Flask request object
+
+        Returns:
+            An Access object with the data byte stream and length
+        """
+        data = Path(intake.uri)
+        return Access(data.stat().st_size, data.open("rb"))
+
+    def _post(self, args: ApiParams, req: Request, context: ApiContext) -> Response:
+        """Create an upload session, or complete the upload
+
+        Completing the upload requires that all of the tarball's bytes have
+        been received; the assembled tarball is then processed exactly as a
+        single PUT upload, and on success the session is removed.
+        """
+        if not args.uri.get("session"):
+            return self._create(args, req)
+
+        session_dir, state = self._session(args)
+        received = self._received(session_dir)
+        if received != [[0, state["length"] - 1]]:
+            raise APIAbort(
+                HTTPStatus.CONFLICT,
+                f"Upload of {state['name']} is incomplete",
+                received=received,
+            )
+        response = self._intake(args, req, context)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return response
+
+    def _put(self, args: ApiParams, req: Request, context: ApiContext) -> Response:
+        """Receive a range of the tarball
+
+        The range is given by a "Content-Range" header, in the form
+        "bytes <first>-<last>/<length>". If the request has a "Content-MD5"
+        header, the MD5 of the range must match it. The range is recorded as
+        received only after it has been completely written and verified, so
+        an interrupted transfer can simply be retried.
+        """
+        session_dir, state = self._session(args)
+
+        # Neither spooling nor writing a range modifies the session directory
+        # itself, so mark the session as active explicitly, both now, so that
+        # it can't expire during the transfer, and once the range is recorded.
+        os.utime(session_dir)
+        content_range = req.headers.get("Content-Range", "")
+        match = self.CONTENT_RANGE.fullmatch(content_range)
+        if not match:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST,
+                f"Missing or invalid 'Content-Range' header {content_range!r}",
+            )
+        first = int(match.group("first"))
+        last = int(match.group("last"))
+        length = last - first + 1
+        if (
+            int(match.group("length")) != state["length"]
+            or last < first
+            or last >= state["length"]
+        ):
+            raise APIAbort(
+                HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                f"Range {content_range!r} is not within {state['length']} bytes",
+            )
+        if req.content_length != length:
+            raise APIAbort(
+                HTTPStatus.BAD_REQUEST,
+                f"'Content-Length' {req.content_length} does not match range {content_range!r}",
+            )
+
+        # Spool the range to a temporary file, and copy it into the tarball
+        # only once it has been completely received and verified, so that a
+        # bad range can't overwrite bytes we've already received.
+        hash_md5 = hashlib.md5()
+        received = 0
+        try:
+            with tempfile.TemporaryFile(dir=session_dir, prefix="range.") as spool:
+                while received < length:
+                    chunk = req.stream.read(min(self.CHUNK_SIZE, length - received))
+                    if not chunk:
+                        break
+                    spool.write(chunk)
+                    hash_md5.update(chunk)
+                    received += len(chunk)
+
+                if received != length:
+                    raise APIAbort(
+                        HTTPStatus.BAD_REQUEST,
+                        f"Expected {length} bytes but received {received} bytes",
+                    )
+                md5: Optional[str] = req.headers.get("Content-MD5")
+                if md5 and hash_md5.hexdigest() != md5:
+                    raise APIAbort(
+                        HTTPStatus.BAD_REQUEST,
+                        f"MD5 checksum {hash_md5.hexdigest()} does not match expected {md5}",
+                    )
+
+                spool.seek(0)
+                fd = os.open(session_dir / self.DATA, os.O_WRONLY)
+                try:
+                    offset = first
+                    while chunk := spool.read(self.CHUNK_SIZE):
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except OSError as exc:
+            if exc.errno == errno.ENOSPC:
+                raise APIAbort(HTTPStatus.INSUFFICIENT_STORAGE, "Out of space")
+            raise APIInternalError(
+                f"Unexpected error encountered during range upload: {str(exc)!r}"
+            ) from exc
+
+        try:
+            (session_dir / self.RANGES / f"{first}-{last}").touch()
+            os.utime(session_dir)
+        except Exception as e:
+            raise APIInternalError(f"Unable to record range {first}-{last}: {e}")
+        return jsonify(self._status(session_dir, state))
+
+    def _get(self, args: ApiParams, req: Request, context: ApiContext) -> Response:
+        """Report the status of an upload session"""
+        session_dir, state = self._session(args)
+        return jsonify(self._status(session_dir, state))
+
+    def _delete(self, args: ApiParams, req: Request, context: ApiContext) -> Response:
+        """Abandon an upload session"""
+        session_dir, state = self._session(args)
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return jsonify({"message": f"Upload session for {state['name']} removed"})
@@ -1,20 +1,173 @@
+from collections import OrderedDict
+import hashlib
 from http import HTTPStatus
+from threading import Lock
+import time
 from typing import Optional
 
 from flask import current_app, Flask, request
 from flask_httpauth import HTTPTokenAuth
 from flask_restful import abort
 from jwt import ExpiredSignatureError
+from sqlalchemy.orm import make_transient_to_detached
 from werkzeug.exceptions import Unauthorized
 
 from pbench.server import PbenchServerConfig
 from pbench.server.auth import OpenIDClient
+from pbench.server.database.database import Database
 from pbench.server.database.models.api_keys import APIKey
 from pbench.server.database.models.users import Roles, User, UserDuplicate
 
+
+class TokenCache:
+    """A bounded cache of verified authorization tokens.
+
+    Verifying a token requires a database query for API keys, and for OIDC
+    tokens, decoding and validating the JWT and then creating or updating the
+    User row. Clients which make many calls with the same token can skip all
+    of that while the token's verification is cached.
+
+    Tokens are identified by a SHA-256 digest rather than by value, and each
+    entry records the identity of the verified user, which is attached to the
+    current database session without a query on a cache hit.
+
+    An entry expires after the cache's TTL, or at the token's own expiration
+    time if that's sooner. Deleting an API key removes it from the cache of
+    the server process handling the deletion; the TTL bounds how long other
+    server processes may continue to accept it.
+
+    The cache counters are reported periodically in the server log for
+    monitoring.
+    """
+
+    # The minimum number of seconds between reports of the cache counters.
+    REPORT_INTERVAL = 300.0
+
+    def __init__(self, size: int = 1024, ttl: float = 60.0):
+        """Construct an empty cache.
+
+        Args:
+            size: The maximum number of cached tokens (0 disables caching)
+            ttl: The maximum number of seconds a token remains cached
+        """
+        self.size = size
+        self.ttl = ttl
+        self.entries: OrderedDict[
+            str, tuple[float, str, str, list[str]]
+        ] = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reported = time.time()
+
+    @staticmethod
+    def digest(token: str) -> str:
+        """Compute the cache key for a token."""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def lookup(self, token: str) -> Optional[User]:
+        """Find the verified user of a cached token.
+
+        Args:
+            token: The authorization token
+
+        Returns:
+            The User associated with the token, or None if the token isn't
+            cached or its cache entry has expired.
+        """
+        if self.size <= 0:
+            return None
+        key = self.digest(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] <= time.time():
+                del self.entries[key]
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+        _, user_id, username, roles = entry
+        user = User(id=user_id, username=username, roles=roles)
+        make_transient_to_detached(user)
+        return Database.db_session.merge(user, load=False)
+
+    def store(self, token: str, user: User, expires: Optional[float] = None):
+        """Cache the verified user of a token.
+
+        Args:
+            token: The authorization token
+            user: The verified User
+            expires: The token's expiration time, if any, in seconds since
+                the epoch
+        """
+        if self.size <= 0:
+            return
+        limit = time.time() + self.ttl
+        entry = (
+            min(limit, expires) if expires else limit,
+            user.id,
+            user.username,
+            user.roles,
+        )
+        key = self.digest(token)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token: str):
+        """Remove a token from the cache.
+
+        Args:
+            token: The authorization token
+        """
+        with self.lock:
+            self.entries.pop(self.digest(token), None)
+
+    def clear(self):
+        """Remove all tokens from the cache."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Report the cache counters for monitoring.
+
+        Returns:
+            The number of cached tokens, and the number of cache hits, misses,
+            and evictions.
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def report(self) -> Optional[dict[str, int]]:
+        """Report the cache counters if they're due to be reported.
+
+        Returns:
+            The cache counters (see `stats`) if at least REPORT_INTERVAL
+            seconds have passed since they were last reported, otherwise None
+        """
+        now = time.time()
+        with self.lock:
+            if now - self.reported < self.REPORT_INTERVAL:
+                return None
+            self.reported = now
+        return self.stats()
+
+
 # Module public
 token_auth = HTTPTokenAuth("Bearer")
 oidc_client: Optional[OpenIDClient] = None
+token_cache = TokenCache()
 
 
 def setup_app(app: Flask, server_config: PbenchServerConfig):
@@ -25,7 +178,8 @@ def setup_app(app: Flask, server_config: PbenchServerConfig):
     value in the Pbench Server "flask-app" section.
 
     We attempt to construct an OpenID Client object for third party token
-    verification if the configuration is provided.
+    verification if the configuration is provided, and construct the cache of
+    verified tokens.
 
     Args:
         app : the Flask application object
@@ -39,6 +193,12 @@ def setup_app(app: Flask, server_config: PbenchServerConfig):
     except OpenIDClient.NotConfigured:
         oidc_client = None
 
+    global token_cache
+    token_cache = TokenCache(
+        size=server_config.getint("pbench-server", "token-cache-size", fallback=1024),
+        ttl=server_config.getint("pbench-server", "token-cache-ttl", fallback=60),
+    )
+
 
 def get_current_user_id() -> Optional[str]:
     """Return the user ID associated with the authentication token.
@@ -141,14 +301,25 @@ def verify_auth_oidc(auth_token: str) -> Optional[User]:
     we'll create or update a User record so we can translate the user UUID to
     a username.
 
+    Successfully verified tokens are cached, so that repeated use of the same
+    token doesn't repeat the verification.
+
     Args:
         auth_token : Token to authenticate
 
     Returns:
         User object if the verification succeeds, None on failure.
     """
+    user = token_cache.lookup(auth_token)
+    stats = token_cache.report()
+    if stats:
+        current_app.logger.info("Token cache {}", stats)
+    if user:
+        return user
+
     user = verify_auth_api_key(auth_token)
     if user:
+        token_cache.store(auth_token, user)
         return user
 
     # If it's not an API key, try decoding it as an OIDC token.
@@ -183,4 +354,9 @@ def verify_auth_oidc(auth_token: str) -> Optional[User]:
             )
     else:
         user.update(username=username, roles=roles)
+    try:
+        expires = float(token_payload["exp"])
+    except (KeyError, TypeError, ValueError):
+        expires = None
+    token_cache.store(auth_token, user, expires)
     return user
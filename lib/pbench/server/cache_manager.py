@@ -1,16 +1,21 @@
-from collections import deque
+from collections import Counter, deque
 from dataclasses import dataclass
 from datetime import datetime
 from enum import auto, Enum
 import errno
 import fcntl
+import json
 from logging import Logger
+import lzma
 import math
 import os
 from pathlib import Path
 import shlex
 import shutil
 import subprocess
+import tarfile
+import tempfile
+import threading
 import time
 from typing import Any, IO, Optional, Union
 
@@ -18,7 +23,13 @@ import humanize
 from sqlalchemy import and_
 
 from pbench.common import MetadataLog, selinux
-from pbench.server import JSONOBJECT, OperationCode, PathLike, PbenchServerConfig
+from pbench.server import (
+    JSONARRAY,
+    JSONOBJECT,
+    OperationCode,
+    PathLike,
+    PbenchServerConfig,
+)
 from pbench.server.database.database import Database
 from pbench.server.database.models.audit import Audit, AuditStatus, AuditType
 from pbench.server.database.models.datasets import Dataset, DatasetNotFound, Metadata
@@ -204,6 +215,86 @@ CacheMapEntry = dict[str, Union[CacheObject, "CacheMap"]]
 CacheMap = dict[str, CacheMapEntry]
 
 
+def _encode_map(entry: CacheMapEntry) -> JSONARRAY:
+    """Encode a cache map entry in a compact JSON form
+
+    The entry name and location are implied by the position of the entry
+    within the map, so each entry is encoded as a list of
+
+        [<type>, <size>, <resolve_path>, <resolve_type>]
+
+    with a fifth element mapping the names of a directory's children to
+    their encoded entries.
+
+    Args:
+        entry: a cache map entry
+
+    Returns:
+        The JSON encoding of the entry
+    """
+    details: CacheObject = entry["details"]
+    encoded = [
+        details.type.name,
+        details.size,
+        str(details.resolve_path) if details.resolve_path else None,
+        details.resolve_type.name if details.resolve_type else None,
+    ]
+    if "children" in entry:
+        encoded.append({n: _encode_map(c) for n, c in entry["children"].items()})
+    return encoded
+
+
+def _decode_map(encoded: JSONARRAY, location: Path) -> CacheMapEntry:
+    """Decode a cache map entry from the compact JSON form
+
+    Args:
+        encoded: the JSON encoding of a cache map entry
+        location: the relative path of the entry within the tarball
+
+    Returns:
+        The cache map entry
+    """
+    ftype, size, resolve_path, resolve_type = encoded[:4]
+    entry: CacheMapEntry = {
+        "details": CacheObject(
+            name=location.name,
+            location=location,
+            resolve_path=Path(resolve_path) if resolve_path else None,
+            resolve_type=CacheType[resolve_type] if resolve_type else None,
+            size=size,
+            type=CacheType[ftype],
+        )
+    }
+    if len(encoded) > 4:
+        entry["children"] = {
+            n: _decode_map(c, location / n) for n, c in encoded[4].items()
+        }
+    return entry
+
+
+def _write_json(path: Path, value: Any):
+    """Atomically replace a JSON file
+
+    The value is written to a uniquely named temporary file in the same
+    directory, which is then renamed over the target, so that concurrent
+    writers never share a file and a reader never sees a partial file.
+
+    Args:
+        path: the JSON file path
+        value: the JSON value to write
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, prefix=f".{path.name}.", delete=False
+    ) as fp:
+        try:
+            json.dump(value, fp, separators=(",", ":"))
+            fp.close()
+            os.replace(fp.name, path)
+        except Exception:
+            Path(fp.name).unlink(missing_ok=True)
+            raise
+
+
 class LockRef:
     """Keep track of a cache lock passed off to a caller"""
 
@@ -438,6 +529,23 @@ class Tarball:
     TAR_EXEC_TIMEOUT = 60.0
     TAR_EXEC_WAIT = 0.02
 
+    # The contents of these files, relative to the dataset root directory,
+    # are kept in the member index (if they're no bigger than INLINE_LIMIT
+    # bytes) so that they can be read without touching the tarball at all.
+    INLINE_MEMBERS = frozenset(("metadata.log", "result.csv"))
+    INLINE_LIMIT = 1024 * 1024
+
+    # The format version of the member index; an index with an older format
+    # is ignored, and rebuilt when a complete member list is needed.
+    MEMBER_INDEX_VERSION = 2
+
+    # The maximum number of links followed to find a member's file data.
+    MAX_LINK_DEPTH = 8
+
+    # A known Tarball is revalidated against the on-disk state when it's
+    # looked up, no more often than every REFRESH_TTL seconds.
+    REFRESH_TTL = 30.0
+
     def __init__(self, path: Path, resource_id: str, controller: "Controller"):
         """Construct a `Tarball` object instance
 
@@ -456,12 +564,11 @@ class Tarball:
         # logic
         self.resource_id: str = resource_id
 
-        # Record the Dataset record
-        try:
-            dataset = Dataset.query(resource_id=resource_id)
-            self.dataset = dataset
-        except DatasetNotFound:
-            self.dataset = None
+        # Record the Dataset record, and the database session to which it
+        # belongs: see the `dataset` property.
+        self._dataset: Optional[Dataset] = None
+        self._dataset_session = None
+        self.dataset = self._query_dataset()
 
         # Record a backlink to the containing controller object
         self.controller: Controller = controller
@@ -484,6 +591,25 @@ class Tarball:
         # Record hierarchy of a Tar ball
         self.cachemap: Optional[CacheMapEntry] = None
 
+        # Record the path of the persistent cache map index, which remains
+        # valid as long as the dataset exists, even after the unpacked tree
+        # has been reclaimed.
+        self.cachemap_path: Path = self.cache / "cachemap.json"
+
+        # Record the members of the tarball, in archive order, with their
+        # attributes and the offsets of regular files in the uncompressed tar
+        # stream, and the path of the persistent member index built at intake.
+        self.members: Optional[dict[str, JSONOBJECT]] = None
+        self.members_path: Path = self.cache / "members.json"
+
+        # Serialize building the member index on demand.
+        self.member_index_lock = threading.Lock()
+
+        # Record the directory hierarchy described by the member index, as a
+        # map from each directory name to its child members, when needed to
+        # list directory contents.
+        self.member_dirs: Optional[dict[str, dict[str, JSONOBJECT]]] = None
+
         # Record the base of the unpacked files for cache management, which
         # is (self.cache / self.name) and will be None when the cache is
         # inactive.
@@ -508,6 +634,43 @@ class Tarball:
         # Cache results metadata when it's been processed
         self.metadata: Optional[JSONOBJECT] = None
 
+        # Record when the object was last revalidated: see `refresh`.
+        self.refreshed: float = time.time()
+
+    @staticmethod
+    def _current_session():
+        """Return the current thread's database session, if any."""
+        return Database.db_session() if Database.db_session else None
+
+    def _query_dataset(self) -> Optional[Dataset]:
+        """Query the Dataset record for the tarball.
+
+        Returns:
+            The Dataset, or None if it doesn't exist
+        """
+        try:
+            return Dataset.query(resource_id=self.resource_id)
+        except DatasetNotFound:
+            return None
+
+    @property
+    def dataset(self) -> Optional[Dataset]:
+        """The Dataset record for the tarball.
+
+        A Tarball object may be retained across API requests, each of which
+        has its own database session, and a Dataset object from an earlier
+        session can't be used safely. The Dataset is re-queried the first time
+        it's needed in a new session, rather than on every lookup.
+        """
+        if self._dataset_session is not self._current_session():
+            self.dataset = self._query_dataset()
+        return self._dataset
+
+    @dataset.setter
+    def dataset(self, dataset: Optional[Dataset]):
+        self._dataset = dataset
+        self._dataset_session = self._current_session()
+
     def check_unpacked(self):
         """Determine whether a tarball has been unpacked.
 
@@ -517,6 +680,25 @@ class Tarball:
         if unpack.is_dir():
             self.unpacked = unpack
 
+    def refresh(self) -> bool:
+        """Revalidate a known Tarball against the current on-disk state.
+
+        A Tarball object retained across requests may have been changed by
+        another process: the dataset may have been deleted, or the unpacked
+        cache may have been reclaimed or created.
+
+        Returns:
+            True if the tarball still exists, or False if the object is stale
+        """
+        if not self.tarball_path or not self.tarball_path.exists():
+            return False
+        if self.unpacked and not self.unpacked.is_dir():
+            self.unpacked = None
+        elif not self.unpacked:
+            self.check_unpacked()
+        self.refreshed = time.time()
+        return True
+
     # Most of the "operational" methods below this point should be called only
     # through Controller and/or CacheManager methods, in order to properly manage
     # aspects of the cache manager structure outside the scope of the Tarball.
@@ -642,6 +824,9 @@ class Tarball:
         This must be called with the cache locked (shared lock is enough)
         and unpacked.
 
+        The map is also saved to the cache map index so that it can be
+        loaded later without walking the unpacked tree.
+
         NOTE: this structure isn't removed when we release the cache, as the
         data remains valid so long as the dataset exists.
         """
@@ -660,6 +845,292 @@ class Tarball:
             parent_map["children"] = curr
 
         self.cachemap = cmap
+        self.save_map()
+
+    def save_map(self):
+        """Save the cache map index
+
+        The index is written to a temporary file and renamed so that a
+        concurrent reader will never see a partial index. Failure is logged,
+        but isn't fatal as we can always rebuild the map from the unpacked
+        tree.
+        """
+        try:
+            _write_json(self.cachemap_path, _encode_map(self.cachemap))
+        except Exception as e:
+            self.logger.warning("{}: unable to save cache map: {}", self.name, e)
+
+    def load_map(self) -> bool:
+        """Load the cache map from the cache map index, if it exists
+
+        Returns:
+            True if the cache map was loaded
+        """
+        if not self.cachemap_path.exists():
+            return False
+        try:
+            with self.cachemap_path.open("r") as fp:
+                self.cachemap = _decode_map(json.load(fp), Path("."))
+        except Exception as e:
+            self.logger.warning("{}: unable to load cache map: {}", self.name, e)
+            return False
+        return True
+
+    def build_member_index(self):
+        """Build and save the member index
+
+        Stream through the tarball once, recording the type, mode, mtime and
+        size of every member, the offset of each regular file member within
+        the uncompressed tar stream, and the target of each link; the
+        contents of small INLINE_MEMBERS files are recorded as well. This
+        allows `read_member` to find a single file without extracting the
+        tarball or scanning it with tar(1), and `get_members` to list the
+        tarball without decompressing it again.
+
+        The index is written to a temporary file and renamed so that a
+        concurrent reader will never see a partial index. Failure is logged,
+        but isn't fatal as we can always fall back to unpacking the tarball.
+        """
+        members: dict[str, JSONOBJECT] = {}
+        try:
+            with tarfile.open(self.tarball_path, mode="r|*") as tar:
+                for member in tar:
+                    name = os.path.normpath(member.name)
+                    entry = {
+                        "type": member.type.decode("ascii"),
+                        "mode": member.mode,
+                        "mtime": member.mtime,
+                        "size": member.size,
+                    }
+                    if member.issym():
+                        entry["linkname"] = member.linkname
+                        entry["target"] = os.path.normpath(
+                            os.path.join(os.path.dirname(name), member.linkname)
+                        )
+                    elif member.islnk():
+                        entry["linkname"] = member.linkname
+                        entry["target"] = os.path.normpath(member.linkname)
+                    elif member.isfile():
+                        entry["offset"] = member.offset_data
+                        _, _, relative = name.partition("/")
+                        if (
+                            relative in self.INLINE_MEMBERS
+                            and member.size <= self.INLINE_LIMIT
+                        ):
+                            try:
+                                data = tar.extractfile(member).read()
+                                entry["data"] = data.decode("utf-8")
+                            except UnicodeDecodeError:
+                                pass
+                    members[name] = entry
+
+            _write_json(
+                self.members_path,
+                {"version": self.MEMBER_INDEX_VERSION, "members": members},
+            )
+        except Exception as e:
+            self.logger.warning("{}: unable to build member index: {}", self.name, e)
+            return
+        self.members = members
+        self.member_dirs = None
+
+    def ensure_member_index(self) -> bool:
+        """Load the member index, building it if it doesn't exist
+
+        Concurrent requests for a dataset without an index build it only
+        once in this process: the others wait for it and then use it.
+
+        Returns:
+            True if the member index is available
+        """
+        if self.members is None and not self.load_member_index():
+            with self.member_index_lock:
+                if self.members is None and not self.load_member_index():
+                    self.build_member_index()
+        return self.members is not None
+
+    def load_member_index(self) -> bool:
+        """Load the member index, if it exists
+
+        Returns:
+            True if the member index was loaded
+        """
+        if not self.members_path.exists():
+            return False
+        try:
+            with self.members_path.open("r") as fp:
+                index = json.load(fp)
+        except Exception as e:
+            self.logger.warning("{}: unable to load member index: {}", self.name, e)
+            return False
+        if index.get("version") != self.MEMBER_INDEX_VERSION:
+            return False
+        self.members = index["members"]
+        self.member_dirs = None
+        return True
+
+    def get_members(self) -> list[tarfile.TarInfo]:
+        """Return a description of every member of the tarball
+
+        The members are described by the member index, which is built now if
+        it doesn't exist (or has an older format), so that the tarball only
+        needs to be decompressed once no matter how often it's listed.
+
+        Returns:
+            A TarInfo object for each member of the tarball, in archive order,
+            with the name, type, mode, mtime, size, and link name of the
+            member (but no offsets or headers)
+        """
+        if not self.ensure_member_index():
+            with tarfile.open(self.tarball_path) as tar:
+                return tar.getmembers()
+        infos = []
+        for name, entry in self.members.items():
+            info = tarfile.TarInfo(name)
+            info.type = entry["type"].encode("ascii")
+            info.mode = entry["mode"]
+            info.mtime = entry["mtime"]
+            info.size = entry["size"]
+            info.linkname = entry.get("linkname", "")
+            infos.append(info)
+        return infos
+
+    def read_member(self, path: str) -> Optional[bytes]:
+        """Read a regular file within the tarball using the member index
+
+        Small files recorded in the index are returned directly; otherwise
+        we decompress the tarball only as far as the end of the member, and
+        without spawning tar(1). A path that isn't a regular file member is
+        rejected without reading the tarball at all.
+
+        Args:
+            path: relative path of a file within the tarball
+
+        Raises:
+            CacheExtractBadPath: the path isn't a regular file in the tarball
+
+        Returns:
+            The file contents, or None if there's no member index
+        """
+        if self.members is None and not self.load_member_index():
+            return None
+        entry = self.members.get(os.path.normpath(f"{self.name}/{path}"))
+        for _ in range(self.MAX_LINK_DEPTH):
+            if not entry or "target" not in entry:
+                break
+            entry = self.members.get(entry["target"])
+        if not entry or "offset" not in entry:
+            raise CacheExtractBadPath(self.tarball_path, path)
+        if "data" in entry:
+            return entry["data"].encode("utf-8")
+        with lzma.open(self.tarball_path) as fp:
+            fp.seek(entry["offset"])
+            return fp.read(entry["size"])
+
+    def get_member_dirs(self) -> dict[str, dict[str, JSONOBJECT]]:
+        """Return the directory hierarchy described by the member index
+
+        A tarball needn't contain explicit members for the directories which
+        contain its files, so directories implied by member names are
+        included as well.
+
+        This must be called with the member index loaded.
+
+        Returns:
+            A map from each directory's member name to a map of the names of
+            its children to their member index entries
+        """
+        if self.member_dirs is None:
+            implied = {"type": tarfile.DIRTYPE.decode("ascii")}
+            dirs: dict[str, dict[str, JSONOBJECT]] = {}
+            for name, entry in self.members.items():
+                if entry["type"] == implied["type"]:
+                    dirs.setdefault(name, {})
+                while "/" in name:
+                    parent, _, child = name.rpartition("/")
+                    children = dirs.setdefault(parent, {})
+                    if children.get(child) is not None:
+                        break
+                    children[child] = self.members.get(name, implied)
+                    name = parent
+            self.member_dirs = dirs
+        return self.member_dirs
+
+    def resolve_member(self, name: str) -> Optional[str]:
+        """Resolve symlinks in a member name using the member index
+
+        This is the equivalent of `os.path.realpath` within the tarball: each
+        component of the name which is a symlink member is replaced by its
+        target. The resolved name needn't correspond to a member.
+
+        This must be called with the member index loaded.
+
+        Args:
+            name: normalized member name
+
+        Returns:
+            The resolved member name, or None if the name resolves outside
+            of the tarball or through too many links
+        """
+        parts = deque(name.split("/"))
+        resolved = ""
+        links = 0
+        while parts:
+            part = parts.popleft()
+            current = os.path.normpath(os.path.join(resolved, part))
+            entry = self.members.get(current)
+            if entry and entry["type"] == tarfile.SYMTYPE.decode("ascii"):
+                links += 1
+                linkname = entry["linkname"]
+                if links > self.MAX_LINK_DEPTH or os.path.isabs(linkname):
+                    return None
+                parts.extendleft(reversed(linkname.split("/")))
+                continue
+            resolved = current
+        if resolved != self.name and not resolved.startswith(f"{self.name}/"):
+            return None
+        return resolved
+
+    def member_type(self, name: str) -> Optional[CacheType]:
+        """Determine the type of a resolved member name
+
+        This must be called with the member index loaded.
+
+        Args:
+            name: resolved member name
+
+        Returns:
+            The type of the member, or None if there's no such member
+        """
+        if name in self.get_member_dirs():
+            return CacheType.DIRECTORY
+        entry = self.members.get(name)
+        if not entry:
+            return None
+        kind = entry["type"].encode("ascii")
+        if kind in tarfile.REGULAR_TYPES or kind == tarfile.LNKTYPE:
+            return CacheType.FILE
+        return CacheType.OTHER
+
+    def member_size(self, name: str) -> int:
+        """Return the size of a resolved regular file member
+
+        The size of a hard link member is the size of its target.
+
+        This must be called with the member index loaded.
+
+        Args:
+            name: resolved member name
+
+        Returns:
+            The size of the file
+        """
+        entry = self.members[name]
+        for _ in range(self.MAX_LINK_DEPTH):
+            if "target" not in entry or entry["target"] not in self.members:
+                break
+            entry = self.members[entry["target"]]
+        return entry["size"]
 
     def find_entry(self, path: Path) -> CacheMapEntry:
         """Locate a node in the cache map
@@ -680,9 +1151,14 @@ class Tarball:
                 " we expect relative path to the root directory."
             )
 
-        if not self.cachemap:
+        # Load the cache map from the index if we can; otherwise we need to
+        # unpack the tarball (which builds the map), or build it from the
+        # existing unpacked tree.
+        if self.cachemap is None and not self.load_map():
             with LockManager(self.lock) as lock:
                 self.get_results(lock)
+                if self.cachemap is None:
+                    self.build_map()
 
         if str(path) == ".":
             return self.cachemap
@@ -805,6 +1281,166 @@ class Tarball:
     def get_contents(self, path: str, origin: str) -> JSONOBJECT:
         """Return a description of a directory.
 
+        The description is normally constructed from the member index, which
+        is built at intake, so that browsing a dataset doesn't require
+        unpacking it into the cache. Only if the index can't be built do we
+        fall back to examining the unpacked tarball.
+
+        Args:
+            path: relative path within the tarball
+            origin: root URI path for the dataset
+
+        Returns:
+            A "json" dict describing the target.
+        """
+        if self.ensure_member_index():
+            return self.get_index_contents(path, origin)
+        return self.get_unpacked_contents(path, origin)
+
+    def get_index_contents(self, path: str, origin: str) -> JSONOBJECT:
+        """Return a description of a directory from the member index
+
+        This reports exactly what `get_unpacked_contents` would report for
+        the unpacked tarball, without unpacking it.
+
+        This must be called with the member index loaded.
+
+        Args:
+            path: relative path within the tarball
+            origin: root URI path for the dataset
+
+        Returns:
+            A "json" dict describing the target.
+        """
+        artifact = os.path.normpath(os.path.join(self.name, path))
+        if artifact != self.name and not artifact.startswith(f"{self.name}/"):
+            raise CacheExtractError(self.name, path)
+        arel = Path(artifact).relative_to(self.name)
+
+        # Resolve any symlinks in the directory containing the target, but
+        # not the target itself.
+        if artifact == self.name:
+            real = artifact
+        else:
+            parent, _, leaf = artifact.rpartition("/")
+            resolved = self.resolve_member(parent)
+            real = f"{resolved}/{leaf}" if resolved else None
+        entry = self.members.get(real) if real else None
+        is_link = bool(entry) and entry["type"] == tarfile.SYMTYPE.decode("ascii")
+        dirs = self.get_member_dirs()
+
+        if real in dirs and not is_link:
+            dir_list = []
+            file_list = []
+            for name, child in dirs[real].items():
+                relative = arel / name
+                member = f"{real}/{name}"
+                if child["type"] == tarfile.SYMTYPE.decode("ascii"):
+                    append_to = file_list
+                    target = self.resolve_member(member)
+                    if target is None:
+                        link = child["linkname"]
+                        uri = f"{origin}/inventory/{relative}"
+                        link_type = CacheType.BROKEN
+                    else:
+                        link = Path(target).relative_to(self.name)
+                        target_type = self.member_type(target)
+                        if target_type is CacheType.DIRECTORY:
+                            uri = f"{origin}/contents/{link}"
+                            link_type = CacheType.DIRECTORY
+                            append_to = dir_list
+                        elif target_type is CacheType.FILE:
+                            uri = f"{origin}/inventory/{link}"
+                            link_type = CacheType.FILE
+                        else:
+                            uri = f"{origin}/inventory/{relative}"
+                            link_type = CacheType.OTHER
+                    append_to.append(
+                        {
+                            "name": name,
+                            "type": CacheType.SYMLINK.name,
+                            "link": str(link),
+                            "link_type": link_type.name,
+                            "uri": uri,
+                        }
+                    )
+                elif self.member_type(member) is CacheType.DIRECTORY:
+                    dir_list.append(
+                        {
+                            "name": name,
+                            "type": CacheType.DIRECTORY.name,
+                            "uri": f"{origin}/contents/{relative}",
+                        }
+                    )
+                else:
+                    t = self.member_type(member)
+                    r = {
+                        "name": name,
+                        "type": t.name,
+                        "uri": f"{origin}/inventory/{relative}",
+                    }
+                    if t is CacheType.FILE:
+                        r["size"] = self.member_size(member)
+                    file_list.append(r)
+
+            # Normalize because we want the "root" directory to be reported as
+            # "" rather than as Path's favored "."
+            loc = str(arel)
+            name = arel.name
+            if loc == ".":
+                loc = ""
+                name = ""
+            dir_list.sort(key=lambda d: d["name"])
+            file_list.sort(key=lambda d: d["name"])
+            return {
+                "name": name,
+                "type": CacheType.DIRECTORY.name,
+                "directories": dir_list,
+                "files": file_list,
+                "uri": f"{origin}/contents/{loc}",
+            }
+
+        access = "inventory"
+        link_type = CacheType.FILE
+        ltype = CacheType.OTHER
+        size = None
+        if is_link:
+            link_type = CacheType.SYMLINK
+            target = self.resolve_member(real)
+            target_type = self.member_type(target) if target else None
+            if target_type is None:
+                ltype = CacheType.BROKEN
+                trel = entry["linkname"]
+            else:
+                trel = Path(target).relative_to(self.name)
+                if target_type is CacheType.DIRECTORY:
+                    access = "contents"
+                    ltype = CacheType.DIRECTORY
+                    arel = trel
+                elif target_type is CacheType.FILE:
+                    ltype = CacheType.FILE
+                    arel = trel
+                    size = self.member_size(target)
+        elif real and self.member_type(real) is CacheType.FILE:
+            size = self.member_size(real)
+        else:
+            link_type = CacheType.OTHER
+
+        val = {
+            "name": Path(artifact).name,
+            "type": link_type.name,
+            "uri": f"{origin}/{access}/{arel}",
+        }
+        if link_type is CacheType.SYMLINK:
+            val["link"] = str(trel)
+            val["link_type"] = ltype.name
+        if size is not None:
+            val["size"] = size
+        return val
+
+    def get_unpacked_contents(self, path: str, origin: str) -> JSONOBJECT:
+        """Return a description of a directory from the unpacked tarball
+
         Args:
             path: relative path within the tarball
             origin: root URI path for the dataset
@@ -1071,6 +1707,11 @@ class Tarball:
             the root Path of the unpacked directory tree
         """
 
+        # The cache may have been reclaimed by another process since we last
+        # looked.
+        if self.unpacked and not self.unpacked.is_dir():
+            self.unpacked = None
+
         if not self.unpacked:
             start = time.time()
             reclaim = start
@@ -1113,6 +1754,8 @@ class Tarball:
                     find_command, self.cache, TarballModeChangeError, self.cache
                 )
                 self.unpacked = self.cache / self.name
+                if not self.cachemap_path.exists():
+                    self.build_map()
             except Exception as e:
                 error = str(e)
                 raise
@@ -1183,6 +1826,15 @@ class Tarball:
         files. There's nothing more we can do.
         """
         self.cache_delete()
+        try:
+            self.cachemap_path.unlink(missing_ok=True)
+        except Exception as e:
+            self.logger.error("cache map delete for {} failed with {}", self.name, e)
+        self.members = None
+        try:
+            self.members_path.unlink(missing_ok=True)
+        except Exception as e:
+            self.logger.error("member index delete for {} failed with {}", self.name, e)
         if self.isolator and self.isolator.exists():
             try:
                 shutil.rmtree(self.isolator)
@@ -1382,6 +2034,37 @@ class CacheManager:
     # discovery will ignore this directory.
     TEMPORARY = "UPLOAD"
 
+    # A CacheManager instance shared by all API requests in a server process,
+    # so that the registry of known controllers and tarballs survives from one
+    # request to the next; see `shared`.
+    _shared: Optional["CacheManager"] = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, options: PbenchServerConfig, logger: Logger) -> "CacheManager":
+        """Return the process-wide shared CacheManager instance.
+
+        The instance is constructed on first use, and replaced if a different
+        server configuration object is presented.
+
+        Args:
+            options: PbenchServerConfig configuration object
+            logger: A Pbench python Logger
+
+        Returns:
+            The shared CacheManager instance
+        """
+        with cls._shared_lock:
+            if cls._shared is None or cls._shared.options is not options:
+                cls._shared = cls(options, logger)
+            return cls._shared
+
+    @classmethod
+    def reset_shared(cls):
+        """Discard the process-wide shared CacheManager instance."""
+        with cls._shared_lock:
+            cls._shared = None
+
     @staticmethod
     def delete_if_empty(directory: Path) -> None:
         """Delete a directory only if it exists and is empty.
@@ -1432,6 +2115,21 @@ class CacheManager:
         # resource_id.
         self.datasets: dict[str, Tarball] = {}
 
+        # Serialize changes to the controller and tarball registries, which
+        # may be shared by concurrent API requests.
+        self.lock = threading.RLock()
+
+        # Record the resource IDs of datasets whose unpacked caches are in use
+        # by this process, and mustn't be reclaimed. A cache lock protects the
+        # cache against other processes, but a process's own lockf(3) locks
+        # never conflict with each other, so a thread reclaiming cache space
+        # could otherwise remove a cache another thread is using.
+        self.in_use: set[str] = set()
+
+        # Count the concurrent users of each dataset marked in use by
+        # `mark_in_use`, which may overlap when the CacheManager is shared.
+        self.in_use_count: Counter[str] = Counter()
+
     def full_discovery(self, search: bool = True) -> "CacheManager":
         """Discover the ARCHIVE and CACHE trees
 
@@ -1594,8 +2292,39 @@ class CacheManager:
         Returns:
             A Tarball object representing the dataset that was found.
         """
-        if dataset_id in self.datasets:
-            return self.datasets[dataset_id]
+        with self.lock:
+            tarball = self.datasets.get(dataset_id)
+        if tarball:
+            if time.time() - tarball.refreshed < Tarball.REFRESH_TTL:
+                return tarball
+
+            # Revalidate outside the registry lock so that we don't hold up
+            # lookups of other datasets.
+            if tarball.refresh():
+                return tarball
+            self.logger.info("{}: dropping stale tarball {}", dataset_id, tarball.name)
+            with self.lock:
+                if self.datasets.get(dataset_id) is tarball:
+                    self.forget(dataset_id)
+        with self.lock:
+            # Another thread may have discovered the dataset meanwhile.
+            tarball = self.datasets.get(dataset_id)
+            if tarball:
+                return tarball
+            return self._find_dataset(dataset_id)
+
+    def _find_dataset(self, dataset_id: str) -> Tarball:
+        """Discover the tarball for a dataset that isn't already known.
+
+        Args:
+            dataset_id: The resource ID of a dataset
+
+        Raises:
+            TarballNotFound: the dataset doesn't have a tarball
+
+        Returns:
+            A Tarball object representing the dataset that was found.
+        """
 
         # The dataset isn't already known; so follow the tarball-path to build
         # just the necessary controller and tarball objects.
@@ -1611,9 +2340,9 @@ class CacheManager:
         if controller_dir.name == dataset_id:
             controller_dir = controller_dir.parent
         found = time.time()
-        controller = self.controllers.get(
-            controller_dir.name, self._add_controller(controller_dir, False)
-        )
+        controller = self.controllers.get(controller_dir.name)
+        if not controller:
+            controller = self._add_controller(controller_dir, False)
         controller._add_if_tarball(tarball, dataset_id)
         self.tarballs.update(controller.tarballs)
         self.datasets.update(controller.datasets)
@@ -1706,17 +2435,28 @@ class CacheManager:
                 controller_name,
             )
 
-        if name in self.tarballs:
-            raise DuplicateTarball(name)
-        if controller_name in self.controllers:
-            controller = self.controllers[controller_name]
-        else:
-            controller = Controller.create(controller_name, self.options, self.logger)
-            self.controllers[controller_name] = controller
-        tarball = controller.create_tarball(tarfile_path)
-        tarball.metadata = metadata
-        self.tarballs[tarball.name] = tarball
-        self.datasets[tarball.resource_id] = tarball
+        with self.lock:
+            known = self.tarballs.get(name)
+            if known:
+                if known.refresh():
+                    raise DuplicateTarball(name)
+                self.forget(known.resource_id)
+            if controller_name in self.controllers:
+                controller = self.controllers[controller_name]
+            else:
+                controller = Controller.create(
+                    controller_name, self.options, self.logger
+                )
+                self.controllers[controller_name] = controller
+            tarball = controller.create_tarball(tarfile_path)
+            tarball.metadata = metadata
+            self.tarballs[tarball.name] = tarball
+            self.datasets[tarball.resource_id] = tarball
+
+        # Building the member index decompresses the whole tarball, so we do
+        # it after releasing the lock to avoid stalling other lookups; any
+        # request for the dataset's contents in the meantime waits for it.
+        tarball.ensure_member_index()
         return tarball
 
     def find_entry(self, dataset_id: str, path: Path) -> dict[str, Any]:
@@ -1766,7 +2506,41 @@ class CacheManager:
         return tarball.get_inventory(target)
 
     def get_inventory_bytes(self, dataset_id: str, target: str) -> str:
+        """Return the contents of a file within a dataset tarball as a string
+
+        If the tarball isn't already unpacked, try to read the file using the
+        member index rather than unpacking the whole tarball.
+
+        Args:
+            dataset_id: Dataset resource ID
+            target: relative file path within the tarball
+
+        Raises:
+            CacheExtractBadPath: the target isn't a file in the tarball
+            CacheExtractError: the file contents can't be read
+
+        Returns:
+            The file contents
+        """
         tarball = self.find_dataset(dataset_id)
+        if not tarball.unpacked:
+            try:
+                data = tarball.read_member(target)
+            except CacheExtractBadPath:
+                raise
+            except Exception as e:
+                self.logger.warning(
+                    "{}: unable to read {} from member index: {}",
+                    tarball.name,
+                    target,
+                    e,
+                )
+                data = None
+            if data is not None:
+                try:
+                    return data.decode("utf-8")
+                except Exception as e:
+                    raise CacheExtractError(tarball.name, target) from e
         info = tarball.get_inventory(target)
         try:
             return info["stream"].read().decode("utf-8")
@@ -1781,16 +2555,68 @@ class CacheManager:
         Args:
             dataset_id: Dataset resource ID to delete
         """
-        try:
-            tarball = self.find_dataset(dataset_id)
-        except TarballNotFound:
-            return
-        name = tarball.name
-        tarball.controller.delete(dataset_id)
-        del self.datasets[dataset_id]
-        del self.tarballs[name]
+        with self.lock:
+            try:
+                tarball = self.find_dataset(dataset_id)
+            except TarballNotFound:
+                return
+            name = tarball.name
+            tarball.controller.delete(dataset_id)
+            del self.datasets[dataset_id]
+            del self.tarballs[name]
 
-        self._clean_empties(tarball.controller_name)
+            self._clean_empties(tarball.controller_name)
+
+    def mark_in_use(self, dataset_ids: list[str]):
+        """Protect the caches of a set of datasets from reclamation.
+
+        Each call must be matched by a call to `release_in_use` for the same
+        datasets: a dataset remains in use until all of its users have
+        released it.
+
+        Args:
+            dataset_ids: Dataset resource IDs
+        """
+        with self.lock:
+            for dataset_id in dataset_ids:
+                self.in_use_count[dataset_id] += 1
+                self.in_use.add(dataset_id)
+
+    def release_in_use(self, dataset_ids: list[str]):
+        """Release datasets marked in use by `mark_in_use`.
+
+        Args:
+            dataset_ids: Dataset resource IDs
+        """
+        with self.lock:
+            for dataset_id in dataset_ids:
+                self.in_use_count[dataset_id] -= 1
+                if self.in_use_count[dataset_id] <= 0:
+                    del self.in_use_count[dataset_id]
+                    self.in_use.discard(dataset_id)
+
+    def forget(self, dataset_id: str):
+        """Remove a dataset from the registry of known tarballs.
+
+        This doesn't touch the ARCHIVE or CACHE trees: it's used when the
+        on-disk tarball has been removed by other means, for example by
+        another server process or when a failed intake is rewound, so that a
+        later lookup will rediscover the current state.
+
+        Args:
+            dataset_id: Dataset resource ID to forget
+        """
+        with self.lock:
+            tarball = self.datasets.pop(dataset_id, None)
+            if not tarball:
+                return
+            if self.tarballs.get(tarball.name) is tarball:
+                del self.tarballs[tarball.name]
+            controller = self.controllers.get(tarball.controller_name)
+            if controller:
+                controller.datasets.pop(dataset_id, None)
+                if controller.tarballs.get(tarball.name) is tarball:
+                    del controller.tarballs[tarball.name]
 
     def reclaim_cache(self, goal_pct: float = 0.0, goal_bytes: int = 0) -> bool:
         """Reclaim unused caches to free disk space.
@@ -1798,8 +2624,8 @@ class CacheManager:
         The cache tree need not be fully discovered at this point; we can
         reclaim cache even on a partial tree. This is driven by discovery of
         the cache directory tree, looking for <resource_id> directories that
-        contain an unpacked tarball root rather than only the `lock` and
-        `last_ref` files.
+        contain an unpacked tarball root rather than only the `lock`,
+        `last_ref`, `cachemap.json`, and `members.json` files.
 
         This is a "best effort" operation. It will free unlocked caches, oldest
         first, until both the goal % and the absolute goal bytes (rounded up to
@@ -1886,6 +2712,9 @@ class CacheManager:
                 target = self.datasets[resource_id]
             else:
                 target = None
+            if resource_id in self.in_use:
+                self.logger.info("RECLAIM: skipping {} because cache is in use", name)
+                continue
             error = None
             try:
                 ts = datetime.fromtimestamp(candidate.last_ref)
@@ -1,5 +1,7 @@
 import datetime
-from typing import Callable, Optional
+from threading import Lock
+import time
+from typing import Any, Callable, Optional
 
 from sqlalchemy import DateTime
 from sqlalchemy.exc import IntegrityError
@@ -54,6 +56,87 @@ class TZDateTime(TypeDecorator):
         return value
 
 
+class ModelCache:
+    """A process-wide read-through cache of values derived from database rows
+    which rarely change, such as server settings and index templates.
+
+    Each value is loaded on first use, and reused until it's invalidated by a
+    write in this process or until the TTL expires; the TTL bounds how long
+    another server process may use a value after it has been changed.
+
+    Cached values are shared by all callers, and must not be modified.
+    """
+
+    def __init__(self, ttl: float):
+        """Construct an empty cache.
+
+        Args:
+            ttl: The maximum number of seconds a value remains cached
+        """
+        self.ttl = ttl
+        self.entries: dict[str, tuple[float, Any]] = {}
+        self.lock = Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, load: Callable[[str], Any]) -> Any:
+        """Return the cached value for a key, loading it if necessary.
+
+        Args:
+            key: The cache key
+            load: Called with the key to load a missing or expired value; any
+                exception it raises is propagated, and nothing is cached
+
+        Returns:
+            The value for the key
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self.generation
+        value = load(key)
+        with self.lock:
+            # Don't cache a value which may have been invalidated while it
+            # was being loaded.
+            if generation == self.generation:
+                self.entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, key: str):
+        """Discard the cached value for a key.
+
+        Args:
+            key: The cache key
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        """Discard all cached values."""
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict[str, int]:
+        """Report the cache counters for monitoring.
+
+        Returns:
+            The number of cached values, and the number of hits and misses.
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
 def decode_sql_error(
     exception: Exception,
     on_null: Callable[[Exception], Exception],
@@ -1,14 +1,26 @@
 import copy
 import datetime
 import enum
+from itertools import chain
 from pathlib import Path
 import re
 from typing import Any, Dict, List, Optional, Union
 
 from dateutil import parser as date_parser
-from sqlalchemy import Column, Enum, event, ForeignKey, Integer, JSON, String, Text
+from sqlalchemy import (
+    and_,
+    Column,
+    Enum,
+    event,
+    ForeignKey,
+    Integer,
+    JSON,
+    or_,
+    String,
+    Text,
+)
 from sqlalchemy.exc import DataError, SQLAlchemyError
-from sqlalchemy.orm import Query, relationship, validates
+from sqlalchemy.orm import Query, relationship, Session, validates
 
 from pbench.server.database.database import Database
 from pbench.server.database.models import decode_sql_error, TZDateTime
@@ -401,7 +413,21 @@ class Dataset(Database.Base):
             metadata_log = Metadata.get(self, Metadata.METALOG).value
         except MetadataNotFound:
             metadata_log = None
-        operations = Operation.by_dataset(self)
+        return self._as_dict(metadata_log, Operation.by_dataset(self))
+
+    def _as_dict(
+        self, metadata_log: Optional[JSON], operations: list["Operation"]
+    ) -> Dict[str, Any]:
+        """Return the dataset as a simple dictionary, given its already
+        loaded `metadata.log` data and operational records.
+
+        Args:
+            metadata_log : The value of the dataset's "metalog" metadata
+            operations : The dataset's operational records
+
+        Returns
+            Dictionary representation of the DB object
+        """
         return {
             "access": self.access,
             "name": self.name,
@@ -582,6 +608,11 @@ class Metadata(Database.Base):
     # "dataset_" prefix to avoid the conflict.
     __tablename__ = "dataset_metadata"
 
+    # A count of the Metadata changes written by this process, which allows
+    # caches of information derived from Metadata to detect that they're
+    # stale. (See the `metadata_flushed` session event listener.)
+    generation = 0
+
     # +++ Standard Metadata keys:
     #
     # Metadata accessible through the API comes from both the parent Dataset
@@ -886,7 +917,125 @@ class Metadata(Database.Base):
             except MetadataNotFound:
                 return None
             value = meta.value
-        name = native_key
+        return __class__._walk(dataset, key, native_key, keys, value)
+
+    @staticmethod
+    def getvalues(
+        datasets: list[Dataset], keys: list[str], user: Optional[User] = None
+    ) -> dict[int, dict[str, Optional[JSON]]]:
+        """Returns the values of the specified metadata keys for each of a
+        list of datasets.
+
+        This is equivalent to calling `getvalue` for each key of each dataset,
+        but reads all of the necessary Metadata rows with a single query (plus
+        one query for the operational records of the datasets if the "dataset"
+        namespace is requested) and resolves the key paths in memory.
+
+        A key which `getvalue` would reject with a MetadataError (an invalid
+        key, or a key path inconsistent with the stored data) has the value
+        None.
+
+        Args:
+            datasets : the datasets
+            keys : hierarchical key paths to fetch
+            user : User-specific key value (used only for "user." namespace)
+
+        Raises:
+            MetadataSqlError : SQL error in retrieval
+
+        Returns:
+            A dict mapping each dataset's row ID to a dict of the requested
+            keys and their values
+        """
+        paths = {}
+        for key in keys:
+            path = key.split(".")
+            paths[key] = path if "" not in path else None
+        natives = {p[0].lower() for p in paths.values() if p}
+        if "dataset" in natives:
+            natives.remove("dataset")
+            natives.add(Metadata.METALOG)
+
+        rows: dict[tuple[int, str], JSON] = {}
+        operations: dict[int, list[Operation]] = {d.id: [] for d in datasets}
+        ids = list(operations.keys())
+        try:
+            if natives and ids:
+                user_key = and_(
+                    Metadata.key == Metadata.USER,
+                    Metadata.user_ref == user.id
+                    if user
+                    else Metadata.user_ref.is_(None),
+                )
+                other_keys = and_(
+                    Metadata.key != Metadata.USER, Metadata.user_ref.is_(None)
+                )
+                for meta in Database.db_session.query(Metadata).filter(
+                    Metadata.dataset_ref.in_(ids),
+                    Metadata.key.in_(natives),
+                    or_(user_key, other_keys),
+                ):
+                    rows[(meta.dataset_ref, meta.key)] = meta.value
+            if Metadata.METALOG in natives and ids:
+                for o in Database.db_session.query(Operation).filter(
+                    Operation.dataset_ref.in_(ids)
+                ):
+                    operations[o.dataset_ref].append(o)
+        except SQLAlchemyError as e:
+            Metadata.logger.error("Can't get metadata {} from DB: {}", keys, str(e))
+            raise MetadataSqlError(e, operation="getvalues", key=keys) from e
+
+        values = {}
+        for dataset in datasets:
+            as_dict = None
+            metadata = {}
+            for key, path in paths.items():
+                if not path:
+                    metadata[key] = None
+                    continue
+                native_key = path[0].lower()
+                if native_key == "dataset":
+                    if as_dict is None:
+                        as_dict = dataset._as_dict(
+                            rows.get((dataset.id, Metadata.METALOG)),
+                            operations[dataset.id],
+                        )
+                    value = as_dict
+                elif (dataset.id, native_key) in rows:
+                    value = rows[(dataset.id, native_key)]
+                else:
+                    metadata[key] = None
+                    continue
+                try:
+                    metadata[key] = __class__._walk(
+                        dataset, key, native_key, path[1:], value
+                    )
+                except MetadataError:
+                    metadata[key] = None
+            values[dataset.id] = metadata
+        return values
+
+    @staticmethod
+    def _walk(
+        dataset: Dataset, key: str, name: str, keys: list[str], value: JSON
+    ) -> Optional[JSON]:
+        """Resolve the remainder of a hierarchical key path within the value
+        of a metadata namespace.
+
+        Args:
+            dataset : associated dataset
+            key : the full hierarchical key path (for errors)
+            name : the name of the namespace
+            keys : the remaining elements of the key path
+            value : the value of the namespace
+
+        Raises:
+            MetadataBadStructure : the key path is inconsistent with the
+                stored data
+
+        Returns:
+            Value of the key path
+        """
         for i in keys:
             # If we have a nested key, and the `value` at this level isn't
             # a dictionary, then the `getvalue` path is inconsistent with
@@ -946,7 +1095,7 @@ class Metadata(Database.Base):
                 target = date_parser.parse(v).astimezone(datetime.timezone.utc)
             except date_parser.ParserError as p:
                 raise MetadataBadValue(dataset, key, v, "date/time") from p
-            max_retention = ServerSetting.get(key=OPTION_DATASET_LIFETIME)
+            max_retention = ServerSetting.get_value(OPTION_DATASET_LIFETIME)
 
             # If 'dataset' was omitted, then assume the current UTC timestamp.
             base_time = (
@@ -954,7 +1103,7 @@ class Metadata(Database.Base):
                 if dataset
                 else datetime.datetime.now(datetime.timezone.utc)
             )
-            maximum = base_time + datetime.timedelta(days=int(max_retention.value))
+            maximum = base_time + datetime.timedelta(days=int(max_retention))
             if target > maximum:
                 raise MetadataBadValue(
                     dataset, key, v, f"date/time before {maximum:%Y-%m-%d}"
@@ -1102,6 +1251,7 @@ class Metadata(Database.Base):
         try:
             __class__._query(dataset, key, user).delete()
             Database.db_session.commit()
+            Metadata.generation += 1
         except SQLAlchemyError as e:
             Metadata.logger.error(
                 "Can't remove {}>>{} from DB: {}", dataset, key, str(e)
@@ -1171,3 +1321,16 @@ def check_required(target, args, kwargs):
         raise MetadataMissingParameter("key")
     if "value" not in kwargs:
         raise MetadataMissingKeyValue(kwargs.get("key"))
+
+
+@event.listens_for(Session, "after_flush")
+def metadata_flushed(session, flush_context):
+    """Listen for session flushes which write Metadata rows, including rows
+    deleted along with their Dataset, and count them as a new Metadata
+    generation.
+    """
+    if any(
+        isinstance(o, Metadata)
+        for o in chain(session.new, session.dirty, session.deleted)
+    ):
+        Metadata.generation += 1
@@ -16,7 +16,7 @@ from sqlalchemy.sql.sqltypes import JSON
 
 from pbench.server import JSONOBJECT, JSONVALUE
 from pbench.server.database.database import Database
-from pbench.server.database.models import decode_sql_error
+from pbench.server.database.models import decode_sql_error, ModelCache
 
 
 class ServerSettingError(Exception):
@@ -193,6 +193,11 @@ class ServerSetting(Database.Base):
 
     KEYS = sorted([s for s in SERVER_SETTINGS_OPTIONS.keys()])
 
+    # Setting values are checked by every API call, but rarely change; a
+    # change made through another server process takes effect here within
+    # the TTL.
+    cache = ModelCache(ttl=10.0)
+
     __tablename__ = "server_settings"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -268,6 +273,25 @@ class ServerSetting(Database.Base):
             raise ServerSettingSqlError(e, operation="get", key=key) from e
         return setting
 
+    @staticmethod
+    def get_value(key: str) -> JSONVALUE:
+        """Return the value of the specified server setting, or its default,
+        through the server setting cache.
+
+        For example, ServerSetting.get_value("dataset-lifetime").
+
+        Args:
+            key : Server setting key name
+
+        Raises:
+            ServerSettingSqlError : problem interacting with Database
+
+        Returns:
+            The setting's JSON value, which is shared with other callers and
+            must not be modified
+        """
+        return __class__.cache.get(key, lambda k: __class__.get(k).value)
+
     @staticmethod
     def set(key: str, value: JSONVALUE) -> "ServerSetting":
         """Update a ServerSetting key with the specified value.
@@ -305,9 +329,8 @@ class ServerSetting(Database.Base):
             requested access, the entire JSON value is returned and should be
             reported to a caller.
         """
-        state = __class__.get(key=OPTION_SERVER_STATE)
-        if state:
-            value = state.value
+        value = __class__.get_value(OPTION_SERVER_STATE)
+        if value:
             status = value[STATE_STATUS_KEY]
             if status == "disabled" or status == "readonly" and not readonly:
                 return value
@@ -333,6 +356,7 @@ class ServerSetting(Database.Base):
         try:
             Database.db_session.add(self)
             Database.db_session.commit()
+            __class__.cache.invalidate(self.key)
         except Exception as e:
             Database.db_session.rollback()
             raise decode_sql_error(
@@ -350,6 +374,7 @@ class ServerSetting(Database.Base):
         """
         try:
             Database.db_session.commit()
+            __class__.cache.invalidate(self.key)
         except Exception as e:
             Database.db_session.rollback()
             raise decode_sql_error(
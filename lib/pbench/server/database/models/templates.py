@@ -1,12 +1,14 @@
 import datetime
 from pathlib import Path
+from typing import Any
 
 from sqlalchemy import Column, event, Integer, String
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy.sql.sqltypes import DateTime, JSON
 
 from pbench.server.database.database import Database
-from pbench.server.database.models import decode_sql_error
+from pbench.server.database.models import decode_sql_error, ModelCache
 
 
 class TemplateError(Exception):
@@ -103,6 +105,11 @@ class Template(Database.Base):
     mappings = Column(JSON, unique=False, nullable=False)
     version = Column(String(255), unique=False, nullable=False)
 
+    # Templates are used by every Elasticsearch query, but change only when
+    # the server is upgraded. The cache holds the column values of each
+    # template rather than an object bound to a particular session.
+    cache = ModelCache(ttl=60.0)
+
     @staticmethod
     def create(**kwargs) -> "Template":
         """A simple factory method to construct a new Template object and
@@ -124,6 +131,11 @@ class Template(Database.Base):
 
         For example, find("run-data").
 
+        The template is read through the template cache, and attached to the
+        current session without a query on a cache hit. The JSON "settings"
+        and "mappings" values are shared with other callers, and must be
+        replaced rather than modified in place.
+
         Args:
             name : Base index name
 
@@ -134,6 +146,26 @@ class Template(Database.Base):
         Returns:
             Template : a template object with the specified base name
         """
+        columns = __class__.cache.get(name, __class__._load)
+        template = Template(**columns)
+        make_transient_to_detached(template)
+        return Database.db_session.merge(template, load=False)
+
+    @staticmethod
+    def _load(name: str) -> dict[str, Any]:
+        """Load the column values of the Template with the specified base
+        name from the database.
+
+        Args:
+            name : Base index name
+
+        Raises:
+            TemplateSqlError : problem interacting with Database
+            TemplateNotFound : the specified template doesn't exist
+
+        Returns:
+            The template's column values, by column name
+        """
         try:
             template = Database.db_session.query(Template).filter_by(name=name).first()
         except SQLAlchemyError as e:
@@ -141,7 +173,7 @@ class Template(Database.Base):
 
         if template is None:
             raise TemplateNotFound(name)
-        return template
+        return {c.name: getattr(template, c.name) for c in Template.__table__.columns}
 
     def __str__(self) -> str:
         """Return a string representation of the template.
@@ -156,6 +188,7 @@ class Template(Database.Base):
         try:
             Database.db_session.add(self)
             Database.db_session.commit()
+            __class__.cache.invalidate(self.name)
         except Exception as e:
             Database.db_session.rollback()
             raise decode_sql_error(
@@ -173,6 +206,7 @@ class Template(Database.Base):
         """
         try:
             Database.db_session.commit()
+            __class__.cache.invalidate(self.name)
         except Exception as e:
             Database.db_session.rollback()
             raise decode_sql_error(
@@ -2,7 +2,8 @@
 result tar balls.
 """
 
-from collections import Counter
+from bisect import bisect_left
+from collections import Counter, defaultdict
 import configparser
 import csv
 from datetime import datetime, timedelta
@@ -18,6 +19,7 @@ import re
 import socket
 import tarfile
 from time import sleep as _sleep
+from typing import Iterator
 from urllib.parse import urlparse
 
 from urllib3 import Timeout
@@ -55,6 +57,11 @@ try:
 except ImportError:
     MockElasticsearch = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 import pyesbulk
 
 # This is the version of this python code. We use the version number to mean
@@ -96,6 +103,10 @@ _op_type = "create"
 _read_timeout = 100000 * 60.0
 _request_timeout = 100000 * 60.0
 
+# Default maximum size of a single bulk indexing request when more than one
+# bulk request is kept in flight.
+_BULK_BYTES = 16 * 1024 * 1024
+
 # global - defaults to normal dict, ordered dict for unit tests
 _dict_const = dict
 
@@ -145,13 +156,33 @@ def get_es(config):
 
     timeoutobj = Timeout(total=1200, connect=10, read=_read_timeout)
     ca_bundle = config.get("Indexing", "ca_bundle")
-    return Elasticsearch(hosts, max_retries=0, timeout=timeoutobj, ca_certs=ca_bundle)
+    # Make sure the connection pool can hold a connection for each in-flight
+    # bulk request.
+    maxsize = max(10, config.getint("Indexing", "bulk_requests", fallback=1))
+    return Elasticsearch(
+        hosts,
+        max_retries=0,
+        timeout=timeoutobj,
+        ca_certs=ca_bundle,
+        maxsize=maxsize,
+    )
 
 
-def es_index(es, actions, errorsfp, logger, _dbg=0):
+def es_index(
+    es, actions, errorsfp, logger, _dbg=0, bulk_requests=1, bulk_bytes=_BULK_BYTES
+):
     """
     es_index Encapsulate the interface to the pyesbulk module index code.
 
+    By default, bulk requests are issued one at a time, so that generating
+    the actions and waiting for each response are strictly serialized. If
+    more than one bulk request is allowed to be in flight, the actions are
+    instead batched by size, up to `bulk_bytes` per request, and sent by
+    `bulk_requests` threads; the action generator is only allowed to get
+    `bulk_requests` batches ahead of the responses.
+
+    Retried actions use the same randomized exponential backoff either way.
+
     Args:
         es ([Elasticsearch]): An Elasticsearch object instance from either
             the "elasticsearch1" (Elasticsearch V1) or "elasticsearch"
@@ -159,12 +190,86 @@ def es_index(es, actions, errorsfp, logger, _dbg=0):
         actions ([type]): Elasticsearch bulk index action tuples
         errorsfp ([type]): A file pointer for error reporting
         logger ([type]): Standard logging object for use by bulk indexer
+        bulk_requests (int): The maximum number of bulk requests in flight
+        bulk_bytes (int): The maximum size of each bulk request in bytes,
+            when more than one request may be in flight
 
     Returns:
         tuple of (start time, end time, indexed count, duplicate count, failed
         count, and retries)
     """
-    return pyesbulk.streaming_bulk(es, actions, errorsfp, logger)
+    if bulk_requests <= 1:
+        return pyesbulk.streaming_bulk(es, actions, errorsfp, logger)
+    return pyesbulk.parallel_bulk(
+        es,
+        actions,
+        errorsfp,
+        logger,
+        max_chunk_bytes=bulk_bytes,
+        thread_count=bulk_requests,
+        queue_size=bulk_requests,
+    )
+
+
+# Encode a python object as canonical JSON, exactly as `json.dumps(obj,
+# sort_keys=True)` would, but without constructing a new encoder each time.
+_json_encode = json.JSONEncoder(sort_keys=True).encode
+
+
+class SourceEncoder:
+    """Encode the source documents of tool data index actions.
+
+    Each document is serialized exactly once: its ID is the MD5 hash of the
+    encoded source, and the same text is handed to the bulk indexer as the
+    pre-encoded "_source" of the action (the Elasticsearch client sends a
+    string source as is), with any fields not covered by the ID appended.
+
+    The "json" encoder produces the canonical text of `json.dumps(source,
+    sort_keys=True)`, so document IDs are the same as those computed by
+    PbenchData.make_source_id(). The "orjson" encoder, available when the
+    orjson module is installed, is several times faster, but its compact
+    text gives the same source a different ID: a dataset re-indexed with a
+    different encoder gets new document IDs.
+    """
+
+    ENCODERS = ("json", "orjson")
+
+    def __init__(self, name: str = "json"):
+        if name not in self.ENCODERS:
+            raise ValueError(
+                f"Unknown JSON encoder {name!r}, expected one of {self.ENCODERS!r}"
+            )
+        if name == "orjson" and orjson is None:
+            raise ValueError("The orjson module is not available")
+        self.name = name
+        if name == "orjson":
+            self.item_separator, self.key_separator = ",", ":"
+            self.encode = self._orjson_encode
+        else:
+            self.item_separator, self.key_separator = ", ", ": "
+            self.encode = _json_encode
+
+    @staticmethod
+    def _orjson_encode(source) -> str:
+        return orjson.dumps(
+            source, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        ).decode("utf-8")
+
+    @staticmethod
+    def source_id(encoded: str) -> str:
+        """Return the document ID (MD5 value) of an encoded source."""
+        return hashlib.md5(encoded.encode("utf-8")).hexdigest()
+
+    def extend(self, encoded: str, extra: str) -> str:
+        """Append the fields of an encoded object to an encoded source.
+
+        The fields must not already be present in the source.
+        """
+        if encoded == "{}":
+            return extra
+        if extra == "{}":
+            return encoded
+        return encoded[:-1] + self.item_separator + extra[1:]
 
 
 class PbenchData:
@@ -218,8 +323,7 @@ class PbenchData:
         """Construct a source ID (MD5 value) by first converting the python object to
         JSON, and then computing the hash of the resulting string.
         """
-        the_bytes = json.dumps(source, sort_keys=True).encode("utf-8")
-        return hashlib.md5(the_bytes).hexdigest()
+        return SourceEncoder.source_id(_json_encode(source))
 
     def mk_abs_timestamp_millis(self, orig_ts):
         """Convert the given millis since the epoch relative or absolute
@@ -1889,6 +1993,41 @@ class ToolData(PbenchData):
             self.basepath = basepath
             self.files = files
 
+    def _source_encoder(self):
+        """Return a function encoding the tool data documents constructed
+        from .csv files, with the same result as the context's
+        SourceEncoder.encode().
+
+        The "run", "iteration", and "sample" metadata of every such document
+        are the same objects, so their JSON is encoded once here, and only
+        the per-document fields are encoded for each document.
+        """
+        encoder = self.idxctx.encoder
+        encode = encoder.encode
+        static = {
+            "run": self.run_metadata,
+            "iteration": self.iteration_metadata,
+            "sample": self.sample_metadata,
+        }
+        plan = []
+        for key in sorted(
+            ("@timestamp", "@timestamp_original", self.toolname, *static)
+        ):
+            prefix = encode(key) + encoder.key_separator
+            if key in static:
+                plan.append((prefix + encode(static[key]), None))
+            else:
+                plan.append((prefix, key))
+        separator = encoder.item_separator
+
+        def encode_source(datum):
+            parts = [
+                text if key is None else text + encode(datum[key]) for text, key in plan
+            ]
+            return "{" + separator.join(parts) + "}"
+
+        return encode_source
+
     def _make_source_unified(self):
         """Create one JSON document per identifier, per timestamp from
         the data found in multiple csv files.
@@ -1923,6 +2062,7 @@ class ToolData(PbenchData):
             { "@timestamp": 00001, "id": "id1", "foo": 2.1, "bar": 5.1 },
             { "@timestamp": 00001, "id": "id2", "foo": 3.1, "bar": 6.1 } ]
         """
+        encode_source = self._source_encoder()
         # Class list is generated from the handler data
         class_list = _dict_const()
         # The metric mapping provides (klass, metric) tuples for a given
@@ -2179,30 +2319,32 @@ class ToolData(PbenchData):
             # names) with the identifiers as additional metadata. Note that we
             # are constructing this document just from the current row of data
             # taken from all .csv files (assumes timestamps are the same).
+            #
+            # The values of each row are converted in one pass over the row,
+            # rather than one at a time as they are stored.
             for fname, row in rows.items():
                 klass, metric, converter = metric_mapping[fname]
-                for i, val in enumerate(row):
-                    if i == 0:
-                        continue
+                fields = field_mapping[fname]
+                if klass is not None:
+                    targets = {i: d[self.toolname][klass] for i, d in datum.items()}
+                else:
+                    targets = {i: d[self.toolname] for i, d in datum.items()}
+                for i, val in enumerate(map(converter, row[1:]), start=1):
                     # Given an fname and a column offset, return the
                     # identifier from the header
-                    identifier, subfield = field_mapping[fname][i]
-                    if klass is not None:
-                        _d = datum[identifier][self.toolname][klass]
-                    else:
-                        _d = datum[identifier][self.toolname]
+                    identifier, subfield = fields[i]
+                    _d = targets[identifier]
                     if subfield:
                         if metric not in _d:
                             _d[metric] = _dict_const()
-                        _d[metric][subfield] = converter(val)
+                        _d[metric][subfield] = val
                     else:
-                        _d[metric] = converter(val)
+                        _d[metric] = val
             # At this point we have fully mapped all data from all .csv files
             # to their proper fields for each identifier. Now we can yield
             # records for each of the identifiers.
             for _id, source in datum.items():
-                source_id = PbenchData.make_source_id(source)
-                yield source, source_id
+                yield source, encode_source(source)
         self.logger.info(
             "tool-data-indexing: tool {}, end unified for {}",
             self.toolname,
@@ -2213,6 +2355,7 @@ class ToolData(PbenchData):
     def _make_source_individual(self):
         """Read .csv files individually, emitting records for each row and
         column coordinate."""
+        encode_source = self._source_encoder()
         for csvf in self.files:
             assert (
                 csvf["header"][0] == "timestamp_ms"
@@ -2243,42 +2386,47 @@ class ToolData(PbenchData):
             prev_val = None
             prev_ts_val = None
             idx = 0
+            width = len(header)
+            names = header[1:]
             self.logger.info(
                 "tool-data-indexing: tool {}, individual start {}",
                 self.toolname,
                 csvf["path"],
             )
             for row in reader:
-                for col, val in enumerate(row):
-                    # The timestamp column is index zero.
-                    if col == 0:
-                        ts_val = self.mk_abs_timestamp_millis(val)
-                        assert (
-                            prev_ts_val is None or prev_ts_val <= ts_val
-                        ), "prev_ts_val ({!r}, {!r}) > first ({!r}, {!r})".format(
-                            prev_ts_val, prev_val, ts_val, val
-                        )
-                        prev_val = val
-                        prev_ts_val = ts_val
-                        datum = _dict_const()
-                        datum["@timestamp"] = ts_val
-                        datum["@timestamp_original"] = str(val)
-                        datum["run"] = self.run_metadata
-                        datum["iteration"] = self.iteration_metadata
-                        datum["sample"] = self.sample_metadata
-                        datum[self.toolname] = _dict_const([("id", datum_id)])
-                        datum[self.toolname]["@idx"] = idx
-                        if klass is not None:
-                            _d = datum[self.toolname][klass] = _dict_const()
-                        else:
-                            _d = datum[self.toolname]
-                        _d[metric] = _dict_const()
-                    else:
-                        column = header[col]
-                        _d[metric][column] = converter(val)
-
-                source_id = PbenchData.make_source_id(datum)
-                yield datum, source_id
+                if not row:
+                    continue
+                # The timestamp column is index zero, the remaining values of
+                # the row are converted in one pass and paired with their
+                # column names from the header.
+                val = row[0]
+                ts_val = self.mk_abs_timestamp_millis(val)
+                assert (
+                    prev_ts_val is None or prev_ts_val <= ts_val
+                ), "prev_ts_val ({!r}, {!r}) > first ({!r}, {!r})".format(
+                    prev_ts_val, prev_val, ts_val, val
+                )
+                if len(row) > width:
+                    raise IndexError(
+                        f"row {idx} of {csvf['path']} has {len(row)} columns,"
+                        f" header has {width}"
+                    )
+                prev_val = val
+                prev_ts_val = ts_val
+                datum = _dict_const()
+                datum["@timestamp"] = ts_val
+                datum["@timestamp_original"] = str(val)
+                datum["run"] = self.run_metadata
+                datum["iteration"] = self.iteration_metadata
+                datum["sample"] = self.sample_metadata
+                datum[self.toolname] = _dict_const([("id", datum_id)])
+                datum[self.toolname]["@idx"] = idx
+                if klass is not None:
+                    _d = datum[self.toolname][klass] = _dict_const()
+                else:
+                    _d = datum[self.toolname]
+                _d[metric] = _dict_const(zip(names, map(converter, row[1:])))
+                yield datum, encode_source(datum)
                 idx += 1
             self.logger.info(
                 "tool-data-indexing: tool {}, individual end {}",
@@ -2569,6 +2717,7 @@ class ToolData(PbenchData):
         Following that timestamp line will be a payload of data formatted in
         one of the supported "sub-formats" (see _subformats array above).
         """
+        encode = self.idxctx.encoder.encode
         for output_file in self.files:
             handler_rec = output_file["handler_rec"]
             subformat = handler_rec["subformat"]
@@ -2591,8 +2740,7 @@ class ToolData(PbenchData):
             path = os.path.join(self.ptb.extracted_root, output_file["path"])
             with open(path, "r") as file_object:
                 for record in func(self, file_object, converter, output_file["path"]):
-                    source_id = PbenchData.make_source_id(record)
-                    yield record, source_id
+                    yield record, encode(record)
 
     def _make_source_json(self):
         """Process JSON files in the form of an outer JSON array of ready to
@@ -2607,6 +2755,7 @@ class ToolData(PbenchData):
         will be indexed into Elasticsearch will convert the "@timetamp"
         value to millis since the epoch.
         """
+        encode = self.idxctx.encoder.encode
         for df in self.files:
             try:
                 with open(os.path.join(self.ptb.extracted_root, df["path"])) as fp:
@@ -2704,8 +2853,7 @@ class ToolData(PbenchData):
 
                 # Any further transformations needed should be done here.
 
-                source_id = PbenchData.make_source_id(source)
-                yield source, source_id
+                yield source, encode(source)
                 idx += 1
             self.logger.info(
                 "tool-data-indexing: tool {}, json end {}", self.toolname, df["path"]
@@ -2714,7 +2862,11 @@ class ToolData(PbenchData):
 
     def make_source(self):
         """Simple jump method to pick the correct source generator based on the
-        handler's prospectus."""
+        handler's prospectus.
+
+        Each generator yields a (source, encoded) tuple for each document,
+        where `encoded` is the source encoded by the context's SourceEncoder.
+        """
         if not self.files:
             # If we do not have any data files for this tool, ignore it.
             return
@@ -3161,6 +3313,38 @@ class Sample:
         self.path = os.path.join(iteration.path, name)
 
 
+class MemberIndex:
+    """An index of the paths of the members of a pbench tar ball.
+
+    Regular file paths are kept in a sorted list, so that the files under a
+    given path prefix are found with a binary search rather than by scanning
+    every member; and the names of the sub-directories of each directory are
+    recorded, so that iteration and sample directories are found directly.
+    """
+
+    def __init__(self, members: list[tarfile.TarInfo]):
+        self.files: list[str] = sorted(m.name for m in members if m.isfile())
+        self.subdirs: dict[str, list[str]] = defaultdict(list)
+        for m in members:
+            if m.isdir():
+                parent, _, name = m.name.rpartition("/")
+                self.subdirs[parent].append(name)
+
+    def files_by_prefix(self, prefix: str) -> Iterator[str]:
+        """Generate the paths of the regular files, in sorted order, which
+        start with the given prefix.
+        """
+        for i in range(bisect_left(self.files, prefix), len(self.files)):
+            name = self.files[i]
+            if not name.startswith(prefix):
+                break
+            yield name
+
+    def subdirectories(self, path: str) -> list[str]:
+        """Return the names of the directories within the given directory."""
+        return self.subdirs.get(path, [])
+
+
 class PbenchTarBall:
     """Encapsulation of the data structures representing the contents of a
     pbench tar ball.
@@ -3194,12 +3378,6 @@ class PbenchTarBall:
         tb_stat = os.stat(self.tbname)
         mtime = datetime.utcfromtimestamp(tb_stat.st_mtime)
 
-        # TODO: Although we index from unpacked files on the file
-        # system, we repeatedly reference the list of TarInfo records from the
-        # Python tarfile package rather than navigating the file tree directly.
-        # This could likely be improved.
-        self.tb = tarfile.open(self.tbname)
-
         # Build a map showing the documents in each Elasticsearch index so we
         # can find them later to UPDATE or DELETE without searching all
         # indices.
@@ -3220,7 +3398,12 @@ class PbenchTarBall:
         # tar ball before we start extracting.
         metadata_log_path = self.dirname + "/metadata.log"
         metadata_log_found = False
-        self.members = self.tb.getmembers()
+        # We index from the unpacked files on the file system, but navigate
+        # them using the list of TarInfo records from the tarball's member
+        # index, captured when the tarball was received, so that we don't
+        # have to decompress the whole tarball again to list its members.
+        self.members = tarobj.get_members()
+        self.member_index = MemberIndex(self.members)
         for m in self.members:
             if m.name == metadata_log_path:
                 metadata_log_found = True
@@ -3430,7 +3613,14 @@ class PbenchTarBall:
     def gen_files_by_partial_path(self, path):
         """Generator for all files in the tar ball which match the given path
         pattern.
+
+        A path starting with the tar ball's top-level directory (as all tool
+        data paths do) is matched as a prefix using the member index; any
+        other path is matched anywhere within the member paths.
         """
+        if path.startswith(f"{self.dirname}/"):
+            yield from self.member_index.files_by_prefix(path)
+            return
         for member in self.members:
             if member.isfile() and member.name.find(path) >= 0:
                 yield member.name
@@ -3463,16 +3653,9 @@ class PbenchTarBall:
             # through the tar ball members looking for directories that are
             # most likely iterations.
             iterations = []
-            for member in self.members:
-                if not member.isdir():
-                    # We are only looking for directories
-                    continue
-                path_els = member.name.split("/")
-                if len(path_els) != 2:
-                    # Iteration directory names always have 2 path elements,
-                    # [ '/', '<iteration name>' ].
-                    continue
-                itername = path_els[1]
+            for itername in self.member_index.subdirectories(self.dirname):
+                # Iteration directories are always found directly within the
+                # tar ball's top-level directory.
                 if self._iter_num_pat.match(itername):
                     # We only recognize iteration names that match this
                     # pattern, as later versions of the pbench-agent have
@@ -3493,18 +3676,11 @@ class PbenchTarBall:
     def get_samples(self, iteration):
         """Get the list of Sample objects for a given iteration object."""
         samples = []
-        for member in self.members:
-            if not member.isdir():
-                # We are only looking for directories
-                continue
-            if member.name.find(f"{iteration.name}/") < 0:
-                continue
-            path_els = member.name.split("/")
-            if len(path_els) != 3:
-                # Sample directory names always have 3 path elements,
-                # [ '/', '<iteration name>', 'sample<number>' ].
-                continue
-            sample = path_els[2]
+        for sample in self.member_index.subdirectories(
+            f"{self.dirname}/{iteration.name}"
+        ):
+            # Sample directories are always found directly within their
+            # iteration directory.
             if sample.startswith("sample"):
                 # Sample directories always begin with 'sample'.
                 samples.append(sample)
@@ -3978,7 +4154,17 @@ class PbenchTarBall:
             asource = td.make_source()
             if not asource:
                 continue
-            for source, source_id in asource:
+            # Each source is yielded with its encoded JSON, from which we
+            # derive the document ID; the encoded JSON, extended with the
+            # fields which don't contribute to the ID, is sent as is.
+            encoder = self.idxctx.encoder
+            extra = encoder.encode(
+                {
+                    "@generated-by": self.idxctx.get_tracking_id(),
+                    "authorization": self.authorization,
+                }
+            )
+            for source, encoded in asource:
                 try:
                     idx_name = td.generate_index_name(
                         "tool-data", source, toolname=td.toolname
@@ -3987,13 +4173,11 @@ class PbenchTarBall:
                     pass
                 else:
                     self.map_document(f"tool-data-{td.toolname}", idx_name)
-                    source["@generated-by"] = self.idxctx.get_tracking_id()
-                    source["authorization"] = self.authorization
                     action = _dict_const(
                         _op_type=_op_type,
                         _index=idx_name,
-                        _id=source_id,
-                        _source=source,
+                        _id=encoder.source_id(encoded),
+                        _source=encoder.extend(encoded, extra),
                     )
                     count += 1
                     yield action
@@ -4075,6 +4259,23 @@ class IdxContext:
         self.getuid = os.getuid
         self.TS = self.config.TS
 
+        self.bulk_requests = max(
+            1, self.config.getint("Indexing", "bulk_requests", fallback=1)
+        )
+        self.bulk_bytes = self.config.getint(
+            "Indexing", "bulk_bytes", fallback=_BULK_BYTES
+        )
+        encoder = self.config.get("Indexing", "json_encoder", fallback="json")
+        if encoder == "orjson" and orjson is None:
+            self.logger.warning(
+                "The orjson module is not available, using the json encoder"
+            )
+            encoder = "json"
+        try:
+            self.encoder = SourceEncoder(encoder)
+        except ValueError as e:
+            raise ConfigFileError(str(e))
+
         self.es = get_es(self.config)
         self.templates = PbenchTemplates(
             self.config.LIBDIR,
@@ -4085,6 +4286,14 @@ class IdxContext:
         )
         self.tracking_id = None
 
+    def reconnect(self):
+        """Establish a new Elasticsearch connection.
+
+        A forked worker process must not share the connection pool of its
+        parent process.
+        """
+        self.es = get_es(self.config)
+
     def dump_opctx(self):
         counters_list = []
         for ctx in self.opctx:
@@ -2,11 +2,16 @@
 
 from argparse import Namespace
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+import multiprocessing
 import os
 from pathlib import Path
+import queue
 import signal
 import tempfile
-from typing import Callable, List, NamedTuple, Optional, Tuple
+import time
+from typing import Callable, List, NamedTuple, Optional, Set, Tuple, Union
 
 from pbench.common.exceptions import (
     BadDate,
@@ -16,6 +21,7 @@ from pbench.common.exceptions import (
 )
 from pbench.server import OperationCode, tstos
 from pbench.server.cache_manager import CacheManager, LockManager, Tarball
+from pbench.server.database.database import Database
 from pbench.server.database.models.audit import Audit, AuditStatus
 from pbench.server.database.models.datasets import (
     Dataset,
@@ -87,6 +93,138 @@ class TarballData(NamedTuple):
     tarball: str
 
 
+class ReportFiles(NamedTuple):
+    """
+    The files recording the tarballs which were indexed, which encountered
+    errors, and which were skipped, from which we generate the summary report.
+    """
+
+    indexed: Path
+    erred: Path
+    skipped: Path
+
+
+class Prefetcher:
+    """Unpack the datasets next in line for indexing in the background.
+
+    A single background thread unpacks up to `depth` datasets ahead of the
+    one being indexed, so that decompressing the next tarball overlaps with
+    indexing the current one. Each prefetched dataset keeps a shared cache
+    lock, and is marked as in use by the cache manager, until it has been
+    indexed, so that the cache space reclaimed to unpack the datasets which
+    follow it (or by another process) can't remove it first.
+
+    Prefetching is opportunistic: a failure to unpack a dataset is logged,
+    and the indexer will then attempt to unpack it and report the failure
+    as usual.
+    """
+
+    def __init__(self, cache_manager: CacheManager, logger, depth: int):
+        """Construct a Prefetcher
+
+        Args:
+            cache_manager: The cache manager of the indexed datasets
+            logger: A Pbench python Logger
+            depth: The maximum number of datasets to unpack ahead
+        """
+        self.cache_manager = cache_manager
+        self.logger = logger
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.prefetched: dict[str, Future] = {}
+        self.current: Optional[tuple[str, Optional[Future]]] = None
+
+    def _unpack(self, resource_id: str) -> LockManager:
+        """Unpack a dataset, returning the cache lock held on it
+
+        This runs in the background thread.
+
+        Args:
+            resource_id: The dataset resource ID
+
+        Returns:
+            The LockManager holding a shared cache lock on the dataset
+        """
+        try:
+            tarobj = self.cache_manager.find_dataset(resource_id)
+            with LockManager(tarobj.lock) as lock:
+                start = time.time()
+                tarobj.get_results(lock)
+                lock.keep()
+            self.logger.debug(
+                "prefetched {} in {:.3f}s", tarobj.name, time.time() - start
+            )
+            return lock
+        finally:
+            if Database.db_session:
+                Database.db_session.remove()
+
+    def _drop(self, resource_id: str, future: Optional[Future]):
+        """Stop prefetching a dataset, or release it if it was prefetched
+
+        Args:
+            resource_id: The dataset resource ID
+            future: The dataset's prefetch, if any
+        """
+        if future and not future.cancel() and not future.exception():
+            future.result().release()
+        self.cache_manager.release_in_use([resource_id])
+
+    def fill(self, tb_deque: deque):
+        """Prefetch the datasets at the head of the indexing queue
+
+        Any other prefetched dataset (which may happen if the queue has been
+        collected again) is released.
+
+        Args:
+            tb_deque: The tarballs remaining to be indexed, in order
+        """
+        wanted = [t.dataset.resource_id for t in list(tb_deque)[: self.depth]]
+        for resource_id in [r for r in self.prefetched if r not in wanted]:
+            self._drop(resource_id, self.prefetched.pop(resource_id))
+        for resource_id in wanted:
+            if resource_id not in self.prefetched:
+                self.cache_manager.mark_in_use([resource_id])
+                self.prefetched[resource_id] = self.executor.submit(
+                    self._unpack, resource_id
+                )
+
+    def wait(self, tbinfo: TarballData):
+        """Wait for a dataset to be unpacked, if it's being prefetched
+
+        The dataset is marked as in use until it's released, whether or not
+        it was prefetched, so that prefetching can't reclaim its cache while
+        it's being indexed.
+
+        Args:
+            tbinfo: The tarball about to be indexed
+        """
+        resource_id = tbinfo.dataset.resource_id
+        future = self.prefetched.pop(resource_id, None)
+        if not future:
+            self.cache_manager.mark_in_use([resource_id])
+        self.current = (resource_id, future)
+        if future:
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.warning("Unable to prefetch {}: {}", tbinfo.tarball, e)
+
+    def release(self):
+        """Release the dataset being indexed"""
+        if self.current:
+            self._drop(*self.current)
+            self.current = None
+
+    def close(self):
+        """Stop prefetching, and release all prefetched datasets"""
+        self.release()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for resource_id, future in self.prefetched.items():
+            self._drop(resource_id, future)
+        self.prefetched.clear()
+
+
 class Index:
     """class used to identify and process tarballs selected for indexing.
 
@@ -159,6 +297,18 @@ class Index:
         # Manage synchronization between components
         self.sync: Sync = Sync(idxctx.logger, self.operation)  # Build a sync object
 
+        # The number of worker processes used to index tarballs concurrently;
+        # the command line option overrides the server configuration.
+        workers = getattr(options, "workers", None)
+        if not workers:
+            workers = idxctx.config.getint("Indexing", "workers", fallback=1)
+        self.workers: int = max(workers, 1)
+
+        # The number of datasets a single indexing process unpacks ahead of
+        # the one it's indexing.
+        prefetch = idxctx.config.getint("Indexing", "prefetch", fallback=1)
+        self.prefetch: int = max(prefetch, 0)
+
     def collect_tb(self) -> Tuple[int, List[TarballData]]:
         """Collect tarballs that need indexing
 
@@ -294,9 +444,315 @@ class Index:
 
         return res
 
+    def _index_tarball(
+        self, tbinfo: TarballData, tmpdir: str, ie_filepath: Path
+    ) -> Optional[ErrorCode]:
+        """Index a single tarball.
+
+        This unpacks the dataset into the cache (if necessary), generates all
+        of the Elasticsearch actions for it and streams them to the indexer,
+        recording the dataset's index map and audit trail.
+
+        Args:
+            tbinfo: The tarball to index
+            tmpdir: A temporary directory for the indexing run
+            ie_filepath: A file in which to record indexing errors
+
+        Raises:
+            SigTermException: indexing was interrupted by SIGTERM, after the
+                index map and audit records were completed
+
+        Returns:
+            The ErrorCode describing the indexing result, or None if the
+            dataset was skipped without a result to record.
+        """
+        idxctx = self.idxctx
+        error_code = self.error_code
+        size = tbinfo.size
+        dataset = tbinfo.dataset
+        tb = tbinfo.tarball
+
+        idxctx.logger.info("Starting {} (size {:d})", tb, size)
+        audit = None
+        ptb = None
+        tarobj: Optional[Tarball] = None
+        terminated = False
+        tb_res = error_code["OK"]
+        try:
+            # We need the fully unpacked cache tree to index it
+            try:
+                tarobj = self.cache_manager.find_dataset(dataset.resource_id)
+            except Exception as e:
+                self.sync.error(
+                    dataset,
+                    f"Unable to find dataset: {e!s}",
+                )
+                return None
+
+            with LockManager(tarobj.lock) as lock:
+                tarobj.get_results(lock)
+                audit = Audit.create(
+                    operation=OperationCode.UPDATE,
+                    name="index",
+                    status=AuditStatus.BEGIN,
+                    user_name=Audit.BACKGROUND_USER,
+                    dataset=dataset,
+                )
+
+                # "Open" the tar ball represented by the tar ball object
+                idxctx.logger.debug("open tar ball")
+                ptb = PbenchTarBall(idxctx, dataset, tmpdir, tarobj)
+
+                # Construct the generator for emitting all actions.
+                # The `idxctx` dictionary is passed along to each
+                # generator so that it can add its context for
+                # error handling to the list.
+                idxctx.logger.debug("generator setup")
+                if self.options.index_tool_data:
+                    actions = ptb.mk_tool_data_actions()
+                else:
+                    actions = ptb.make_all_actions()
+
+                # Create a file where the pyesbulk package will
+                # record all indexing errors that can't/won't be
+                # retried.
+                with ie_filepath.open(mode="w") as fp:
+                    idxctx.logger.debug("begin indexing")
+                    try:
+                        signal.signal(signal.SIGINT, sigint_handler)
+                        es_res = es_index(
+                            idxctx.es,
+                            actions,
+                            fp,
+                            idxctx.logger,
+                            idxctx._dbg,
+                            bulk_requests=idxctx.bulk_requests,
+                            bulk_bytes=idxctx.bulk_bytes,
+                        )
+                    except SigIntException:
+                        idxctx.logger.exception(
+                            "Indexing interrupted by SIGINT, continuing to next tarball"
+                        )
+                        return None
+                    finally:
+                        # Turn off the SIGINT handler when not indexing.
+                        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        except UnsupportedTarballFormat as e:
+            tb_res = self.emit_error(idxctx.logger.warning, "TB_META_ABSENT", e)
+        except BadDate as e:
+            tb_res = self.emit_error(idxctx.logger.warning, "BAD_DATE", e)
+        except FileNotFoundError as e:
+            tb_res = self.emit_error(idxctx.logger.warning, "FILE_NOT_FOUND_ERROR", e)
+        except BadMDLogFormat as e:
+            tb_res = self.emit_error(idxctx.logger.warning, "BAD_METADATA", e)
+        except SigTermException:
+            idxctx.logger.exception("Indexing interrupted by SIGTERM, terminating")
+            terminated = True
+        except Exception as e:
+            tb_res = self.emit_error(idxctx.logger.exception, "GENERIC_ERROR", e)
+        else:
+            beg, end, successes, duplicates, failures, retries = es_res
+            idxctx.logger.info(
+                "done indexing (start ts: {}, end ts: {}, duration:"
+                " {:.2f}s, successes: {:d}, duplicates: {:d},"
+                " failures: {:d}, retries: {:d})",
+                tstos(beg),
+                tstos(end),
+                end - beg,
+                successes,
+                duplicates,
+                failures,
+                retries,
+            )
+            tb_res = error_code["OP_ERROR" if failures > 0 else "OK"]
+        finally:
+            if tb_res.success:
+                try:
+
+                    # Because we're on the `finally` path, we
+                    # can get here without a PbenchTarBall
+                    # object, so don't try to write an index
+                    # map if there is none.
+                    if ptb:
+                        # A pbench-index --tool-data follows a
+                        # pbench-index and generates only the
+                        # tool-specific documents: we want to
+                        # merge that with the existing document
+                        # map. On the other hand, a re-index
+                        # should replace the entire index. We
+                        # accomplish this by overwriting each
+                        # duplicate index key separately.
+                        try:
+                            if IndexMap.exists(dataset):
+                                IndexMap.merge(dataset, ptb.index_map)
+                            else:
+                                IndexMap.create(dataset, ptb.index_map)
+                        except Exception as e:
+                            idxctx.logger.exception(
+                                "Unexpected Metadata error on {}: {}",
+                                ptb.tbname,
+                                e,
+                            )
+                except DatasetError as e:
+                    idxctx.logger.exception("Dataset error on {}: {}", ptb.tbname, e)
+                except Exception as e:
+                    idxctx.logger.exception("Unexpected error on {}: {}", ptb.tbname, e)
+            if audit:
+                doneness = AuditStatus.SUCCESS
+                attributes = None
+
+                # TODO: can we categorize anything as "WARNING"?
+                if tb_res != error_code["OK"]:
+                    doneness = AuditStatus.FAILURE
+                    attributes = {"message": tb_res.message}
+                Audit.create(root=audit, status=doneness, attributes=attributes)
+        if terminated:
+            raise SigTermException()
+        try:
+            ie_len = ie_filepath.stat().st_size
+        except FileNotFoundError:
+            # Above operation never made it to actual indexing, ignore.
+            pass
+        except SigTermException:
+            # Re-raise a SIGTERM to avoid it being lumped in with
+            # general exception handling below.
+            raise
+        except Exception:
+            idxctx.logger.exception(
+                "Unexpected error handling" " indexing errors file: {}",
+                ie_filepath,
+            )
+        else:
+            # Success fetching indexing error file size.
+            if ie_len > len(tb) + 1:
+                try:
+                    self.report.post_status(tstos(end), "errors", ie_filepath)
+                except Exception:
+                    idxctx.logger.exception(
+                        "Unexpected error issuing" " report status with errors: {}",
+                        ie_filepath,
+                    )
+        finally:
+            # Unconditionally remove the indexing errors file.
+            try:
+                os.remove(ie_filepath)
+            except SigTermException:
+                # Re-raise a SIGTERM to avoid it being lumped in with
+                # general exception handling below.
+                raise
+            except Exception:
+                pass
+        return tb_res
+
+    def _record_result(
+        self, tbinfo: TarballData, tb_res: ErrorCode, reports: ReportFiles
+    ):
+        """Record the result of indexing a tarball.
+
+        Distinguish failure cases, so we can retry the indexing easily if
+        possible.
+
+        Only if the indexing was successful do we request the next operation
+        (tool indexing). Otherwise we record the error in the
+        `server.errors.index` metadata and leave the dataset in INDEXING
+        state.
+
+        Args:
+            tbinfo: The tarball that was indexed
+            tb_res: The ErrorCode describing the indexing result
+            reports: The report files tracking indexing results
+        """
+        idxctx = self.idxctx
+        error_code = self.error_code
+        dataset = tbinfo.dataset
+        tb = tbinfo.tarball
+        if tb_res.success:
+            idxctx.logger.info(
+                "{}: {}: success",
+                idxctx.TS,
+                os.path.basename(tb),
+            )
+            # Success
+            with reports.indexed.open(mode="a") as fp:
+                print(tb, file=fp)
+            self.sync.update(
+                dataset=dataset,
+                state=OperationState.OK,
+                enabled=self.enabled,
+            )
+        elif tb_res is error_code["OP_ERROR"]:
+            with reports.erred.open(mode="a") as fp:
+                print(tb, file=fp)
+            self.sync.error(dataset, f"{tb_res.value}:{tb_res.message}")
+        elif tb_res in (error_code["CFG_ERROR"], error_code["BAD_CFG"]):
+            assert False, (
+                f"Unexpected tar ball handling "
+                f"result status {tb_res.value:d} for dataset {dataset}"
+            )
+        elif tb_res.tarball_error:
+            # # Quietly skip these errors
+            with reports.skipped.open(mode="a") as fp:
+                print(tb, file=fp)
+            self.sync.error(dataset, f"{tb_res.value}:{tb_res.message}")
+        else:
+            with reports.erred.open(mode="a") as fp:
+                print(tb, file=fp)
+            self.sync.error(dataset, f"{tb_res.value}:{tb_res.message}")
+
+    def _recollect(
+        self,
+        tb_deque: deque,
+        current: str,
+        count: int,
+        reports: ReportFiles,
+        status: ErrorCode,
+        busy: Optional[Set[str]] = None,
+    ) -> deque:
+        """Re-evaluate the list of tarballs to index on SIGHUP.
+
+        Datasets remain enabled for indexing until their result is recorded,
+        so any still being indexed by a worker are reported again by
+        collect_tb, and must be dropped to avoid indexing them twice.
+
+        Args:
+            tb_deque: The tarballs remaining to be indexed
+            current: The name of the tarball most recently indexed
+            count: The number of tarballs processed so far
+            reports: The report files tracking indexing results
+            status: The result of the most recent tarball
+            busy: The resource IDs of datasets currently being indexed
+
+        Returns:
+            The new list of tarballs to be indexed
+        """
+        idxctx = self.idxctx
+        status_code, new_tb = self.collect_tb()
+        if status_code == 0:
+            if busy:
+                new_tb = [t for t in new_tb if t.dataset.resource_id not in busy]
+            if not set(new_tb).issuperset(tb_deque):
+                idxctx.logger.info(
+                    "Tarballs previously marked for indexing are no longer present",
+                    set(tb_deque).difference(new_tb),
+                )
+            tb_deque = deque(sorted(new_tb))
+        idxctx.logger.info(
+            "SIGHUP status (Current tar ball indexed: ({}), Remaining: {}, Completed: {}, Errors_encountered: {}, Status: {})",
+            Path(current).name,
+            len(tb_deque),
+            count,
+            _count_lines(reports.erred),
+            status,
+        )
+        return tb_deque
+
     def process_tb(self, tarballs: List[TarballData]) -> int:
         """Process Tarballs For Indexing and create a summary report.
 
+        When more than one worker is configured, the tarballs are indexed
+        concurrently by a pool of worker processes; otherwise each tarball
+        is indexed in turn by this process.
+
         Args:
             tarballs:   List of tarball information tuples
 
@@ -314,13 +770,22 @@ class Index:
             idxctx.logger.info("Load templates {!r}", res)
             return res.value
 
-        idxctx.logger.debug("Preparing to index {:d} tar balls", len(tb_deque))
+        idxctx.logger.debug(
+            "Preparing to index {:d} tar balls with {:d} worker(s)",
+            len(tb_deque),
+            self.workers,
+        )
 
         with tempfile.TemporaryDirectory(
             prefix=f"{self.name}.", dir=idxctx.config.TMP
         ) as tmpdir:
             idxctx.logger.debug("start processing list of tar balls")
             tb_list = Path(tmpdir, f"{self.name}.{idxctx.TS}.list")
+            reports = ReportFiles(
+                indexed=Path(tmpdir, f"{self.name}.{idxctx.TS}.indexed"),
+                erred=Path(tmpdir, f"{self.name}.{idxctx.TS}.erred"),
+                skipped=Path(tmpdir, f"{self.name}.{idxctx.TS}.skipped"),
+            )
             try:
                 with tb_list.open(mode="w") as lfp:
                     # Write out all the tar balls we are processing so external
@@ -328,302 +793,10 @@ class Index:
                     for size, dataset, tb in tarballs:
                         print(f"{size:20d} {dataset.name} {tb}", file=lfp)
 
-                indexed = Path(tmpdir, f"{self.name}.{idxctx.TS}.indexed")
-                erred = Path(tmpdir, f"{self.name}.{idxctx.TS}.erred")
-                skipped = Path(tmpdir, f"{self.name}.{idxctx.TS}.skipped")
-                ie_filepath = Path(
-                    tmpdir, f"{self.name}.{idxctx.TS}.indexing-errors.json"
-                )
-
-                # We use a list object here so that when we close over this
-                # variable in the handler, the list object will be closed over,
-                # but not its contents.
-                sigquit_interrupt = [False]
-
-                def sigquit_handler(*args):
-                    sigquit_interrupt[0] = True
-
-                sighup_interrupt = [False]
-
-                def sighup_handler(*args):
-                    sighup_interrupt[0] = True
-
-                signal.signal(signal.SIGQUIT, sigquit_handler)
-                signal.signal(signal.SIGHUP, sighup_handler)
-                count_processed_tb = 0
-
-                try:
-                    while len(tb_deque) > 0:
-                        tbinfo: TarballData = tb_deque.popleft()
-                        size = tbinfo.size
-                        dataset = tbinfo.dataset
-                        tb = tbinfo.tarball
-                        count_processed_tb += 1
-
-                        idxctx.logger.info("Starting {} (size {:d})", tb, size)
-                        audit = None
-                        ptb = None
-                        tarobj: Optional[Tarball] = None
-                        tb_res = error_code["OK"]
-                        try:
-                            # We need the fully unpacked cache tree to index it
-                            try:
-                                tarobj = self.cache_manager.find_dataset(
-                                    dataset.resource_id
-                                )
-                            except Exception as e:
-                                self.sync.error(
-                                    dataset,
-                                    f"Unable to find dataset: {e!s}",
-                                )
-                                continue
-
-                            with LockManager(tarobj.lock) as lock:
-                                tarobj.get_results(lock)
-                                audit = Audit.create(
-                                    operation=OperationCode.UPDATE,
-                                    name="index",
-                                    status=AuditStatus.BEGIN,
-                                    user_name=Audit.BACKGROUND_USER,
-                                    dataset=dataset,
-                                )
-
-                                # "Open" the tar ball represented by the tar ball object
-                                idxctx.logger.debug("open tar ball")
-                                ptb = PbenchTarBall(idxctx, dataset, tmpdir, tarobj)
-
-                                # Construct the generator for emitting all actions.
-                                # The `idxctx` dictionary is passed along to each
-                                # generator so that it can add its context for
-                                # error handling to the list.
-                                idxctx.logger.debug("generator setup")
-                                if self.options.index_tool_data:
-                                    actions = ptb.mk_tool_data_actions()
-                                else:
-                                    actions = ptb.make_all_actions()
-
-                                # Create a file where the pyesbulk package will
-                                # record all indexing errors that can't/won't be
-                                # retried.
-                                with ie_filepath.open(mode="w") as fp:
-                                    idxctx.logger.debug("begin indexing")
-                                    try:
-                                        signal.signal(signal.SIGINT, sigint_handler)
-                                        es_res = es_index(
-                                            idxctx.es,
-                                            actions,
-                                            fp,
-                                            idxctx.logger,
-                                            idxctx._dbg,
-                                        )
-                                    except SigIntException:
-                                        idxctx.logger.exception(
-                                            "Indexing interrupted by SIGINT, continuing to next tarball"
-                                        )
-                                        continue
-                                    finally:
-                                        # Turn off the SIGINT handler when not indexing.
-                                        signal.signal(signal.SIGINT, signal.SIG_IGN)
-                        except UnsupportedTarballFormat as e:
-                            tb_res = self.emit_error(
-                                idxctx.logger.warning, "TB_META_ABSENT", e
-                            )
-                        except BadDate as e:
-                            tb_res = self.emit_error(
-                                idxctx.logger.warning, "BAD_DATE", e
-                            )
-                        except FileNotFoundError as e:
-                            tb_res = self.emit_error(
-                                idxctx.logger.warning, "FILE_NOT_FOUND_ERROR", e
-                            )
-                        except BadMDLogFormat as e:
-                            tb_res = self.emit_error(
-                                idxctx.logger.warning, "BAD_METADATA", e
-                            )
-                        except SigTermException:
-                            idxctx.logger.exception(
-                                "Indexing interrupted by SIGTERM, terminating"
-                            )
-                            break
-                        except Exception as e:
-                            tb_res = self.emit_error(
-                                idxctx.logger.exception, "GENERIC_ERROR", e
-                            )
-                        else:
-                            beg, end, successes, duplicates, failures, retries = es_res
-                            idxctx.logger.info(
-                                "done indexing (start ts: {}, end ts: {}, duration:"
-                                " {:.2f}s, successes: {:d}, duplicates: {:d},"
-                                " failures: {:d}, retries: {:d})",
-                                tstos(beg),
-                                tstos(end),
-                                end - beg,
-                                successes,
-                                duplicates,
-                                failures,
-                                retries,
-                            )
-                            tb_res = error_code["OP_ERROR" if failures > 0 else "OK"]
-                        finally:
-                            if tb_res.success:
-                                try:
-
-                                    # Because we're on the `finally` path, we
-                                    # can get here without a PbenchTarBall
-                                    # object, so don't try to write an index
-                                    # map if there is none.
-                                    if ptb:
-                                        # A pbench-index --tool-data follows a
-                                        # pbench-index and generates only the
-                                        # tool-specific documents: we want to
-                                        # merge that with the existing document
-                                        # map. On the other hand, a re-index
-                                        # should replace the entire index. We
-                                        # accomplish this by overwriting each
-                                        # duplicate index key separately.
-                                        try:
-                                            if IndexMap.exists(dataset):
-                                                IndexMap.merge(dataset, ptb.index_map)
-                                            else:
-                                                IndexMap.create(dataset, ptb.index_map)
-                                        except Exception as e:
-                                            idxctx.logger.exception(
-                                                "Unexpected Metadata error on {}: {}",
-                                                ptb.tbname,
-                                                e,
-                                            )
-                                except DatasetError as e:
-                                    idxctx.logger.exception(
-                                        "Dataset error on {}: {}", ptb.tbname, e
-                                    )
-                                except Exception as e:
-                                    idxctx.logger.exception(
-                                        "Unexpected error on {}: {}", ptb.tbname, e
-                                    )
-                            if audit:
-                                doneness = AuditStatus.SUCCESS
-                                attributes = None
-
-                                # TODO: can we categorize anything as "WARNING"?
-                                if tb_res != error_code["OK"]:
-                                    doneness = AuditStatus.FAILURE
-                                    attributes = {"message": tb_res.message}
-                                Audit.create(
-                                    root=audit, status=doneness, attributes=attributes
-                                )
-                        try:
-                            ie_len = ie_filepath.stat().st_size
-                        except FileNotFoundError:
-                            # Above operation never made it to actual indexing, ignore.
-                            pass
-                        except SigTermException:
-                            # Re-raise a SIGTERM to avoid it being lumped in with
-                            # general exception handling below.
-                            raise
-                        except Exception:
-                            idxctx.logger.exception(
-                                "Unexpected error handling" " indexing errors file: {}",
-                                ie_filepath,
-                            )
-                        else:
-                            # Success fetching indexing error file size.
-                            if ie_len > len(tb) + 1:
-                                try:
-                                    self.report.post_status(
-                                        tstos(end), "errors", ie_filepath
-                                    )
-                                except Exception:
-                                    idxctx.logger.exception(
-                                        "Unexpected error issuing"
-                                        " report status with errors: {}",
-                                        ie_filepath,
-                                    )
-                        finally:
-                            # Unconditionally remove the indexing errors file.
-                            try:
-                                os.remove(ie_filepath)
-                            except SigTermException:
-                                # Re-raise a SIGTERM to avoid it being lumped in with
-                                # general exception handling below.
-                                raise
-                            except Exception:
-                                pass
-
-                        # Distinguish failure cases, so we can retry the indexing
-                        # easily if possible.
-                        #
-                        # Only if the indexing was successful do we request the
-                        # next operation (tool indexing). Otherwise we record
-                        # the error in the `server.errors.index` metadata and
-                        # leave the dataset in INDEXING state.
-                        if tb_res.success:
-                            idxctx.logger.info(
-                                "{}: {}: success",
-                                idxctx.TS,
-                                os.path.basename(tb),
-                            )
-                            # Success
-                            with indexed.open(mode="a") as fp:
-                                print(tb, file=fp)
-                            self.sync.update(
-                                dataset=dataset,
-                                state=OperationState.OK,
-                                enabled=self.enabled,
-                            )
-                        elif tb_res is error_code["OP_ERROR"]:
-                            with erred.open(mode="a") as fp:
-                                print(tb, file=fp)
-                            self.sync.error(dataset, f"{tb_res.value}:{tb_res.message}")
-                        elif tb_res in (error_code["CFG_ERROR"], error_code["BAD_CFG"]):
-                            assert False, (
-                                f"Unexpected tar ball handling "
-                                f"result status {tb_res.value:d} for dataset {dataset}"
-                            )
-                        elif tb_res.tarball_error:
-                            # # Quietly skip these errors
-                            with skipped.open(mode="a") as fp:
-                                print(tb, file=fp)
-                            self.sync.error(dataset, f"{tb_res.value}:{tb_res.message}")
-                        else:
-                            with erred.open(mode="a") as fp:
-                                print(tb, file=fp)
-                            self.sync.error(dataset, f"{tb_res.value}:{tb_res.message}")
-                        idxctx.logger.info(
-                            "Finished{} {} (size {:d})",
-                            "[SIGQUIT]" if sigquit_interrupt[0] else "",
-                            tb,
-                            size,
-                        )
-
-                        if sigquit_interrupt[0]:
-                            break
-                        if sighup_interrupt[0]:
-                            status, new_tb = self.collect_tb()
-                            if status == 0:
-                                if not set(new_tb).issuperset(tb_deque):
-                                    idxctx.logger.info(
-                                        "Tarballs previously marked for indexing are no longer present",
-                                        set(tb_deque).difference(new_tb),
-                                    )
-                                tb_deque = deque(sorted(new_tb))
-                            idxctx.logger.info(
-                                "SIGHUP status (Current tar ball indexed: ({}), Remaining: {}, Completed: {}, Errors_encountered: {}, Status: {})",
-                                Path(tb).name,
-                                len(tb_deque),
-                                count_processed_tb,
-                                _count_lines(erred),
-                                tb_res,
-                            )
-                            sighup_interrupt[0] = False
-                            continue
-                except SigTermException:
-                    idxctx.logger.exception(
-                        "Indexing interrupted by SIGQUIT, stop processing tarballs"
-                    )
-                finally:
-                    # Turn off the SIGQUIT and SIGHUP handler when not indexing.
-                    signal.signal(signal.SIGQUIT, signal.SIG_IGN)
-                    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                if self.workers > 1:
+                    self._process_parallel(tb_deque, tmpdir, reports)
+                else:
+                    self._process_serial(tb_deque, tmpdir, reports)
             except SigTermException:
                 # Re-raise a SIGTERM to avoid it being lumped in with general
                 # exception handling below.
@@ -638,65 +811,347 @@ class Index:
                 if idxctx:
                     idxctx.dump_opctx()
                 idxctx.logger.debug("stopped processing list of tar balls")
+                self._report(tmpdir, reports)
+
+        return res.value
+
+    def _process_serial(self, tb_deque: deque, tmpdir: str, reports: ReportFiles):
+        """Index each tarball in turn within this process.
 
-                idx = _count_lines(indexed)
-                skp = _count_lines(skipped)
-                err = _count_lines(erred)
+        Args:
+            tb_deque: The tarballs to be indexed, in order
+            tmpdir: A temporary directory for the indexing run
+            reports: The report files tracking indexing results
+        """
+        idxctx = self.idxctx
+        ie_filepath = Path(tmpdir, f"{self.name}.{idxctx.TS}.indexing-errors.json")
+
+        # We use a list object here so that when we close over this
+        # variable in the handler, the list object will be closed over,
+        # but not its contents.
+        sigquit_interrupt = [False]
+
+        def sigquit_handler(*args):
+            sigquit_interrupt[0] = True
+
+        sighup_interrupt = [False]
+
+        def sighup_handler(*args):
+            sighup_interrupt[0] = True
+
+        signal.signal(signal.SIGQUIT, sigquit_handler)
+        signal.signal(signal.SIGHUP, sighup_handler)
+        count_processed_tb = 0
 
+        # Unpack the next datasets while each is indexed
+        prefetcher = None
+        if self.prefetch:
+            prefetcher = Prefetcher(self.cache_manager, idxctx.logger, self.prefetch)
+
+        try:
+            while len(tb_deque) > 0:
+                tbinfo: TarballData = tb_deque.popleft()
+                count_processed_tb += 1
+
+                try:
+                    if prefetcher:
+                        prefetcher.wait(tbinfo)
+                        prefetcher.fill(tb_deque)
+                    tb_res = self._index_tarball(tbinfo, tmpdir, ie_filepath)
+                except SigTermException:
+                    break
+                finally:
+                    if prefetcher:
+                        prefetcher.release()
+                if tb_res is None:
+                    continue
+
+                self._record_result(tbinfo, tb_res, reports)
                 idxctx.logger.info(
-                    "{}.{}: indexed {:d} (skipped {:d}) results," " {:d} errors",
-                    self.name,
-                    idxctx.TS,
-                    idx,
-                    skp,
-                    err,
+                    "Finished{} {} (size {:d})",
+                    "[SIGQUIT]" if sigquit_interrupt[0] else "",
+                    tbinfo.tarball,
+                    tbinfo.size,
                 )
 
-                if err > 0:
-                    if skp > 0:
-                        subj = (
-                            f"{self.name}.{idxctx.TS} - Indexed {idx:d} results, skipped {skp:d}"
-                            f" results, w/ {err:d} errors"
-                        )
-                    else:
-                        subj = (
-                            f"{self.name}.{idxctx.TS} - Indexed {idx:d} results, w/ {err:d}"
-                            " errors"
-                        )
+                if sigquit_interrupt[0]:
+                    break
+                if sighup_interrupt[0]:
+                    tb_deque = self._recollect(
+                        tb_deque,
+                        tbinfo.tarball,
+                        count_processed_tb,
+                        reports,
+                        tb_res,
+                    )
+                    sighup_interrupt[0] = False
+                    continue
+        except SigTermException:
+            idxctx.logger.exception(
+                "Indexing interrupted by SIGQUIT, stop processing tarballs"
+            )
+        finally:
+            if prefetcher:
+                prefetcher.close()
+            # Turn off the SIGQUIT and SIGHUP handler when not indexing.
+            signal.signal(signal.SIGQUIT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    def _process_parallel(self, tb_deque: deque, tmpdir: str, reports: ReportFiles):
+        """Index tarballs concurrently using a pool of worker processes.
+
+        Tarballs are handed to the workers in the (size-sorted) order of the
+        deque, and never more than one per worker at a time, so that SIGQUIT
+        and SIGHUP behave as they do for serial indexing: they take effect as
+        each tarball completes, without affecting tarballs already in
+        progress. Each worker locks, unpacks and indexes its dataset in the
+        same way as serial indexing, and returns the name of the ErrorCode so
+        that this process can record the result.
+
+        Args:
+            tb_deque: The tarballs to be indexed, in order
+            tmpdir: A temporary directory for the indexing run
+            reports: The report files tracking indexing results
+        """
+        idxctx = self.idxctx
+        error_code = self.error_code
+
+        sigquit_interrupt = [False]
+
+        def sigquit_handler(*args):
+            sigquit_interrupt[0] = True
+
+        sighup_interrupt = [False]
+
+        def sighup_handler(*args):
+            sighup_interrupt[0] = True
+
+        # The workers inherit our process state, including the database
+        # session; make sure we're not in the middle of a transaction when
+        # they're created.
+        if Database.db_session:
+            Database.db_session.remove()
+
+        # Completed results are delivered from the pool's result handler
+        # thread through this queue as (TarballData, ErrorCode name) tuples.
+        completed: queue.Queue = queue.Queue()
+
+        def done(tbinfo: TarballData, result: Union[str, None, Exception]):
+            completed.put((tbinfo, result))
+
+        # The resource IDs of the datasets handed to a worker for which we
+        # haven't yet recorded a result.
+        in_flight: Set[str] = set()
+        count_processed_tb = 0
+
+        pool = multiprocessing.get_context("fork").Pool(
+            self.workers, initializer=_init_worker, initargs=(self,)
+        )
+        signal.signal(signal.SIGQUIT, sigquit_handler)
+        signal.signal(signal.SIGHUP, sighup_handler)
+        try:
+            while tb_deque or in_flight:
+                while (
+                    tb_deque
+                    and len(in_flight) < self.workers
+                    and not sigquit_interrupt[0]
+                ):
+                    tbinfo: TarballData = tb_deque.popleft()
+                    count_processed_tb += 1
+                    pool.apply_async(
+                        _index_worker,
+                        (
+                            tbinfo.size,
+                            tbinfo.dataset.resource_id,
+                            tbinfo.tarball,
+                            tmpdir,
+                        ),
+                        callback=partial(done, tbinfo),
+                        error_callback=partial(done, tbinfo),
+                    )
+                    in_flight.add(tbinfo.dataset.resource_id)
+                if not in_flight:
+                    break
+
+                tbinfo, result = completed.get()
+                in_flight.discard(tbinfo.dataset.resource_id)
+                if isinstance(result, BaseException):
+                    idxctx.logger.error(
+                        "{}: {}: {}",
+                        error_code["GENERIC_ERROR"].message,
+                        tbinfo.tarball,
+                        result,
+                    )
+                    tb_res = error_code["GENERIC_ERROR"]
+                elif result is None:
+                    continue
                 else:
-                    if skp > 0:
-                        subj = f"{self.name}.{idxctx.TS} - Indexed {idx:d} results, skipped {skp:d} results"
-                    else:
-                        subj = f"{self.name}.{idxctx.TS} - Indexed {idx:d} results"
-
-                report_fname = Path(tmpdir, f"{self.name}.{idxctx.TS}.report")
-                with report_fname.open(mode="w") as fp:
-                    print(subj, file=fp)
-                    if idx > 0:
-                        print("\nIndexed Results\n===============", file=fp)
-                        with indexed.open() as ifp:
-                            for line in sorted(ifp):
-                                print(line.strip(), file=fp)
-                    if err > 0:
-                        print(
-                            "\nResults producing errors" "\n========================",
-                            file=fp,
-                        )
-                        with erred.open() as efp:
-                            for line in sorted(efp):
-                                print(line.strip(), file=fp)
-                    if skp > 0:
-                        print("\nSkipped Results\n===============", file=fp)
-                        with skipped.open() as sfp:
-                            for line in sorted(sfp):
-                                print(line.strip(), file=fp)
-                try:
-                    self.report.post_status(tstos(), "status", report_fname)
-                except SigTermException:
-                    # Re-raise a SIGTERM to avoid it being lumped in with general
-                    # exception handling below.
-                    raise
-                except Exception:
-                    pass
+                    tb_res = error_code[result]
 
-        return res.value
+                self._record_result(tbinfo, tb_res, reports)
+                idxctx.logger.info(
+                    "Finished{} {} (size {:d})",
+                    "[SIGQUIT]" if sigquit_interrupt[0] else "",
+                    tbinfo.tarball,
+                    tbinfo.size,
+                )
+
+                if sighup_interrupt[0] and not sigquit_interrupt[0]:
+                    tb_deque = self._recollect(
+                        tb_deque,
+                        tbinfo.tarball,
+                        count_processed_tb,
+                        reports,
+                        tb_res,
+                        busy=in_flight,
+                    )
+                    sighup_interrupt[0] = False
+        except SigTermException:
+            idxctx.logger.exception("Indexing interrupted by SIGTERM, terminating")
+        finally:
+            # Turn off the SIGQUIT and SIGHUP handler when not indexing.
+            signal.signal(signal.SIGQUIT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+            # Any worker still busy at this point has been interrupted, so
+            # there's nothing left worth waiting for.
+            pool.terminate()
+            pool.join()
+
+    def _report(self, tmpdir: str, reports: ReportFiles):
+        """Post the summary report of the indexing run.
+
+        Args:
+            tmpdir: A temporary directory for the indexing run
+            reports: The report files tracking indexing results
+        """
+        idxctx = self.idxctx
+        idx = _count_lines(reports.indexed)
+        skp = _count_lines(reports.skipped)
+        err = _count_lines(reports.erred)
+
+        idxctx.logger.info(
+            "{}.{}: indexed {:d} (skipped {:d}) results," " {:d} errors",
+            self.name,
+            idxctx.TS,
+            idx,
+            skp,
+            err,
+        )
+
+        if err > 0:
+            if skp > 0:
+                subj = (
+                    f"{self.name}.{idxctx.TS} - Indexed {idx:d} results, skipped {skp:d}"
+                    f" results, w/ {err:d} errors"
+                )
+            else:
+                subj = (
+                    f"{self.name}.{idxctx.TS} - Indexed {idx:d} results, w/ {err:d}"
+                    " errors"
+                )
+        else:
+            if skp > 0:
+                subj = f"{self.name}.{idxctx.TS} - Indexed {idx:d} results, skipped {skp:d} results"
+            else:
+                subj = f"{self.name}.{idxctx.TS} - Indexed {idx:d} results"
+
+        report_fname = Path(tmpdir, f"{self.name}.{idxctx.TS}.report")
+        with report_fname.open(mode="w") as fp:
+            print(subj, file=fp)
+            if idx > 0:
+                print("\nIndexed Results\n===============", file=fp)
+                with reports.indexed.open() as ifp:
+                    for line in sorted(ifp):
+                        print(line.strip(), file=fp)
+            if err > 0:
+                print(
+                    "\nResults producing errors" "\n========================",
+                    file=fp,
+                )
+                with reports.erred.open() as efp:
+                    for line in sorted(efp):
+                        print(line.strip(), file=fp)
+            if skp > 0:
+                print("\nSkipped Results\n===============", file=fp)
+                with reports.skipped.open() as sfp:
+                    for line in sorted(sfp):
+                        print(line.strip(), file=fp)
+        try:
+            self.report.post_status(tstos(), "status", report_fname)
+        except SigTermException:
+            # Re-raise a SIGTERM to avoid it being lumped in with general
+            # exception handling below.
+            raise
+        except Exception:
+            pass
+
+
+# The Index object used by a pool worker process, which is inherited from the
+# parent process by _init_worker, or the exception which prevented the worker
+# from initializing.
+_worker_index: Optional[Index] = None
+_worker_error: Optional[Exception] = None
+
+
+def _init_worker(index: Index):
+    """Initialize a pool worker process for parallel indexing.
+
+    The worker is forked from the indexing process, so it inherits the Index
+    object (without pickling); but it must not share the parent's database
+    or Elasticsearch connections, and it leaves SIGQUIT and SIGHUP handling to
+    the parent.
+
+    NOTE: an exception here would cause the pool to continually replace the
+    failed worker, so we save it to fail each tarball given to the worker.
+
+    Args:
+        index: The parent's Index object
+    """
+    global _worker_index, _worker_error
+    signal.signal(signal.SIGQUIT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        if Database.db_session:
+            Database.db_session.get_bind().dispose(close=False)
+        index.idxctx.reconnect()
+        if index.report and index.report.es is not None:
+            index.report.es = index.idxctx.es
+    except Exception as e:
+        _worker_error = e
+    else:
+        _worker_index = index
+
+
+def _index_worker(
+    size: int, resource_id: str, tarball: str, tmpdir: str
+) -> Optional[str]:
+    """Index a tarball in a pool worker process.
+
+    Args:
+        size: The size of the tarball
+        resource_id: The dataset resource ID
+        tarball: The tarball path
+        tmpdir: A temporary directory for the indexing run
+
+    Returns:
+        The name of the ErrorCode describing the indexing result, or None if
+        there is no result to record
+    """
+    if _worker_error:
+        raise _worker_error
+    index = _worker_index
+    dataset = Dataset.query(resource_id=resource_id)
+    ie_filepath = Path(
+        tmpdir,
+        f"{index.name}.{index.idxctx.TS}.{os.getpid()}.indexing-errors.json",
+    )
+    try:
+        tb_res = index._index_tarball(
+            TarballData(size=size, dataset=dataset, tarball=tarball),
+            tmpdir,
+            ie_filepath,
+        )
+    except SigTermException:
+        return None
+    return tb_res.name if tb_res else None
@@ -110,6 +110,10 @@ class _MockStreamingBulk:
         # First dump the template report before we continue
         msb.mpt.report()
         for action in actions:
+            if isinstance(action["_source"], str):
+                # Decode pre-encoded sources so that we can check and report
+                # them just like any other.
+                action = {**action, "_source": json.loads(action["_source"])}
             msb.duplicates_tracker[action["_id"]] += 1
             dcnt = msb.duplicates_tracker[action["_id"]]
             if dcnt == 2:
@@ -83,6 +83,35 @@ class Sync:
             self.logger.exception("Failed to find 'next' for {}", self.component.name)
             raise SyncSqlError(self.component, "next") from e
 
+    def working(self) -> list[tuple[Dataset, Optional[str]]]:
+        """Return the datasets on which the component is WORKING.
+
+        As with `next`, we transport only the resource IDs out of our local
+        session.
+
+        Returns:
+            A list of (Dataset, operation message) tuples for the datasets
+            with a WORKING Operation for the Sync component.
+        """
+        try:
+            with Database.maker.begin() as session:
+                query = session.query(Dataset.resource_id, Operation.message).join(
+                    Operation
+                )
+                query = query.filter(
+                    Operation.name == self.component,
+                    Operation.state == OperationState.WORKING,
+                )
+                query = query.order_by(Dataset.resource_id)
+                Database.dump_query(query, self.logger)
+                working = [(r, m) for r, m in query.all()]
+            return [(Dataset.query(resource_id=r), m) for r, m in working]
+        except Exception as e:
+            self.logger.exception(
+                "Failed to find 'working' for {}", self.component.name
+            )
+            raise SyncSqlError(self.component, "working") from e
+
     def update(
         self,
         dataset: Dataset,
@@ -183,13 +212,22 @@ class Sync:
             time.sleep(self.DELAY)
         raise SyncSqlError(self.component, "update") from last_error
 
-    def error(self, dataset: Dataset, message: str):
+    def error(
+        self, dataset: Dataset, message: str, expected: Optional[str] = None
+    ) -> bool:
         """
         Record an error in the component for which the Sync object was created.
 
         Args:
             dataset: The dataset affected
             message: A failure explanation for the component operation.
+            expected: If specified, record the error only if the component
+                operation exists and still has this message, so that
+                concurrent callers can't both act on the same state.
+
+        Returns:
+            True unless the error wasn't recorded because the operation no
+            longer has the expected message
         """
         self.logger.debug(
             "{} error {}: {}", dataset.resource_id, self.component.name, message
@@ -205,6 +243,17 @@ class Sync:
                     query = session.query(Operation).filter(
                         Operation.name == self.component, Operation.dataset_ref == ds_id
                     )
+                    if expected is not None:
+                        # A single conditional UPDATE, so that the database
+                        # decides which of any concurrent callers wins.
+                        count = query.filter(Operation.message == expected).update(
+                            {
+                                Operation.state: OperationState.FAILED,
+                                Operation.message: message,
+                            },
+                            synchronize_session=False,
+                        )
+                        return count > 0
                     match = query.first()
                     if match:
                         match.state = OperationState.FAILED
@@ -217,7 +266,7 @@ class Sync:
                             message=message,
                         )
                         session.add(row)
-                return
+                return True
             except Exception as e:
                 self.logger.warning(
                     "{} {} 'error' ({}) error updating message: {}",
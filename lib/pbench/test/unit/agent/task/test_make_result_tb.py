@@ -97,13 +97,16 @@ class TestMakeResultTb:
                 )
                 mrt.make_result_tb()
 
-    def test_make_tb(self, monkeypatch, agent_logger):
+    @pytest.mark.parametrize("single_threaded", (False, True))
+    def test_make_tb(self, monkeypatch, agent_logger, single_threaded):
         monkeypatch.setattr(datetime, "datetime", MockDatetime)
         expected_tb = self.target_dir / f"{self.name}.tar.xz"
         mrt = MakeResultTb(
             self.result_dir, self.target_dir, self.controller, self.config, agent_logger
         )
-        tarball, tarball_len, tarball_md5 = mrt.make_result_tb()
+        tarball, tarball_len, tarball_md5 = mrt.make_result_tb(
+            single_threaded=single_threaded
+        )
         assert tarball.samefile(expected_tb), f"{tarball} {expected_tb}"
         assert tarball.exists()
         assert tarball.stat().st_size == tarball_len and tarball_len > 0
@@ -323,6 +323,64 @@ class TestResultsMove:
         # This should raise an unexpected exception if it was not created.
         (pbrun / f"{name}.copied").unlink()
 
+    @staticmethod
+    @responses.activate
+    @pytest.mark.parametrize("status", (200, 500))
+    def test_results_move_jobs(monkeypatch, caplog, setup, status):
+        """Move several result directories, compressing two at a time"""
+        monkeypatch.setenv("_pbench_full_hostname", "localhost")
+        monkeypatch.setattr(datetime, "datetime", MockDatetime)
+
+        pbrun = setup["tmp"] / "var" / "lib" / "pbench-agent"
+        script = "pbench-user-benchmark"
+        date = "YYYY.MM.DDTHH.MM.SS"
+        names = []
+        for config in ("jobs-a", "jobs-b", "jobs-c"):
+            name = f"{script}_{config}_{date}"
+            res_dir = pbrun / name
+            res_dir.mkdir(parents=True, exist_ok=True)
+            (res_dir / "metadata.log").write_text(mdlog_tmpl.format(**locals()))
+            responses.add(
+                responses.PUT,
+                f"{TestResultsMove.URL}/upload/{name}.tar.xz",
+                status=status,
+            )
+            names.append(name)
+
+        caplog.set_level(logging.DEBUG)
+        runner = CliRunner()
+        result = runner.invoke(
+            main,
+            args=[
+                TestResultsMove.CTRL_SWITCH,
+                TestResultsMove.CTRL_TEXT,
+                TestResultsMove.TOKN_SWITCH,
+                TestResultsMove.TOKN_TEXT,
+                TestResultsMove.DELN_SWITCH,
+                "--jobs",
+                "2",
+            ],
+        )
+        copied = [n for n in names if (pbrun / f"{n}.copied").exists()]
+        if status == 200:
+            assert result.exit_code == 0, f"Unexpected output: {result.stdout!r}"
+            assert result.stdout.endswith(
+                "Status: total # of result directories considered 3,"
+                " successfully copied 3, encountered 0 failures\n"
+            )
+            assert copied == names
+        else:
+            # The first upload failure stops the move, and the directories
+            # which were still being compressed are not considered.
+            assert result.exit_code == 1, f"Unexpected output: {result.stdout!r}"
+            assert result.stdout.endswith(
+                "Status: total # of result directories considered 1,"
+                " successfully copied 0, encountered 1 failures\n"
+            )
+            assert copied == []
+        assert all((pbrun / n).is_dir() for n in names)
+        assert not list((pbrun / "tmp").iterdir())
+
     @staticmethod
     @responses.activate
     @pytest.mark.parametrize("brief", (True, False))
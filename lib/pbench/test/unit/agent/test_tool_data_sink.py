@@ -5,9 +5,10 @@ from http import HTTPStatus
 from io import BytesIO
 import logging
 import shutil
-from threading import Condition, Lock, Thread
+from threading import Barrier, Condition, Lock, Thread
 import time
 from unittest.mock import patch
+from urllib.request import urlopen
 from wsgiref.simple_server import WSGIRequestHandler
 
 import pytest
@@ -15,6 +16,8 @@ import pytest
 from pbench.agent import tool_data_sink
 from pbench.agent.tool_data_sink import (
     BenchmarkRunDir,
+    ChunkedReader,
+    DataSinkThreadingWsgiServer,
     DataSinkWsgiServer,
     ToolDataSinkError,
 )
@@ -269,6 +272,10 @@ class TestDataSinkWsgiServer:
                 assert mock_server.args == ()
                 klass = mock_server.kwargs.get("handler_class")
                 assert isinstance(klass, type(WSGIRequestHandler))
+                assert (
+                    mock_server.kwargs.get("server_class")
+                    is DataSinkThreadingWsgiServer
+                )
                 assert mock_server.serve_forever_called
                 # The success path of "run" should have emitted three debug
                 # messages.
@@ -480,3 +487,74 @@ class TestDataSinkWsgiServer:
                     assert len(mocked_servers) == 0
                     caplog_idx += 1
                 assert len(caplog.records) == caplog_idx
+
+    def test_concurrent_requests(self):
+        """test_concurrent_requests - verify that the WSGI server handles
+        requests concurrently, by having each request wait for the other
+        to arrive before responding.
+        """
+        logger = logging.getLogger("test_concurrent_requests")
+        barrier = Barrier(2, timeout=10)
+
+        def app(environ, start_response):
+            barrier.wait()
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [b"ok"]
+
+        wsgi_server = DataSinkWsgiServer(host="127.0.0.1", port=0, logger=logger)
+        wsgithr = Thread(target=wsgi_server.run, args=(app,))
+        wsgithr.start()
+        err_text, err_code = wsgi_server.wait()
+        assert err_code == 0, err_text
+        url = f"http://127.0.0.1:{wsgi_server._server.server_port}/"
+        responses = []
+
+        def get():
+            with urlopen(url, timeout=10) as response:
+                responses.append(response.read())
+
+        try:
+            clients = [Thread(target=get) for _ in range(2)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            wsgi_server.stop()
+            wsgithr.join()
+        assert not barrier.broken
+        assert responses == [b"ok", b"ok"]
+
+
+class TestChunkedReader:
+    """Verify the Tool Data Sink ChunkedReader class."""
+
+    def test_decode(self):
+        body = (
+            b"5\r\nhello\r\n"
+            b"1;ext=1\r\n \r\n"
+            b"5\r\nworld\r\n"
+            b"0\r\nMD5sum: abc\r\nOther:  x \r\n\r\nextra"
+        )
+        stream = BytesIO(body)
+        reader = ChunkedReader(stream, 100)
+        assert b"".join(reader) == b"hello world"
+        assert reader.length == 11
+        assert reader.trailers == {"md5sum": "abc", "other": "x"}
+        assert stream.read() == b"extra"
+
+    @pytest.mark.parametrize(
+        "body,message",
+        (
+            (b"z\r\n", "invalid chunk size b'z'"),
+            (b"5\r\nhel", "truncated chunk"),
+            (b"5\r\nhelloX\r\n", "missing chunk terminator"),
+            (b"5\r\nhello\r\n", "truncated or overlong line"),
+            (b"0\r\nbad\r\n\r\n", "invalid trailer b'bad'"),
+            (b"b\r\nhello world\r\n0\r\n\r\n", "content object too large"),
+        ),
+    )
+    def test_errors(self, body, message):
+        with pytest.raises(ValueError) as exc:
+            b"".join(ChunkedReader(BytesIO(body), 10))
+        assert str(exc.value) == message
@@ -1,19 +1,24 @@
 """Tests for the Tool Meister module.
 """
 
+import hashlib
 from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
 import io
 import logging
 from pathlib import Path
 import shutil
 import signal
 import subprocess
+import tarfile
+from threading import Thread
 from typing import Any, List, NamedTuple, Tuple
 import uuid
 
 import pytest
 import responses
 
+from pbench.agent.tool_data_sink import ChunkedReader
 from pbench.agent.tool_meister import (
     DcgmTool,
     log_raw_io_output,
@@ -1246,3 +1251,95 @@ class TestSendDirectory:
         assert f"Failed to create an empty tar {self.directory}.tar.xz" in str(
             exc.value
         )
+
+
+class TestStreamDirectory:
+    """Test streaming tool data with ToolMeister._send_directory()"""
+
+    @pytest.fixture
+    def tds(self):
+        """A minimal Tool Data Sink recording the chunked PUT requests"""
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_PUT(self):
+                reader = ChunkedReader(self.rfile, 2**20)
+                data = b"".join(reader)
+                received.append((self.path, dict(self.headers), data, reader.trailers))
+                status = HTTPStatus.OK if reader.trailers else HTTPStatus.BAD_REQUEST
+                self.send_response(status)
+                self.end_headers()
+                self.wfile.write(b"done")
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server.server_port, received
+        server.shutdown()
+        server.server_close()
+
+    @staticmethod
+    def tool_meister(tmp_path: Path, port: int, compression: str) -> ToolMeister:
+        params = dict(tm_params, tds_hostname="127.0.0.1", tds_port=port)
+        params.update(compression=compression, stream=True)
+        return ToolMeister(
+            pbench_install_dir=tmp_path,
+            tmp_dir=tmp_path,
+            tar_path=shutil.which("tar"),
+            sysinfo_dump=None,
+            tm_params=ToolMeister.fetch_params(params),
+            redis_server=None,
+            logger=logging.getLogger(),
+        )
+
+    @pytest.mark.parametrize("compression", ("gzip:1", "none"))
+    def test_stream(self, tmp_path, tds, compression):
+        """The tar stream is sent with its MD5 as a trailer, and the local
+        data is removed.
+        """
+        port, received = tds
+        parent = tmp_path / "tm-data"
+        directory = parent / tm_params["hostname"]
+        (directory / "tool").mkdir(parents=True)
+        (directory / "tool" / "data.txt").write_text("tool data\n" * 1000)
+        tm = self.tool_meister(tmp_path, port, compression)
+
+        assert tm._send_directory(directory, "uri", "ctx") == 0
+        assert not parent.exists()
+
+        assert len(received) == 1
+        path, headers, data, trailers = received[0]
+        assert path == f"/uri/ctx/{tm_params['hostname']}"
+        assert headers["Transfer-Encoding"] == "chunked"
+        assert headers["compression"] == compression.split(":")[0]
+        assert trailers == {"md5sum": hashlib.md5(data).hexdigest()}
+        mode = "r:gz" if compression != "none" else "r:"
+        with tarfile.open(fileobj=io.BytesIO(data), mode=mode) as tar:
+            member = tar.extractfile(f"{tm_params['hostname']}/tool/data.txt")
+            assert member.read() == b"tool data\n" * 1000
+
+    def test_stream_tar_failure(self, tmp_path, tds):
+        """If the tar stream fails, no MD5 trailer is sent, and an empty tar
+        stream is sent instead.
+        """
+        port, received = tds
+        directory = tmp_path / "tm-data" / tm_params["hostname"]
+        directory.parent.mkdir()
+        tm = self.tool_meister(tmp_path, port, "xz")
+
+        # The directory doesn't exist, so tar fails
+        assert tm._send_directory(directory, "uri", "ctx") == 0
+        assert len(received) == 2
+        assert received[0][3] == {}
+        assert received[1][3]["md5sum"] == hashlib.md5(received[1][2]).hexdigest()
+
+    def test_bad_compression(self):
+        with pytest.raises(ToolMeisterError) as exc:
+            ToolMeister.fetch_params(dict(tm_params, compression="zstd:42"))
+        assert (
+            str(exc.value)
+            == "Invalid parameter block, unsupported zstd compression level '42'"
+        )
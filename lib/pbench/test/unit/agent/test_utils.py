@@ -1,13 +1,15 @@
 """Tests for the utils module.
 """
 import os
+from pathlib import Path
 import signal
+import tempfile
 import time
 
 import ifaddr
 import pytest
 
-from pbench.agent.utils import BaseReturnCode, BaseServer, LocalRemoteHost
+from pbench.agent.utils import BaseReturnCode, BaseServer, LocalRemoteHost, TemplateSsh
 
 
 class OurServer(BaseServer):
@@ -252,3 +254,78 @@ class TestLocalRemoteHost:
         assert lrh.is_local("2600::1"), "'2600::1' should be local"
         assert lrh.is_local("2600::0:0:1"), "'2600::0:0:1' should be local"
         assert not lrh.is_local("2600::3"), "'2600::3' should be remote"
+
+
+class TestTemplateSsh:
+    """Verify the TemplateSsh class."""
+
+    @staticmethod
+    @pytest.fixture
+    def fake_ssh(tmp_path):
+        """A fake ssh command which reports its arguments, and which can't
+        finish until its remote host's "release" file exists.
+        """
+        ssh = tmp_path / "ssh"
+        ssh.write_text(
+            "#!/bin/bash\n"
+            'host="${@: -2:1}"\n'
+            f'while [[ ! -e {tmp_path}/"${{host}}" ]]; do sleep 0.01; done\n'
+            'echo "${@}"\n'
+        )
+        ssh.chmod(0o755)
+        return ssh
+
+    def test_multiplexed(self, fake_ssh, tmp_path):
+        template = TemplateSsh(
+            str(fake_ssh), ["-o", "ControlMaster=no"], "run {arg}", tmp_path
+        )
+        (tmp_path / "a").touch()
+        template.start("a", arg="x")
+        ret = template.wait("a")
+        assert ret.status == 0
+        assert ret.elapsed > 0.0
+        assert ret.stdout == (
+            f"-o ControlMaster=no -o ControlMaster=auto -o ControlPath={tmp_path}/%C"
+            f" -o ControlPersist={TemplateSsh.CONTROL_PERSIST} a run x\n"
+        )
+
+    def test_control_path(self):
+        """The default control directory leaves room for the socket which
+        ssh binds before renaming it to the expanded control path.
+        """
+        control_dir = Path(tempfile.mkdtemp(prefix="pbt."))
+        try:
+            path = TemplateSsh.control_path(control_dir)
+        finally:
+            control_dir.rmdir()
+        assert path == f"{control_dir}/%C"
+        path = path.replace("%C", "0" * 40)
+        assert len(path) + 17 < 108
+
+        # A control directory with too long a path isn't used.
+        long_dir = Path("/") / ("x" * 50)
+        assert TemplateSsh.control_path(long_dir) is None
+        template = TemplateSsh("ssh", [], "run", long_dir)
+        assert template.base_args == ["ssh"]
+
+    def test_max_sessions(self, fake_ssh, tmp_path):
+        hosts = ("a", "b", "c", "d")
+        template = TemplateSsh(str(fake_ssh), [], "run {name}", max_sessions=2)
+        template.start("a", name="a")
+        template.start("b", name="b")
+        assert list(template.procs) == ["a", "b"]
+
+        # Starting a third session must wait for the oldest to complete
+        (tmp_path / "a").touch()
+        template.start("c", name="c")
+        assert list(template.procs) == ["b", "c"]
+        assert list(template.done) == ["a"]
+
+        for host in hosts[1:]:
+            (tmp_path / host).touch()
+        template.start("d", name="d")
+        for host in hosts:
+            ret = template.wait(host)
+            assert ret.status == 0
+            assert ret.stdout == f"{host} run {host}\n"
+        assert not template.procs and not template.done and not template.started
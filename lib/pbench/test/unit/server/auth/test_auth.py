@@ -823,3 +823,72 @@ class TestAuthModule:
             current_app.secret_key = jwt_secret
             user = Auth.verify_auth(pbench_invalid_api_key)
         assert user is None
+
+    def test_token_cache(
+        self, monkeypatch, mock_oidc, db_session, rsa_keys, make_logger
+    ):
+        """Verify that a verified OIDC token is cached until it expires"""
+        client_id = "us"
+        audience = "server"
+        now = 1700000000.0
+        token, _ = gen_rsa_token(audience, rsa_keys["private_key"], exp=now + 30)
+        config = mock_oidc(client_id, public_key=rsa_keys["public_key"])
+        oidc_client = OpenIDClient.construct_oidc_client(config)
+        monkeypatch.setattr(Auth, "oidc_client", oidc_client)
+        monkeypatch.setattr(Auth, "token_cache", Auth.TokenCache(size=2, ttl=60))
+
+        calls = []
+
+        def introspect(token: str) -> JSONOBJECT:
+            calls.append(token)
+            return jwt.decode(token, options={"verify_signature": False})
+
+        monkeypatch.setattr(oidc_client, "token_introspect", introspect)
+        clock = [now]
+        monkeypatch.setattr(Auth.time, "time", lambda: clock[0])
+
+        app = Flask("test-token-cache")
+        app.logger = make_logger
+        app.server_config = config
+        with app.app_context():
+            user = Auth.verify_auth(token)
+            assert user.id == "12345"
+            assert calls == [token]
+
+            # Within the token's lifetime the user is found in the cache
+            clock[0] = now + 20
+            user = Auth.verify_auth(token)
+            assert user.id == "12345"
+            assert user.username == "dummy"
+            assert calls == [token]
+            assert Auth.token_cache.stats() == {
+                "size": 1,
+                "hits": 1,
+                "misses": 1,
+                "evictions": 0,
+            }
+
+            # Once the token expires, it must be verified again
+            clock[0] = now + 31
+            Auth.verify_auth(token)
+            assert calls == [token, token]
+
+            # The least recently used token is evicted to bound the cache
+            for name in ("one", "two"):
+                other, _ = gen_rsa_token(
+                    audience, rsa_keys["private_key"], exp=now + 90, username=name
+                )
+                Auth.verify_auth(other)
+            assert Auth.token_cache.stats()["evictions"] == 1
+            assert Auth.token_cache.lookup(token) is None
+
+    def test_token_cache_report(self, monkeypatch):
+        """Verify that the token cache counters are reported periodically"""
+        clock = [1700000000.0]
+        monkeypatch.setattr(Auth.time, "time", lambda: clock[0])
+        cache = Auth.TokenCache(size=2, ttl=60)
+        assert cache.lookup("token") is None
+        assert cache.report() is None
+        clock[0] += Auth.TokenCache.REPORT_INTERVAL
+        assert cache.report() == {"size": 0, "hits": 0, "misses": 1, "evictions": 0}
+        assert cache.report() is None
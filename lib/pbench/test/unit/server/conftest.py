@@ -25,11 +25,13 @@ from pbench.server import PbenchServerConfig
 from pbench.server.api import create_app
 from pbench.server.api.resources.intake_base import IntakeBase
 import pbench.server.auth.auth as Auth
+from pbench.server.cache_manager import CacheManager
 from pbench.server.database import init_db
 from pbench.server.database.database import Database
 from pbench.server.database.models.api_keys import APIKey
 from pbench.server.database.models.datasets import Dataset, Metadata
 from pbench.server.database.models.index_map import IndexMap
+from pbench.server.database.models.server_settings import ServerSetting
 from pbench.server.database.models.templates import Template
 from pbench.server.database.models.users import User
 from pbench.test import on_disk_config
@@ -129,6 +131,23 @@ def server_config(on_disk_server_config) -> PbenchServerConfig:
     return server_config
 
 
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    """The server caches verified authorization tokens process-wide; discard
+    them so that each test case verifies its tokens against its own users.
+    """
+    Auth.token_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_model_caches():
+    """The server caches server settings and templates process-wide; discard
+    them so that each test case sees only its own database rows.
+    """
+    ServerSetting.cache.clear()
+    Template.cache.clear()
+
+
 @pytest.fixture(scope="session")
 def rsa_keys():
     """Fixture for generating an RSA public / private key pair.
@@ -189,7 +208,11 @@ def client(monkeypatch, server_config, add_auth_connection_mock):
     NOTE: The Flask app initialization includes setting up the SQLAlchemy DB.
     For test cases that require the DB but not a full Flask app context, use
     the db_session fixture instead, which adds DB cleanup after the test.
+
+    NOTE: The APIs share a process-wide CacheManager instance; discard it so
+    that each test case starts with an empty registry.
     """
+    CacheManager.reset_shared()
     app = create_app(server_config)
     app.config["PREFERRED_URL_SCHEME"] = "https"
 
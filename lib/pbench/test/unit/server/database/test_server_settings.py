@@ -151,6 +151,28 @@ class TestServerSetting:
             ],
         )
 
+    def test_get_disabled_cached(self):
+        """Test that the server state is read through the cache, and that
+        setting it invalidates the cache
+        """
+        assert ServerSetting.get_disabled() is None
+        assert ServerSetting.get_disabled(readonly=True) is None
+        disabled = {"status": "readonly", "message": "Look but don't touch"}
+        ServerSetting.set(key="server-state", value=disabled)
+        assert ServerSetting.get_disabled() == disabled
+        assert ServerSetting.get_disabled(readonly=True) is None
+
+        # NOTE: the first `get_disabled` does a query, and the second uses the
+        # cached default value; the `set` checks whether the key exists, and
+        # invalidates the cache, so the next `get_disabled` does a query.
+        self.session.check_session(
+            committed=[
+                FakeRow(cls=ServerSetting, id=1, key="server-state", value=disabled)
+            ],
+            queries=3,
+            filters=["key=server-state", "key=server-state", "key=server-state"],
+        )
+
     def test_missing(self):
         """Check that 'create' complains about a missing key"""
         with pytest.raises(ServerSettingMissingKey):
@@ -2,6 +2,7 @@ import datetime
 
 import pytest
 
+from pbench.server.database.database import Database
 from pbench.server.database.models.templates import (
     Template,
     TemplateDuplicate,
@@ -110,6 +111,42 @@ class TestTemplate:
         assert template2.name == template1.name
         assert template2.id is template1.id
 
+    def test_find_cached(self, fake_mtime, db_session):
+        """Test that a template is found through the cache after the first
+        lookup, and that an update invalidates the cache
+        """
+        template = Template(
+            name="run",
+            idxname="run-data",
+            template_name="run",
+            file="run-toc.json",
+            template_pattern="drb.v2.run-toc.*",
+            index_template="drb.v2.run-toc.{year}-{month}",
+            settings={"none": False},
+            mappings={"properties": None},
+            version=5,
+        )
+        template.add()
+        before = Template.cache.stats()
+        Template.find(name="run")
+        stats = Template.cache.stats()
+        assert stats["size"] == 1
+        assert stats["misses"] == before["misses"] + 1
+
+        # A cached template from another session is attached to the current
+        # session without a query.
+        Database.db_session.expunge_all()
+        found = Template.find(name="run")
+        assert Template.cache.stats()["hits"] == stats["hits"] + 1
+        assert found in Database.db_session
+        assert found.index_template == "drb.v2.run-toc.{year}-{month}"
+
+        found.version = 6
+        found.update()
+        assert Template.cache.stats()["size"] == 0
+        Database.db_session.expunge_all()
+        assert Template.find(name="run").version == "6"
+
     def test_find_none(self, fake_mtime, db_session):
         """Test expected failure when we try to find a template that
         does not exist.
@@ -1,10 +1,14 @@
 import copy
 from http import HTTPStatus
+import os
+import socket
 
 import pytest
+import responses
 
 from pbench.server import OperationCode
 from pbench.server.api.resources import ApiMethod
+from pbench.server.api.resources.query_apis.datasets import datasets
 from pbench.server.api.resources.query_apis.datasets.datasets import Datasets
 from pbench.server.database.models.audit import Audit, AuditStatus, AuditType
 from pbench.server.database.models.datasets import (
@@ -608,3 +612,221 @@ class TestDatasets(Commons):
             headers=headers,
             expect_call=True,
         )
+
+    @pytest.fixture()
+    def inline_thread(self, monkeypatch):
+        """Run task tracking threads synchronously, without sleeping"""
+
+        class InlineThread:
+            def __init__(self, target, args, **kwargs):
+                self.target = target
+                self.args = args
+
+            def start(self):
+                self.target(*self.args)
+
+        sleeps = []
+        monkeypatch.setattr(datasets, "Thread", InlineThread)
+        monkeypatch.setattr(datasets.time, "sleep", lambda s: sleeps.append(s))
+        return sleeps
+
+    def test_update_task(
+        self, client, server_config, provide_metadata, get_token_func, inline_thread
+    ):
+        """Check an update submitted as an Elasticsearch task"""
+
+        token = get_token_func("drb")
+        headers = {"authorization": f"bearer {token}"}
+        index = self.build_index_from_metadata()
+        base_uri = server_config.get("Indexing", "uri")
+        task = "node:42"
+        results = {"total": 2, "updated": 2, "version_conflicts": 0, "failures": []}
+
+        with responses.RequestsMock() as rsp:
+            rsp.add(
+                responses.POST,
+                f"{base_uri}{index}/_update_by_query?ignore_unavailable=true"
+                "&refresh=true&wait_for_completion=false&slices=auto",
+                json={"task": task},
+            )
+            rsp.add(
+                responses.GET, f"{base_uri}/_tasks/{task}", json={"completed": False}
+            )
+            rsp.add(
+                responses.GET,
+                f"{base_uri}/_tasks/{task}",
+                json={"completed": True, "response": results},
+            )
+            response = client.post(
+                f"{server_config.rest_uri}/datasets/random_md5_string1",
+                headers=headers,
+                query_string={"access": "public", "wait": "false"},
+            )
+        assert response.status_code == HTTPStatus.ACCEPTED
+        assert response.json == {"task": task}
+        assert inline_thread == [5]
+
+        drb = Dataset.query(name="drb")
+        assert drb.access == "public"
+        ops = Operation.by_dataset(drb)
+        assert [(o.name, o.state) for o in ops] == [
+            (OperationName.UPDATE, OperationState.OK)
+        ]
+        audit = Audit.query()
+        assert len(audit) == 2
+        assert audit[1].root_id == audit[0].id
+        assert audit[1].status == AuditStatus.SUCCESS
+        assert audit[1].attributes == {
+            "access": "public",
+            "task": task,
+            "results": {
+                "total": 2,
+                "updated": 2,
+                "deleted": 0,
+                "version_conflicts": 0,
+                "failures": 0,
+            },
+        }
+
+    def test_delete_task_failed(
+        self, client, server_config, provide_metadata, get_token_func, inline_thread
+    ):
+        """Check a delete task which Elasticsearch reports as failed"""
+
+        token = get_token_func("drb")
+        headers = {"authorization": f"bearer {token}"}
+        index = self.build_index_from_metadata()
+        base_uri = server_config.get("Indexing", "uri")
+        task = "node:43"
+
+        with responses.RequestsMock() as rsp:
+            rsp.add(
+                responses.POST,
+                f"{base_uri}{index}/_delete_by_query?ignore_unavailable=true"
+                "&refresh=true&wait_for_completion=false&slices=auto",
+                json={"task": task},
+            )
+            rsp.add(
+                responses.GET,
+                f"{base_uri}/_tasks/{task}",
+                json={"completed": True, "error": {"type": "bad"}},
+            )
+            response = client.delete(
+                f"{server_config.rest_uri}/datasets/random_md5_string1",
+                headers=headers,
+                query_string={"wait": "false"},
+            )
+        assert response.status_code == HTTPStatus.ACCEPTED
+        assert inline_thread == []
+
+        # The dataset survives, with the failure recorded
+        drb = Dataset.query(name="drb")
+        ops = Operation.by_dataset(drb)
+        assert [(o.name, o.state) for o in ops] == [
+            (OperationName.DELETE, OperationState.FAILED)
+        ]
+        message = f"Elasticsearch task {task} failed: {{'type': 'bad'}}"
+        assert ops[0].message.endswith(message)
+        audit = Audit.query()
+        assert len(audit) == 2
+        assert audit[1].status == AuditStatus.FAILURE
+        assert audit[1].attributes["task"] == task
+        assert audit[1].attributes["message"] == ops[0].message
+
+    def test_abandon_tasks(self, client, server_config, more_datasets):
+        """Check that operations whose Elasticsearch task tracker is gone are
+        failed, so they don't block later updates of the dataset.
+        """
+        base_uri = server_config.get("Indexing", "uri")
+        host = socket.gethostname()
+        root_id = Audit.create(
+            operation=OperationCode.DELETE,
+            status=AuditStatus.BEGIN,
+            name="delete",
+            dataset=Dataset.query(name="fio_1"),
+        ).id
+        tasks = [
+            # Trackers from an earlier server instance
+            ("drb", OperationName.UPDATE, f"node:1 (tracker {host}/1/2, audit 999)"),
+            (
+                "fio_1",
+                OperationName.DELETE,
+                f"node:2 (tracker {host}/1/2, audit {root_id})",
+            ),
+            # A tracker on another host
+            ("fio_2", OperationName.UPDATE, "node:3 (tracker elsewhere/1/2, audit 1)"),
+            # A live tracker in this server instance
+            (
+                "test",
+                OperationName.UPDATE,
+                f"node:4 (tracker {host}/{os.getppid()}/{os.getppid()}, audit 1)",
+            ),
+        ]
+        for name, component, message in tasks:
+            Sync(client.logger, component).update(
+                Dataset.query(name=name),
+                OperationState.WORKING,
+                message=f"Elasticsearch task {message}",
+            )
+        Sync(client.logger, OperationName.DELETE).update(
+            Dataset.query(name="uperf_1"), OperationState.WORKING
+        )
+
+        with responses.RequestsMock() as rsp:
+            rsp.add(responses.POST, f"{base_uri}/_tasks/node:1/_cancel", json={})
+            rsp.add(responses.POST, f"{base_uri}/_tasks/node:2/_cancel", json={})
+            Datasets(server_config).abandon_tasks(client.application)
+
+        states = {
+            n: [
+                (o.name, o.state, o.message)
+                for o in Operation.by_dataset(Dataset.query(name=n))
+            ]
+            for n in ("drb", "fio_1", "fio_2", "test", "uperf_1")
+        }
+        assert states == {
+            "drb": [
+                (
+                    OperationName.UPDATE,
+                    OperationState.FAILED,
+                    "Elasticsearch task node:1 was abandoned: please retry",
+                )
+            ],
+            "fio_1": [
+                (
+                    OperationName.DELETE,
+                    OperationState.FAILED,
+                    "Elasticsearch task node:2 was abandoned: please retry",
+                )
+            ],
+            "fio_2": [
+                (
+                    OperationName.UPDATE,
+                    OperationState.WORKING,
+                    f"Elasticsearch task {tasks[2][2]}",
+                )
+            ],
+            "test": [
+                (
+                    OperationName.UPDATE,
+                    OperationState.WORKING,
+                    f"Elasticsearch task {tasks[3][2]}",
+                )
+            ],
+            "uperf_1": [(OperationName.DELETE, OperationState.WORKING, None)],
+        }
+        audit = Audit.query(status=AuditStatus.FAILURE)
+        assert [(a.root_id, a.attributes) for a in audit] == [
+            (
+                root_id,
+                {
+                    "task": "node:2",
+                    "message": "Elasticsearch task node:2 was abandoned: please retry",
+                },
+            )
+        ]
+
+        # Once failed, the operations are left alone.
+        with responses.RequestsMock() as rsp:
+            Datasets(server_config).abandon_tasks(client.application)
+            assert not rsp.calls
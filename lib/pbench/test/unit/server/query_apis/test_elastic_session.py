@@ -0,0 +1,57 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+import responses
+
+from pbench.server.api.resources.query_apis import ElasticSession
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """A minimal HTTP/1.1 handler which keeps its connections open."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def es_server():
+    """Run a local HTTP server standing in for Elasticsearch."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestElasticSession:
+    def test_shared(self, server_config):
+        """The session is shared by all APIs using the same configuration"""
+        session = ElasticSession.shared(server_config)
+        assert ElasticSession.shared(server_config) is session
+        assert session.pool_size == 10
+        assert session.timeout == (10, None)
+
+    def test_keep_alive(self, server_config, es_server):
+        """Successive calls reuse the same pooled connection"""
+        session = ElasticSession(server_config)
+        with responses.RequestsMock() as rsps:
+            rsps.add_passthru(es_server)
+            for _ in range(3):
+                response = session.session.get(f"{es_server}/_search")
+                assert response.json() == {"ok": True}
+        stats = session.stats()
+        assert stats == {
+            es_server: {"connections": 1, "requests": 3, "idle": 1, "size": 10}
+        }
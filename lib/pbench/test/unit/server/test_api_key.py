@@ -283,6 +283,28 @@ class TestAPIKeyDelete:
         keys = APIKey.query(id=pbench_drb_secondary_api_key.id)
         assert keys[0].key == pbench_drb_secondary_api_key.key
 
+    def test_delete_api_key_revoked(
+        self,
+        query_delete_as,
+        pbench_drb_token,
+        pbench_drb_api_key,
+        pbench_drb_secondary_api_key,
+    ):
+        """A deleted API key is no longer accepted, even though its
+        verification was cached when it was used
+        """
+        query_delete_as(
+            pbench_drb_api_key.key, pbench_drb_secondary_api_key.id, HTTPStatus.OK
+        )
+        key_id = pbench_drb_api_key.id
+        query_delete_as(pbench_drb_token, key_id, HTTPStatus.OK)
+        response = query_delete_as(
+            pbench_drb_api_key.key, key_id, HTTPStatus.UNAUTHORIZED
+        )
+        assert response.json == {
+            "message": "User provided access_token is invalid or expired"
+        }
+
     def test_unauthorized_delete(
         self, query_delete_as, pbench_drb_token_invalid, pbench_drb_api_key
     ):
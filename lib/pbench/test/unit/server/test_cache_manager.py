@@ -1,3 +1,4 @@
+import copy
 import errno
 import fcntl
 import hashlib
@@ -8,6 +9,9 @@ from pathlib import Path
 import re
 import shutil
 import subprocess
+import tarfile
+import threading
+import time
 from typing import Optional
 
 import pytest
@@ -30,6 +34,7 @@ from pbench.server.cache_manager import (
     TarballNotFound,
     TarballUnpackError,
 )
+from pbench.server.database.database import Database
 from pbench.server.database.models.audit import Audit, AuditStatus, AuditType
 from pbench.server.database.models.datasets import Dataset, DatasetBadName, Metadata
 from pbench.server.database.models.users import User
@@ -220,6 +225,40 @@ class TestCacheManager:
             tarball = cm.find_dataset(md5)
             assert tarball.metadata == fake_get_metadata(tarball.tarball_path)
 
+    def test_create_unlocked_index(
+        self,
+        monkeypatch,
+        db_session,
+        selinux_disabled,
+        server_config,
+        make_logger,
+        tarball,
+    ):
+        """Test that the member index is built without holding the cache
+        manager lock, which would stall lookups of other datasets.
+        """
+        source_tarball, source_md5, md5 = tarball
+        cm = CacheManager(server_config, make_logger)
+        locked = []
+
+        def check_lock(self):
+            def try_lock():
+                if cm.lock.acquire(timeout=5.0):
+                    cm.lock.release()
+                    locked.append(False)
+                else:
+                    locked.append(True)
+
+            t = threading.Thread(target=try_lock)
+            t.start()
+            t.join()
+
+        monkeypatch.setattr(Tarball, "_get_metadata", fake_get_metadata)
+        monkeypatch.setattr(Tarball, "build_member_index", check_lock)
+        tarball = cm.create(source_tarball)
+        assert locked == [False]
+        assert cm.find_dataset(md5) is tarball
+
     def test_create_bad(
         self,
         monkeypatch,
@@ -592,6 +631,9 @@ class TestCacheManager:
             self.last_ref = self.cache / "last_ref"
             self.unpacked = None
             self.cachemap = None
+            self.cachemap_path = self.cache / "cachemap.json"
+            self.members = None
+            self.members_path = self.cache / "members.json"
             self.controller = controller
 
     def test_unpack_tar_subprocess_exception(
@@ -727,6 +769,58 @@ class TestCacheManager:
             sd141 = sd1["children"]["subdir14"]["children"]["subdir141"]
             assert sd141["children"]["f1412_sym"]["details"].type is CacheType.SYMLINK
 
+    def test_cache_map_index(self, make_logger, monkeypatch, tmp_path):
+        """Test that the cache map is saved to, and loaded from, the index"""
+        tar = Path("/mock/dir_name.tar.xz")
+        cache = tmp_path / ".cache"
+
+        with monkeypatch.context() as m:
+            m.setattr(Tarball, "__init__", TestCacheManager.MockTarball.__init__)
+            m.setattr(Controller, "__init__", TestCacheManager.MockController.__init__)
+            controller = Controller(Path("/mock/archive"), cache, make_logger)
+            tb = Tarball(tar, "ABC", controller)
+            tb.cache.mkdir(parents=True)
+            tar_dir = TestCacheManager.MockController.generate_test_result_tree(
+                tmp_path, "dir_name"
+            )
+            tb.unpacked = tar_dir
+            tb.build_map()
+            assert tb.cachemap_path.exists()
+
+            # A fresh Tarball object, with no unpacked tree, can find entries
+            # using the saved index.
+            def fail_get_results(_l):
+                raise AssertionError("Unexpected call to get_results")
+
+            new_tb = Tarball(tar, "ABC", controller)
+            m.setattr(new_tb, "get_results", fail_get_results)
+            for path in (
+                ".",
+                "f1.json",
+                "subdir1/f11.txt",
+                "subdir1/subdir12/f122_sym",
+                "subdir1/subdir14/subdir141/f1413_sym",
+            ):
+                assert new_tb.find_entry(Path(path)) == tb.find_entry(Path(path))
+            with pytest.raises(BadDirpath):
+                new_tb.find_entry(Path("subdir1/f11.txt/ne_subdir"))
+
+    def test_cache_map_bad_index(self, make_logger, monkeypatch, tmp_path):
+        """Test that a damaged cache map index is ignored"""
+        tar = Path("/mock/dir_name.tar.xz")
+        cache = tmp_path / ".cache"
+
+        with monkeypatch.context() as m:
+            m.setattr(Tarball, "__init__", TestCacheManager.MockTarball.__init__)
+            m.setattr(Controller, "__init__", TestCacheManager.MockController.__init__)
+            tb = Tarball(
+                tar, "ABC", Controller(Path("/mock/archive"), cache, make_logger)
+            )
+            tb.cache.mkdir(parents=True)
+            tb.cachemap_path.write_text("[not json")
+            assert not tb.load_map()
+            assert tb.cachemap is None
+
     @pytest.mark.parametrize(
         "file_path, expected_msg",
         [
@@ -1121,6 +1215,110 @@ class TestCacheManager:
             cm.get_inventory_bytes("id", "target")
         assert closed
 
+    def test_member_index(
+        self, selinux_enabled, server_config, make_logger, monkeypatch, tmp_path
+    ):
+        """Test reading single files through the member index
+
+        The index is built when the tarball is created, and allows reading a
+        file without unpacking the tarball.
+        """
+        monkeypatch.setattr(Tarball, "_get_metadata", fake_get_metadata)
+        monkeypatch.setattr(Dataset, "query", lambda **_k: None)
+        name = "pbench-user-benchmark_member-index_2021.05.01T12.42.42"
+        source = tmp_path / "src"
+        (source / name / "1-default").mkdir(parents=True)
+        files = {
+            "metadata.log": b"[pbench]\ndate = 2002-05-16\n",
+            "result.csv": b"a,b\n1,2\n",
+            "1-default/result.csv": b"x" * 10000,
+            "1-default/big.bin": bytes(range(256)) * 5000,
+        }
+        for path, data in files.items():
+            (source / name / path).write_bytes(data)
+        (source / name / "link").symlink_to("metadata.log")
+        tar = tmp_path / f"{name}.tar.xz"
+        with tarfile.open(tar, "w:xz") as t:
+            t.add(source / name, arcname=name)
+        md5 = hashlib.md5(tar.read_bytes()).hexdigest()
+        tar.with_suffix(".xz.md5").write_text(f"{md5} {tar.name}\n")
+
+        cm = CacheManager(server_config, make_logger)
+        tarball = cm.create(tar)
+        assert tarball.members_path.exists()
+        assert set(tarball.members) == {f"{name}/{p}" for p in files} | {
+            name,
+            f"{name}/1-default",
+            f"{name}/link",
+        }
+        assert (
+            tarball.members[f"{name}/metadata.log"]["data"]
+            == files["metadata.log"].decode()
+        )
+        assert "data" not in tarball.members[f"{name}/1-default/result.csv"]
+        assert "data" not in tarball.members[f"{name}/1-default/big.bin"]
+
+        # Concurrent requests for a dataset without an index build it once,
+        # and no temporary index files are left behind.
+        builds = []
+        build = Tarball.build_member_index
+
+        def slow_build(self):
+            builds.append(self.name)
+            time.sleep(0.1)
+            build(self)
+
+        monkeypatch.setattr(Tarball, "build_member_index", slow_build)
+        tarball.members_path.unlink()
+        tarball.members = None
+        threads = [
+            threading.Thread(target=tarball.ensure_member_index) for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert builds == [name]
+        assert tarball.members_path.exists()
+        assert not [p for p in tarball.cache.iterdir() if p.name.startswith(".")]
+
+        # Read each file without unpacking the tarball, and without tar(1),
+        # using a freshly loaded index.
+        def no_tar(*_args, **_kwargs):
+            raise AssertionError("tar(1) should not be used")
+
+        monkeypatch.setattr(subprocess, "Popen", no_tar)
+        monkeypatch.setattr(subprocess, "run", no_tar)
+        tarball.members = None
+        for path, data in files.items():
+            assert tarball.read_member(path) == data
+        assert cm.get_inventory_bytes(md5, "result.csv") == "a,b\n1,2\n"
+        assert tarball.unpacked is None
+        assert tarball.read_member("link") == files["metadata.log"]
+
+        # The member list matches the tarball's, without decompressing it.
+        with tarfile.open(tarball.tarball_path) as t:
+            expected = [
+                (m.name, m.type, m.mode, m.mtime, m.size, m.linkname)
+                for m in t.getmembers()
+            ]
+        monkeypatch.setattr(tarfile, "open", no_tar)
+        tarball.members = None
+        assert [
+            (m.name, m.type, m.mode, m.mtime, m.size, m.linkname)
+            for m in tarball.get_members()
+        ] == expected
+        for path in ("1-default", "missing.csv"):
+            with pytest.raises(CacheExtractBadPath):
+                tarball.read_member(path)
+        with pytest.raises(CacheExtractError):
+            cm.get_inventory_bytes(md5, "1-default/big.bin")
+
+        # Without an index, there's nothing to read.
+        tarball.delete()
+        assert not tarball.members_path.exists()
+        assert tarball.read_member("metadata.log") is None
+
     def test_cm_inventory(self, monkeypatch, server_config, make_logger):
         """Verify the happy path of the high level get_inventory"""
         dataset_id = None
@@ -1554,7 +1752,9 @@ class TestCacheManager:
         assert stream.lock is None
         assert my_calls == exp_calls
 
-    def test_get_contents(self, server_config, make_logger, tarball, db_session):
+    def test_get_contents(
+        self, server_config, make_logger, tarball, db_session, monkeypatch
+    ):
         """Test the TOC analysis"""
 
         source_tarball, source_md5, md5 = tarball
@@ -1585,13 +1785,31 @@ class TestCacheManager:
             "size": 28,
         }
 
+        with pytest.raises(CacheExtractError):
+            cm.get_contents(md5, "../..", root)
+
+        # The contents were described by the member index, without unpacking
+        tarball = cm.find_dataset(md5)
+        assert tarball.unpacked is None
+
+        # Without a member index, we fall back to unpacking the tarball
+        monkeypatch.setattr(Tarball, "build_member_index", lambda self: None)
+        tarball.members_path.unlink()
+        tarball.members = None
+        assert cm.get_contents(md5, "metadata.log", root) == {
+            "name": "metadata.log",
+            "type": "FILE",
+            "uri": f"{root}/inventory/metadata.log",
+            "size": 28,
+        }
+
         with pytest.raises(CacheExtractError):
             cm.get_contents(md5, "../..", root)
 
         # Now that we have an unpacked directory, manually "enhance" it to test
         # more paths.
 
-        base: Path = cm.find_dataset(md5).unpacked
+        base: Path = tarball.unpacked
         subdir = base / "subdir"
         subdir.mkdir()
         ldir = base / "dir_link"
@@ -1718,6 +1936,89 @@ class TestCacheManager:
             "uri": f"{root}/inventory/fifo",
         }
 
+    def test_get_index_contents(
+        self, selinux_enabled, server_config, make_logger, monkeypatch, tmp_path
+    ):
+        """Test that the member index describes the contents of a tarball
+        exactly as the unpacked tarball does, without unpacking it.
+        """
+        monkeypatch.setattr(Tarball, "_get_metadata", fake_get_metadata)
+        monkeypatch.setattr(Dataset, "query", lambda **_k: None)
+        name = "pbench-user-benchmark_contents_2021.05.01T12.42.42"
+        source = tmp_path / "src"
+        base = source / name
+        (base / "subdir" / "nested").mkdir(parents=True)
+        (base / "metadata.log").write_text("[pbench]\ndate = 2002-05-16\n")
+        (base / "subdir" / "data.bin").write_bytes(b"x" * 1000)
+        os.link(base / "subdir" / "data.bin", base / "hard_link")
+        (base / "dir_link").symlink_to("subdir")
+        (base / "file_link").symlink_to("metadata.log")
+        (base / "link_link").symlink_to("file_link")
+        (base / "nested_link").symlink_to("dir_link/nested")
+        (base / "bad_link").symlink_to("/etc/passwd")
+        (base / "illegal_link").symlink_to("..")
+        (base / "missing_link").symlink_to("missing")
+        (base / "subdir" / "up_link").symlink_to("../metadata.log")
+        os.mkfifo(base / "fifo")
+        (base / "fifo_link").symlink_to("fifo")
+        tar = tmp_path / f"{name}.tar.xz"
+        with tarfile.open(tar, "w:xz") as t:
+            # Omit the directory members, which tar(1) doesn't require
+            for path in sorted(base.rglob("*")):
+                if path.is_dir() and not path.is_symlink():
+                    continue
+                t.add(path, arcname=f"{name}/{path.relative_to(base)}")
+            t.add(base / "subdir" / "nested", arcname=f"{name}/subdir/nested")
+        md5 = hashlib.md5(tar.read_bytes()).hexdigest()
+        tar.with_suffix(".xz.md5").write_text(f"{md5} {tar.name}\n")
+
+        cm = CacheManager(server_config, make_logger)
+        tarball = cm.create(tar)
+        root = f"https://fake/api/v1/datasets/{md5}"
+        paths = [
+            "",
+            ".",
+            "subdir",
+            "subdir/",
+            "subdir/nested",
+            "subdir/up_link",
+            "dir_link",
+            "dir_link/data.bin",
+            "dir_link/nested",
+            "nested_link",
+            "metadata.log",
+            "hard_link",
+            "file_link",
+            "link_link",
+            "bad_link",
+            "illegal_link",
+            "missing_link",
+            "fifo",
+            "fifo_link",
+            "missing",
+        ]
+        described = {p: cm.get_contents(md5, p, root) for p in paths}
+        assert tarball.unpacked is None
+        with pytest.raises(CacheExtractError):
+            cm.get_contents(md5, "../..", root)
+        assert tarball.unpacked is None
+
+        for path in paths:
+            assert tarball.get_unpacked_contents(path, root) == described[path], path
+        assert described["dir_link/data.bin"]["size"] == 1000
+        assert described["hard_link"]["size"] == 1000
+        assert [f["name"] for f in described[""]["files"]] == [
+            "bad_link",
+            "fifo",
+            "fifo_link",
+            "file_link",
+            "hard_link",
+            "illegal_link",
+            "link_link",
+            "metadata.log",
+            "missing_link",
+        ]
+
     def test_find(
         self,
         selinux_enabled,
@@ -1821,6 +2122,107 @@ class TestCacheManager:
         assert list(new.datasets) == [md5]
         assert list(new.tarballs) == [dataset_name]
 
+    def test_mark_in_use(self, server_config, make_logger):
+        """Test that overlapping users of a dataset keep it in use until the
+        last of them releases it.
+        """
+        cm = CacheManager(server_config, make_logger)
+        cm.mark_in_use(["ABC", "DEF"])
+        cm.mark_in_use(["DEF"])
+        assert cm.in_use == {"ABC", "DEF"}
+        cm.release_in_use(["ABC", "DEF"])
+        assert cm.in_use == {"DEF"}
+        cm.release_in_use(["DEF"])
+        assert not cm.in_use and not cm.in_use_count
+
+    def test_shared_registry(
+        self,
+        selinux_enabled,
+        server_config,
+        make_logger,
+        tarball,
+        monkeypatch,
+        db_session,
+    ):
+        """Test the process-wide shared CacheManager and its tarball registry
+
+        Once a tarball is known, lookups should return the same object, and
+        the registry should drop entries that have been invalidated behind
+        its back.
+        """
+        monkeypatch.setattr(Tarball, "_get_metadata", fake_get_metadata)
+        source_tarball, _, md5 = tarball
+        CacheManager.reset_shared()
+        cm = CacheManager.shared(server_config, make_logger)
+        assert CacheManager.shared(server_config, make_logger) is cm
+        created = cm.create(source_tarball)
+
+        # A lookup of a recently validated dataset is served directly from
+        # the registry, without touching the database or the file system.
+        created.unpacked = None
+        (created.cache / created.name).mkdir()
+        with monkeypatch.context() as m:
+            m.setattr(Dataset, "query", lambda **_k: pytest.fail("queried"))
+            m.setattr(Tarball, "refresh", lambda _s: pytest.fail("refreshed"))
+            assert cm.find_dataset(md5) is created
+        assert created.unpacked is None
+
+        # Once the TTL expires, a lookup revalidates the dataset, and sees an
+        # unpacked tree even when another process created it.
+        monkeypatch.setattr(Tarball, "REFRESH_TTL", 0.0)
+        tarball = cm.find_dataset(md5)
+        assert tarball is created
+        assert tarball.unpacked == created.cache / created.name
+
+        # The Dataset is re-queried only when it's needed in a new database
+        # session.
+        queried = []
+
+        def mock_query(**kwargs) -> JSONOBJECT:
+            queried.append(kwargs["resource_id"])
+            return {"resource_id": kwargs["resource_id"]}
+
+        monkeypatch.setattr(Dataset, "query", mock_query)
+        Database.db_session.remove()
+        dataset = created.dataset
+        assert created.dataset is dataset
+        assert queried == [md5]
+        Database.db_session.remove()
+        assert created.dataset is not dataset
+        assert queried == [md5, md5]
+
+        # ... or reclaimed it.
+        (created.cache / created.name).rmdir()
+        assert cm.find_dataset(md5) is created
+        assert created.unpacked is None
+
+        # Forgetting a dataset removes it from the registry without touching
+        # the ARCHIVE tree.
+        cm.forget(md5)
+        assert md5 not in cm
+        assert created.name not in cm.tarballs
+        assert md5 not in created.controller.datasets
+        assert created.tarball_path.exists()
+        cm.forget(md5)
+
+        # If the tarball disappears, a registered entry is stale and is
+        # dropped rather than returned.
+        cm.datasets[md5] = created
+        cm.tarballs[created.name] = created
+        created.tarball_path.unlink()
+        with pytest.raises(TarballNotFound):
+            cm.find_dataset(md5)
+        assert md5 not in cm
+        assert created.name not in cm.tarballs
+
+        # A new configuration object replaces the shared instance, and so does
+        # an explicit reset.
+        other = CacheManager.shared(copy.copy(server_config), make_logger)
+        assert other is not cm
+        CacheManager.reset_shared()
+        assert CacheManager.shared(server_config, make_logger) is not other
+        CacheManager.reset_shared()
+
     def test_lifecycle(
         self,
         db_session,
@@ -1,5 +1,6 @@
 from http import HTTPStatus
 from pathlib import Path
+import threading
 from typing import Optional
 
 import pytest
@@ -112,6 +113,47 @@ class TestCompareDatasets:
             "Internal Pbench Server Error: log reference "
         )
 
+    def test_concurrent_extract(self, query_get_as, monkeypatch):
+        """The result.csv files of the datasets are extracted concurrently"""
+
+        # Each extraction waits for the other, so this will time out unless
+        # both are in progress at the same time.
+        barrier = threading.Barrier(2, timeout=10.0)
+        extracted = []
+        in_use = []
+
+        def mock_get_inventory_bytes(_self, dataset: str, path: str) -> str:
+            assert path == "result.csv"
+            barrier.wait()
+            in_use.append((_self, sorted(_self.in_use)))
+            extracted.append(dataset)
+            return f"data for {dataset}"
+
+        class MockQuisby:
+            def compare_csv_to_json(self, _b, _i, data) -> JSON:
+                return {"status": "success", "json_data": sorted(data.items())}
+
+        monkeypatch.setattr(
+            CacheManager, "get_inventory_bytes", mock_get_inventory_bytes
+        )
+        monkeypatch.setattr(Metadata, "getvalue", mock_get_value)
+        monkeypatch.setattr(
+            "pbench.server.api.resources.datasets_compare.QuisbyProcessing", MockQuisby
+        )
+        response = query_get_as(["uperf_1", "uperf_2"], "test", HTTPStatus.OK)
+        ids = [Dataset.query(name=n).resource_id for n in ("uperf_1", "uperf_2")]
+        assert sorted(extracted) == sorted(ids)
+
+        # Both datasets are protected from cache reclamation while either is
+        # being extracted, and released afterwards.
+        assert [u for _, u in in_use] == [sorted(ids), sorted(ids)]
+        cache_m = in_use[0][0]
+        assert not cache_m.in_use and not cache_m.in_use_count
+        assert response.json["json_data"] == [
+            ["uperf_1", f"data for {ids[0]}"],
+            ["uperf_2", f"data for {ids[1]}"],
+        ]
+
     def test_get_inventory_exception(self, query_get_as, monkeypatch):
         def mock_get_inventory_bytes(_self, _dataset: str, _path: str) -> str:
             raise CacheExtractBadPath(Path("tarball"), _path)
@@ -2,10 +2,11 @@ import datetime
 from http import HTTPStatus
 import re
 from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
 
 import pytest
 import requests
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, desc, event
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.orm import aliased, Query
 
@@ -13,7 +14,7 @@ from pbench.server import JSON, JSONARRAY, JSONOBJECT
 from pbench.server.api.resources import APIAbort, ApiParams
 from pbench.server.api.resources.datasets_list import DatasetsList, urlencode_json
 from pbench.server.database.database import Database
-from pbench.server.database.models.datasets import Dataset, Metadata
+from pbench.server.database.models.datasets import Dataset, Metadata, MetadataError
 from pbench.server.database.models.users import User
 from pbench.test.unit.server import DRB_USER_ID
 
@@ -487,6 +488,61 @@ class TestDatasetsList:
             "total": 3,
         }
 
+    def test_get_bulk_metadata(self, query_as):
+        """Test that the metadata for a page of datasets is collected with a
+        constant number of SQL queries, and matches the values reported for
+        each dataset individually.
+
+        Args:
+            query_as: Query helper fixture
+        """
+        drb = User.query(username="drb")
+        fio_1 = Dataset.query(name="fio_1")
+        fio_2 = Dataset.query(name="fio_2")
+        Metadata.setvalue(dataset=fio_1, key="global.test", value="ABC")
+        Metadata.setvalue(dataset=fio_2, key="global.test.foo", value="ABC")
+        Metadata.setvalue(dataset=fio_1, key="user.tag", value="x", user=drb)
+        keys = [
+            "dataset",
+            "dataset.metalog.pbench.script",
+            "dataset.name",
+            "global.test.foo",
+            "server.deletion",
+            "user.tag",
+        ]
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = Database.db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            response = query_as(
+                {"metadata": ",".join(keys)},
+                "drb",
+                HTTPStatus.OK,
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        results = response.json["results"]
+        assert [r["name"] for r in results] == ["drb", "fio_1", "fio_2"]
+        metadata_queries = [s for s in statements if "FROM dataset_metadata" in s]
+        assert len(metadata_queries) == 1
+        for result in results:
+            dataset = Dataset.query(name=result["name"])
+            for k in keys:
+                try:
+                    v = Metadata.getvalue(dataset, k, drb if k == "user.tag" else None)
+                except MetadataError:
+                    v = None
+                assert result["metadata"][k] == v, f"{dataset.name}: {k}"
+        assert results[1]["metadata"]["global.test.foo"] is None
+        assert results[1]["metadata"]["user.tag"] == "x"
+        assert results[2]["metadata"]["global.test.foo"] == "ABC"
+
     def test_use_funk_metalog_keys(self, query_as):
         """Test funky metadata.log keys
 
@@ -925,6 +981,43 @@ class TestDatasetsList:
             }
         }
 
+    def test_key_summary_cache(self, monkeypatch, query_as):
+        """Test that the keyspace summary is cached until Metadata changes.
+
+        Args:
+            monkeypatch: The monkeypatch fixture
+            query_as: A fixture to provide a helper that executes the API call
+        """
+        calls = []
+        real_paths = DatasetsList.keyspace_paths
+
+        def count_paths(query: Query) -> list[tuple[str, str, bool]]:
+            calls.append(query)
+            return real_paths(query)
+
+        monkeypatch.setattr(DatasetsList, "keyspace_paths", staticmethod(count_paths))
+        first = query_as({"keysummary": "true"}, "drb", HTTPStatus.OK).json
+        again = query_as({"keysummary": "true"}, "drb", HTTPStatus.OK).json
+        assert again == first
+        assert len(calls) == 1
+
+        # A different query isn't satisfied from the cache
+        query_as({"keysummary": "true", "name": "fio"}, "drb", HTTPStatus.OK)
+        assert len(calls) == 2
+
+        # Writing Metadata invalidates the cached aggregation
+        drb = Dataset.query(name="drb")
+        Metadata.setvalue(dataset=drb, key="global.cached", value=True)
+        result = query_as({"keysummary": "true"}, "drb", HTTPStatus.OK).json
+        assert len(calls) == 3
+        assert result["keys"]["global"]["cached"] is None
+
+        # And so does removing Metadata
+        Metadata.remove(drb, "global")
+        result = query_as({"keysummary": "true"}, "drb", HTTPStatus.OK).json
+        assert len(calls) == 4
+        assert "cached" not in result["keys"].get("global", {})
+
     def get_daterange_results(
         self, name_list: list[str]
     ) -> dict[str, datetime.datetime]:
@@ -1181,3 +1274,139 @@ class TestDatasetsList:
         query = {"sort": sort}
         result = query_as(query, "test", HTTPStatus.BAD_REQUEST)
         assert result.json["message"] == message
+
+    @pytest.mark.parametrize(
+        "sort",
+        [
+            None,
+            "dataset.name:desc",
+            "dataset.owner:desc",
+            "global.test.sequence:asc:int",
+            "user.test.odd:desc:bool,dataset.uploaded:asc",
+        ],
+    )
+    def test_keyset_pagination(self, query_as, sort):
+        """Test `datasets/list?keyset` pagination
+
+        Paging through the list with a cursor should produce the same datasets
+        in the same order as an unpaginated keyset query, and report the
+        total count only when asked.
+
+        Args:
+            query_as: A fixture to provide a helper that executes the API call
+            sort: A JSON representation of the sort query parameter value
+        """
+        test = User.query(username="test")
+        all = Database.db_session.query(Dataset).order_by(desc(Dataset.name)).all()
+        for i, d in enumerate(all):
+            Metadata.setvalue(d, "global.test.sequence", i)
+            if i % 3:
+                Metadata.setvalue(d, "user.test.odd", bool(i & 1), user=test)
+        query = {"keyset": "true"}
+        if sort:
+            query["sort"] = sort
+        expected = [
+            r["name"] for r in query_as(query, "test", HTTPStatus.OK).json["results"]
+        ]
+        assert len(expected) == 7
+
+        query.update({"limit": "2", "count": "false"})
+        names = []
+        pages = 0
+        while True:
+            result = query_as(query, "test", HTTPStatus.OK).json
+            assert "total" not in result
+            names.extend(r["name"] for r in result["results"])
+            pages += 1
+            if not result["next_url"]:
+                break
+            query = {
+                k: v[0] for k, v in parse_qs(urlparse(result["next_url"]).query).items()
+            }
+        assert names == expected
+        assert pages == 4
+
+    def test_keyset_filtered(self, query_as):
+        """Test that the `datasets/list?keyset` next page URL repeats the
+        caller's filters, so that following it continues the same listing.
+
+        Args:
+            query_as: A fixture to provide a helper that executes the API call
+        """
+        query = {
+            "owner": "drb",
+            "start": "1970-01-01",
+            "filter": "^dataset.name:drb,^dataset.name:~fio",
+            "metadata": "dataset.name,dataset.uploaded",
+            "keyset": "true",
+            "sort": "dataset.name",
+        }
+        expected = [
+            r["name"] for r in query_as(query, "drb", HTTPStatus.OK).json["results"]
+        ]
+        assert expected == ["drb", "fio_1"]
+
+        query["limit"] = "1"
+        names = []
+        while True:
+            result = query_as(query, "drb", HTTPStatus.OK).json
+            names.extend(r["name"] for r in result["results"])
+            if not result["next_url"]:
+                break
+            query = {
+                k: v[0] for k, v in parse_qs(urlparse(result["next_url"]).query).items()
+            }
+            assert query["owner"] == "drb"
+            assert query["start"] == "1970-01-01"
+            assert query["filter"] == "^dataset.name:drb,^dataset.name:~fio"
+            assert query["metadata"] == "dataset.name,dataset.uploaded"
+        assert names == expected
+
+    def test_keyset_errors(self, query_as):
+        """Test `datasets/list?keyset` error cases
+
+        Args:
+            query_as: A fixture to provide a helper that executes the API call
+        """
+        result = query_as(
+            {"keyset": "true", "offset": "2"}, "test", HTTPStatus.BAD_REQUEST
+        )
+        assert (
+            result.json["message"]
+            == "Keyset pagination cannot be used with an 'offset'"
+        )
+        result = query_as({"cursor": "xyzzy"}, "test", HTTPStatus.BAD_REQUEST)
+        assert result.json["message"] == "Invalid pagination cursor 'xyzzy'"
+
+        # A cursor built for one sort order can't be used with another
+        result = query_as(
+            {"keyset": "true", "limit": "1", "sort": "dataset.name"},
+            "test",
+            HTTPStatus.OK,
+        )
+        query = parse_qs(urlparse(result.json["next_url"]).query)
+        cursor = query["cursor"][0]
+        result = query_as(
+            {"cursor": cursor, "sort": "dataset.name:desc"},
+            "test",
+            HTTPStatus.BAD_REQUEST,
+        )
+        assert result.json["message"] == f"Invalid pagination cursor {cursor!r}"
+
+    def test_offset_no_count(self, query_as):
+        """Test `datasets/list?count=false` with offset pagination
+
+        Args:
+            query_as: A fixture to provide a helper that executes the API call
+        """
+        result = query_as({"limit": "5", "count": "false"}, "test", HTTPStatus.OK)
+        assert "total" not in result.json
+        assert len(result.json["results"]) == 5
+        query = parse_qs(urlparse(result.json["next_url"]).query)
+        assert query["offset"] == ["5"]
+        result = query_as(
+            {"limit": "5", "offset": "5", "count": "false"}, "test", HTTPStatus.OK
+        )
+        assert len(result.json["results"]) == 2
+        assert result.json["next_url"] == ""
+        assert result.json["parameters"]["offset"] == "7"
@@ -125,6 +125,10 @@ class TestEndpointConfig:
                     "template": f"{uri}/upload/{{filename}}",
                     "params": {"filename": {"type": "string"}},
                 },
+                "upload_session": {
+                    "template": f"{uri}/upload/session/{{session}}",
+                    "params": {"session": {"type": "string"}},
+                },
             },
         }
 
@@ -1,7 +1,21 @@
+import json
+import tarfile
+from types import SimpleNamespace
+
+from elasticsearch.serializer import JSONSerializer
+import pyesbulk
 import pytest
 
 import pbench.server.indexer
-from pbench.server.indexer import init_indexing, ResultData
+from pbench.server.indexer import (
+    es_index,
+    init_indexing,
+    MemberIndex,
+    PbenchData,
+    ResultData,
+    SourceEncoder,
+    ToolData,
+)
 
 
 class TestResultData_expand_uid_template:
@@ -77,3 +91,204 @@ def test_init_indexing(monkeypatch, server_config, make_logger):
     except Exception as exc:
         pytest.fail(f"Unexpected exception raised: {exc}")
     assert called[0], "Mocked update_templates() was not called"
+
+
+@pytest.mark.parametrize("bulk_requests", (0, 1, 4))
+def test_es_index(monkeypatch, make_logger, bulk_requests):
+    """es_index streams one bulk request at a time unless more are allowed"""
+    calls = []
+
+    def mock_streaming_bulk(es, actions, errorsfp, logger):
+        calls.append(("streaming", es, actions, errorsfp, logger, {}))
+        return (0, 1, 2, 0, 0, 0)
+
+    def mock_parallel_bulk(es, actions, errorsfp, logger, **kwargs):
+        calls.append(("parallel", es, actions, errorsfp, logger, kwargs))
+        return (0, 1, 2, 0, 0, 0)
+
+    monkeypatch.setattr(pyesbulk, "streaming_bulk", mock_streaming_bulk)
+    monkeypatch.setattr(pyesbulk, "parallel_bulk", mock_parallel_bulk)
+    actions = iter(())
+    res = es_index(
+        "es", actions, "fp", make_logger, bulk_requests=bulk_requests, bulk_bytes=99
+    )
+    assert res == (0, 1, 2, 0, 0, 0)
+    if bulk_requests > 1:
+        expected = (
+            "parallel",
+            {"max_chunk_bytes": 99, "thread_count": 4, "queue_size": 4},
+        )
+    else:
+        expected = ("streaming", {})
+    assert calls == [
+        (expected[0], "es", actions, "fp", make_logger, expected[1]),
+    ]
+
+
+ENCODERS = ["json"] + (["orjson"] if pbench.server.indexer.orjson else [])
+
+
+def make_tool_data(encoder: SourceEncoder) -> ToolData:
+    """Construct just enough of a ToolData object to encode its documents"""
+    td = object.__new__(ToolData)
+    td.idxctx = SimpleNamespace(encoder=encoder)
+    td.toolname = "pidstat"
+    td.run_metadata = {"id": "abc", "controller": "ctrl", "toolsgroup": "default"}
+    td.iteration_metadata = {"name": "1-default", "number": 1}
+    td.sample_metadata = {"name": "sample1", "hostname": "hosté"}
+    return td
+
+
+def make_datum(td: ToolData, idx: int = 0) -> dict:
+    """Construct a tool data document like those built from .csv files"""
+    return {
+        "@timestamp": "2020-01-01T00:00:00.000000",
+        "@timestamp_original": str(1577836800000 + idx),
+        "run": td.run_metadata,
+        "iteration": td.iteration_metadata,
+        "sample": td.sample_metadata,
+        "pidstat": {"id": "1234", "@idx": idx, "cpu": {"user": 1.5, "sys": 0}},
+    }
+
+
+@pytest.mark.parametrize("name", ENCODERS)
+def test_tool_data_source_encoder(name):
+    """Tool data .csv documents are encoded just as SourceEncoder.encode()
+    would encode them, and with the json encoder their IDs match
+    make_source_id().
+    """
+    encoder = SourceEncoder(name)
+    td = make_tool_data(encoder)
+    encode_source = td._source_encoder()
+    datum = make_datum(td)
+    for user in (1.5, 2.5):
+        datum["pidstat"]["cpu"]["user"] = user
+        encoded = encode_source(datum)
+        assert encoded == encoder.encode(datum)
+        assert json.loads(encoded) == datum
+        if name == "json":
+            assert encoder.source_id(encoded) == PbenchData.make_source_id(datum)
+
+
+class TestSourceEncoder:
+    def test_bad_encoder(self, monkeypatch):
+        with pytest.raises(ValueError):
+            SourceEncoder("pickle")
+        monkeypatch.setattr(pbench.server.indexer, "orjson", None)
+        with pytest.raises(ValueError):
+            SourceEncoder("orjson")
+
+    @pytest.mark.parametrize("name", ENCODERS)
+    def test_extend(self, name):
+        """Fields appended to an encoded source are part of the document,
+        but not of its ID.
+        """
+        encoder = SourceEncoder(name)
+        source = {"b": [1, 2], "a": {"x": "é"}}
+        extra = {"@generated-by": "tracking", "authorization": {"owner": "1"}}
+        encoded = encoder.encode(source)
+        fields = encoder.encode(extra)
+        assert json.loads(encoder.extend(encoded, fields)) == {**source, **extra}
+        assert json.loads(encoder.extend(encoder.encode({}), fields)) == extra
+        assert encoder.extend(encoded, encoder.encode({})) == encoded
+        assert encoder.source_id(encoded) == encoder.source_id(encoder.encode(source))
+
+    @pytest.mark.parametrize("name", ENCODERS)
+    def test_encode_once(self, name):
+        """Each tool data source encoded once, for its ID and then extended
+        for the bulk request, is the same document, with the same ID, as one
+        serialized separately for each.
+
+        NOTE: contrib/server/benchmarks/pbench-indexer-benchmark.py compares
+        the throughput of the two.
+        """
+        serializer = JSONSerializer()
+        extra = {"@generated-by": "tracking", "authorization": {"owner": "1"}}
+        encoder = SourceEncoder(name)
+        td = make_tool_data(encoder)
+        encode_source = td._source_encoder()
+        fields = encoder.encode(extra)
+        for idx in range(3):
+            source = make_datum(td, idx)
+            encoded = encode_source(source)
+            once = serializer.dumps(encoder.extend(encoded, fields))
+
+            source_id = PbenchData.make_source_id(source)
+            source.update(extra)
+            twice = serializer.dumps(source)
+            assert json.loads(once) == json.loads(twice)
+            if name == "json":
+                assert encoder.source_id(encoded) == source_id
+
+
+def make_members(dirs: list[str], files: list[str]) -> list[tarfile.TarInfo]:
+    """Construct TarInfo records for the given directory and file paths"""
+    members = []
+    for name in dirs:
+        member = tarfile.TarInfo(name)
+        member.type = tarfile.DIRTYPE
+        members.append(member)
+    for name in files:
+        members.append(tarfile.TarInfo(name))
+    return members
+
+
+def scan(members: list[tarfile.TarInfo], path: str) -> list[str]:
+    """The linear scan of the members which the member index replaces"""
+    return [m.name for m in members if m.isfile() and m.name.find(path) >= 0]
+
+
+class TestMemberIndex:
+    def test_lookups(self):
+        """Verify that the member index finds the same files and directories
+        as scanning the members.
+        """
+        members = make_members(
+            ["run", "run/1-a", "run/1-a/sample1", "run/1-a/sample2", "run/11-a"],
+            [
+                "run/metadata.log",
+                "run/1-a/sample1/tools-default/h/iostat/csv/disk.csv",
+                "run/1-a/sample1/tools-default/h/iostat/csv/cpu.csv",
+                "run/1-a/sample1/tools-default/h/iostat-stdout.txt",
+                "run/1-a/sample1/tools-default/h/iostat2/csv/disk.csv",
+                "run/1-a/sample2/tools-default/h/iostat/csv/disk.csv",
+            ],
+        )
+        index = MemberIndex(members)
+        for path in (
+            "run/1-a/sample1/tools-default/h/iostat/csv",
+            "run/1-a/sample1/tools-default/h/iostat-stdout.txt",
+            "run/1-a/sample1/tools-default/h/iostat",
+            "run/1-a/sample3",
+        ):
+            assert list(index.files_by_prefix(path)) == sorted(scan(members, path))
+        assert index.subdirectories("run") == ["1-a", "11-a"]
+        assert index.subdirectories("run/1-a") == ["sample1", "sample2"]
+        assert index.subdirectories("run/11-a") == []
+
+    def test_scan_equivalence(self):
+        """Verify that member index lookups in a synthetic tar ball match
+        scanning the members.
+
+        NOTE: contrib/server/benchmarks/pbench-indexer-benchmark.py compares
+        the time taken by each on a much larger tar ball.
+        """
+        dirs, files = ["run"], []
+        for i in range(2):
+            dirs.append(f"run/{i}-default")
+            for s in range(2):
+                dirs.append(f"run/{i}-default/sample{s}")
+                for h in range(2):
+                    base = f"run/{i}-default/sample{s}/tools-default/host{h}"
+                    for t in range(3):
+                        files.extend(f"{base}/tool{t}/csv/f{f}.csv" for f in range(4))
+                        files.append(f"{base}/tool{t}-stdout.txt")
+        members = make_members(dirs, files)
+        paths = [
+            f"run/{i % 2}-default/sample{i % 2}/tools-default/host{i % 2}/tool{i}/csv"
+            for i in range(3)
+        ] + ["run/1-default/sample0/tools-default/host1/tool2", "run/1-default"]
+        index = MemberIndex(members)
+        found = [list(index.files_by_prefix(path)) for path in paths]
+        assert found == [sorted(scan(members, path)) for path in paths]
+        assert all(found)
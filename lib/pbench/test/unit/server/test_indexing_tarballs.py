@@ -1,9 +1,12 @@
 from argparse import Namespace
+from collections import Counter
 from logging import Logger
+import multiprocessing
 import os
 from os import stat_result
 from pathlib import Path
 from signal import SIGHUP
+import threading
 import time
 from typing import Any, Dict, List, Optional
 
@@ -36,14 +39,21 @@ from pbench.server.templates import TemplateError
 
 
 class FakeDataset:
+    datasets: dict[str, "FakeDataset"] = {}
+
     def __init__(self, name: str, resource_id: str):
         self.name = name
         self.resource_id = resource_id
         self.owner_id = 1
+        __class__.datasets[resource_id] = self
 
     def __repr__(self) -> str:
         return self.name
 
+    @staticmethod
+    def query(resource_id: str) -> "FakeDataset":
+        return __class__.datasets[resource_id]
+
     @classmethod
     def reset(cls):
         cls.new_state = None
@@ -150,6 +160,7 @@ class FakeReport:
     ):
         self.config = config
         self.name = name
+        self.es = es
 
     def post_status(
         self, timestamp: str, doctype: str, file_to_index: Optional[Path] = None
@@ -174,6 +185,8 @@ class FakeIdxContext:
         self.TS = "FAKE_TS"
         self.templates = FakePbenchTemplates(Path("path"), "test", logger)
         self._dbg = False
+        self.bulk_requests = 1
+        self.bulk_bytes = 1024
 
     def getpid(self) -> int:
         return 1
@@ -190,6 +203,9 @@ class FakeIdxContext:
     def dump_opctx(self):
         pass
 
+    def reconnect(self):
+        pass
+
     def set_tracking_id(self, id: str):
         self.tracking_id = id
 
@@ -267,6 +283,8 @@ class FakeSync:
 
 
 class FakeLockManager:
+    kept: list["FakeLockManager"] = []
+
     def __init__(self, lock: Path, exclusive: bool = False, wait: bool = True):
         """Initialize a mocked lock reference
 
@@ -275,8 +293,10 @@ class FakeLockManager:
             exclusive: lock exclusively
             wait: wait for lock
         """
+        self.lock = lock
         self.exclusive = exclusive
         self.wait = wait
+        self.locked = False
 
     def __enter__(self) -> "FakeLockManager":
         """Acquire the lock
@@ -284,11 +304,18 @@ class FakeLockManager:
         Returns:
             self reference for 'as' clause
         """
+        self.locked = True
         return self
 
     def __exit__(self, *exc):
         """Release the lock and close the lock file"""
-        self.exclusive = False
+        if self not in __class__.kept:
+            self.release()
+
+    def keep(self) -> "FakeLockManager":
+        """Keep the lock on exit"""
+        __class__.kept.append(self)
+        return self
 
     def upgrade(self):
         """Upgrade a shared lock to exclusive"""
@@ -301,6 +328,11 @@ class FakeLockManager:
     def release(self):
         """Release a lock kept past its expiration date"""
         self.exclusive = False
+        self.locked = False
+
+    @classmethod
+    def reset(cls):
+        cls.kept = []
 
 
 class FakeController:
@@ -312,6 +344,8 @@ class FakeController:
 
 
 class FakeTarball:
+    unpacked_by: list[tuple[str, str]] = []
+
     def __init__(self, path: Path, resource_id: str, controller: FakeController):
         self.name = path.name
         self.tarball_path = path
@@ -324,7 +358,13 @@ class FakeTarball:
         self.isolator = controller.path / resource_id
 
     def get_results(self, lock: LockManager):
-        pass
+        __class__.unpacked_by.append(
+            (self.tarball_path.name, threading.current_thread().name)
+        )
+
+    @classmethod
+    def reset(cls):
+        cls.unpacked_by = []
 
 
 class FakeCacheManager:
@@ -334,6 +374,20 @@ class FakeCacheManager:
         self.config = config
         self.logger = logger
         self.datasets = {}
+        self.in_use = set()
+        self.in_use_count = Counter()
+
+    def mark_in_use(self, dataset_ids: list[str]):
+        for dataset_id in dataset_ids:
+            self.in_use_count[dataset_id] += 1
+            self.in_use.add(dataset_id)
+
+    def release_in_use(self, dataset_ids: list[str]):
+        for dataset_id in dataset_ids:
+            self.in_use_count[dataset_id] -= 1
+            if self.in_use_count[dataset_id] <= 0:
+                del self.in_use_count[dataset_id]
+                self.in_use.discard(dataset_id)
 
     def find_dataset(self, resource_id: str):
         controller = FakeController(Path("/archive/ABC"), Path("/.cache"), self.logger)
@@ -394,6 +448,8 @@ def mocks(monkeypatch, make_logger):
     FakeReport.reset()
     FakeSync.reset()
     FakePbenchTarBall.reset()
+    FakeLockManager.reset()
+    FakeTarball.reset()
 
 
 @pytest.fixture()
@@ -528,7 +584,7 @@ class TestIndexingTarballs:
         assert FakePbenchTemplates.templates_updated
 
     def test_process_tb_term(self, mocks, index):
-        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
             raise SigTermException("ter-min-ate; ter-min-ate")
 
         mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
@@ -536,7 +592,7 @@ class TestIndexingTarballs:
         assert stat == 0
 
     def test_process_tb_interrupt(self, mocks, index):
-        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
             raise SigIntException("cease. also desist. and stop. that too.")
 
         mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
@@ -558,7 +614,7 @@ class TestIndexingTarballs:
         index_actions = []
         first_index = True
 
-        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
             nonlocal first_index
             if first_index:
                 first_index = False
@@ -581,7 +637,7 @@ class TestIndexingTarballs:
         ]
 
     def test_process_tb_merge(self, mocks, index):
-        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
             return (1000, 2000, 1, 0, 0, 0)
 
         FakeIndexMap.index_map = {
@@ -607,7 +663,7 @@ class TestIndexingTarballs:
     def test_process_tb(self, mocks, index):
         index_actions = []
 
-        def fake_es_index(es, actions, errorsfp, logger, _dbg=0):
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
             index_actions.append(actions)
             return (1000, 2000, 1, 0, 0, 0)
 
@@ -642,3 +698,139 @@ class TestIndexingTarballs:
             },
             {"attributes": None, "id": 4, "root": 3, "status": AuditStatus.SUCCESS},
         ]
+
+    def test_workers(self, mocks, server_config, make_logger):
+        idxctx = FakeIdxContext(server_config, make_logger)
+        index = Index("test", Namespace(index_tool_data=False, re_index=False), idxctx)
+        assert index.workers == 1
+        index = Index(
+            "test",
+            Namespace(index_tool_data=False, re_index=False, workers=3),
+            idxctx,
+        )
+        assert index.workers == 3
+
+    def test_process_tb_prefetch(self, mocks, index):
+        """Test that each dataset after the first is unpacked in the
+        background while the one before it is indexed, and that prefetched
+        datasets are released once they're indexed.
+        """
+        index_actions = []
+        unpacked = threading.Event()
+
+        def fake_get_results(self, lock: LockManager):
+            assert lock.locked
+            FakeTarball.unpacked_by.append(
+                (self.tarball_path.name, threading.current_thread().name)
+            )
+            if self.name == f"{ds1.name}.tar.xz":
+                unpacked.set()
+
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
+            # The next dataset is unpacked while the first is being indexed
+            if not index_actions:
+                assert unpacked.wait(timeout=10.0)
+                assert index.cache_manager.in_use == {"ACDF", "ABC", "GHIJ"}
+            index_actions.append(actions[0]["name"])
+            return (1000, 2000, 1, 0, 0, 0)
+
+        mocks.setattr(FakeTarball, "get_results", fake_get_results)
+        mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
+        assert index.prefetch == 1
+
+        # Another user of a dataset (e.g., a comparison) keeps it in use
+        index.cache_manager.mark_in_use(["GHIJ"])
+        stat = index.process_tb(tarballs=[tarball_2, tarball_1, tarball_3])
+        assert stat == 0
+        assert index_actions == [f"{d.name}.tar.xz" for d in (ds2, ds1, ds3)]
+
+        # The first dataset is unpacked only as it's indexed; the others were
+        # unpacked ahead by the prefetch thread, and then found unpacked as
+        # they're indexed.
+        unpacked_by = [(n, t.split("_")[0]) for n, t in FakeTarball.unpacked_by]
+        assert sorted(unpacked_by) == [
+            ("ds1.tar.xz", "MainThread"),
+            ("ds1.tar.xz", "prefetch"),
+            ("ds2.tar.xz", "MainThread"),
+            ("ds3.tar.xz", "MainThread"),
+            ("ds3.tar.xz", "prefetch"),
+        ]
+        assert len(FakeLockManager.kept) == 2
+        assert not any(lock.locked for lock in FakeLockManager.kept)
+        assert index.cache_manager.in_use == {"GHIJ"}
+        assert index.cache_manager.in_use_count == {"GHIJ": 1}
+
+    def test_process_tb_parallel(self, mocks, index):
+        """Test indexing with a pool of worker processes.
+
+        The indexing happens in the worker processes, so we can't observe
+        the mocked PbenchTarBall or es_index calls here; but the results are
+        returned to the parent process, which records them.
+        """
+
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
+            failures = 1 if actions[0]["name"] == f"{ds1.name}.tar.xz" else 0
+            return (1000, 2000, 1, 0, failures, 0)
+
+        reports = []
+
+        def fake_post_status(self, timestamp, doctype, file_to_index=None):
+            if doctype == "status":
+                reports.append(file_to_index.read_text())
+            return "tracking_id"
+
+        mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
+        mocks.setattr(FakeReport, "post_status", fake_post_status)
+        index.workers = 2
+        stat = index.process_tb(tarballs=[tarball_2, tarball_1, tarball_3])
+        assert stat == 0
+        assert FakeSync.state == OperationState.OK
+        assert FakeSync.errors == {"ds1": "1:Operational error while indexing"}
+        assert reports == [
+            "test.FAKE_TS - Indexed 2 results, w/ 1 errors\n"
+            "\nIndexed Results\n===============\n"
+            "ds2.tar.xz\nds3.tar.xz\n"
+            "\nResults producing errors\n========================\n"
+            "ds1.tar.xz\n"
+        ]
+
+    def test_process_tb_parallel_sighup(self, mocks, index):
+        """Test a SIGHUP while a worker is still indexing a dataset.
+
+        The first worker to finish sends the SIGHUP, while the other worker
+        waits until the parent has re-collected the enabled datasets. That
+        re-collection still includes the busy dataset (tarball_1), which
+        must not be dispatched again.
+        """
+        recollected = multiprocessing.get_context("fork").Event()
+
+        def fake_es_index(es, actions, errorsfp, logger, _dbg=0, **_kwargs):
+            if actions[0]["name"] == f"{ds2.name}.tar.xz":
+                os.kill(os.getppid(), SIGHUP)
+            elif actions[0]["name"] == f"{ds1.name}.tar.xz":
+                recollected.wait(timeout=10.0)
+            return (1000, 2000, 1, 0, 0, 0)
+
+        def fake_collect_tb(self) -> tuple[int, list[TarballData]]:
+            recollected.set()
+            return 0, [tarball_1, tarball_3]
+
+        reports = []
+
+        def fake_post_status(self, timestamp, doctype, file_to_index=None):
+            if doctype == "status":
+                reports.append(file_to_index.read_text())
+            return "tracking_id"
+
+        mocks.setattr("pbench.server.indexing_tarballs.es_index", fake_es_index)
+        mocks.setattr(Index, "collect_tb", fake_collect_tb)
+        mocks.setattr(FakeReport, "post_status", fake_post_status)
+        index.workers = 2
+        stat = index.process_tb(tarballs=[tarball_2, tarball_1])
+        assert stat == 0
+        assert recollected.is_set()
+        assert reports == [
+            "test.FAKE_TS - Indexed 3 results\n"
+            "\nIndexed Results\n===============\n"
+            "ds1.tar.xz\nds2.tar.xz\nds3.tar.xz\n"
+        ]
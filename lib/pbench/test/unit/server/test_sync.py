@@ -236,6 +236,39 @@ class TestSync:
         list = sync.next()
         assert ["drb", "fio_1"] == sorted(d.name for d in list)
 
+    def test_working(self, make_logger, more_datasets):
+        """Test that the sync working operation returns the datasets on which
+        the component is working, with the operation messages.
+        """
+        drb = Dataset.query(name="drb")
+        fio_1 = Dataset.query(name="fio_1")
+        fio_2 = Dataset.query(name="fio_2")
+        sync = Sync(make_logger, OperationName.UPDATE)
+        sync.update(drb, OperationState.WORKING, message="busy")
+        sync.update(fio_1, OperationState.WORKING)
+        sync.update(fio_2, OperationState.OK)
+        Sync(make_logger, OperationName.DELETE).update(fio_2, OperationState.WORKING)
+        working = sync.working()
+        assert sorted((d.name, m) for d, m in working) == [
+            ("drb", "busy"),
+            ("fio_1", None),
+        ]
+
+    def test_error_expected(self, make_logger, more_datasets):
+        """Test that the sync error operation with an expected message records
+        the error only if the operation still has that message.
+        """
+        drb = Dataset.query(name="drb")
+        sync = Sync(make_logger, OperationName.UPDATE)
+        assert not sync.error(drb, "no operation", expected="busy")
+        assert Metadata.getvalue(drb, "dataset.operations") == {}
+        sync.update(drb, OperationState.WORKING, message="busy")
+        assert sync.error(drb, "failed", expected="busy")
+        assert not sync.error(drb, "failed again", expected="busy")
+        assert Metadata.getvalue(drb, "dataset.operations") == {
+            "UPDATE": {"state": "FAILED", "message": "failed"}
+        }
+
     def test_next_failure(self, fake_raise_session, make_logger):
         """Test the behavior of the sync next behavior when a DB failure
         occurs.
@@ -245,6 +278,15 @@ class TestSync:
         with pytest.raises(SyncSqlError):
             sync.next()
 
+    def test_working_failure(self, fake_raise_session, make_logger):
+        """Test the behavior of the sync working operation when a DB failure
+        occurs.
+        """
+
+        sync = Sync(make_logger, OperationName.UPDATE)
+        with pytest.raises(SyncSqlError):
+            sync.working()
+
     def test_update_failure(self, fake_raise_session, make_logger):
         """Test the behavior of the sync update behavior when a DB failure
         occurs.
@@ -0,0 +1,382 @@
+import hashlib
+from http import HTTPStatus
+from logging import Logger
+import os
+from pathlib import Path
+import time
+
+import pytest
+
+from pbench.server import PbenchServerConfig
+from pbench.server.api.resources.upload_session import UploadSession
+from pbench.server.cache_manager import CacheManager
+from pbench.server.database.models.audit import Audit, AuditStatus
+from pbench.server.database.models.datasets import Dataset, DatasetNotFound
+
+
+class TestUploadSession:
+    cachemanager_create_path = None
+
+    @staticmethod
+    def gen_uri(server_config, session=None):
+        uri = f"{server_config.rest_uri}/upload/session"
+        return f"{uri}/{session}" if session else uri
+
+    @staticmethod
+    def gen_headers(auth_token, **headers):
+        return {"Authorization": "Bearer " + auth_token, **headers}
+
+    @pytest.fixture(scope="function", autouse=True)
+    def fake_cache_manager(self, monkeypatch):
+        class FakeTarball:
+            def __init__(self, path: Path):
+                self.tarball_path = path
+                self.name = Dataset.stem(path)
+                self.resource_id = hashlib.md5(
+                    str(path).encode(errors="ignore")
+                ).hexdigest()
+                self.metadata = {"pbench": {"date": "2002-05-16T00:00:00"}}
+
+            def delete(self):
+                pass
+
+        real_cm_init = CacheManager.__init__
+
+        def fake_init(self, options: PbenchServerConfig, logger: Logger):
+            real_cm_init(self, options, logger)
+            self.controllers = {}
+            self.datasets = {}
+
+        def fake_create(self, path: Path) -> FakeTarball:
+            TestUploadSession.cachemanager_create_path = path
+            tarball = FakeTarball(path)
+            self.datasets[tarball.name] = tarball
+            return tarball
+
+        TestUploadSession.cachemanager_create_path = None
+        monkeypatch.setattr(CacheManager, "__init__", fake_init)
+        monkeypatch.setattr(CacheManager, "create", fake_create)
+
+    def create(self, client, server_config, token, datafile: Path, md5: str):
+        return client.post(
+            self.gen_uri(server_config),
+            headers=self.gen_headers(token, **{"Content-MD5": md5}),
+            query_string={
+                "filename": datafile.name,
+                "length": datafile.stat().st_size,
+            },
+        )
+
+    def send(self, client, server_config, token, md5, data, first, length, **hdr):
+        last = first + len(data) - 1
+        return client.put(
+            self.gen_uri(server_config, md5),
+            data=data,
+            headers=self.gen_headers(
+                token,
+                **{
+                    "Content-Range": f"bytes {first}-{last}/{length}",
+                    "Content-Type": "application/octet-stream",
+                },
+                **hdr,
+            ),
+        )
+
+    def test_unauthenticated(self, client, server_config):
+        response = client.post(self.gen_uri(server_config))
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    @pytest.mark.parametrize(
+        "query,md5,message",
+        (
+            (
+                {"length": 10},
+                "abc",
+                "An upload session requires a filename, a length, and a 'Content-MD5' header",
+            ),
+            (
+                {"filename": "a.tar.xz", "length": 10},
+                None,
+                "An upload session requires a filename, a length, and a 'Content-MD5' header",
+            ),
+            (
+                {"filename": "a.tar", "length": 10},
+                "abc",
+                "File extension not supported, must be .tar.xz",
+            ),
+            (
+                {"filename": "a.tar.xz", "length": 0},
+                "abc",
+                "Length 0 must be greater than 0",
+            ),
+            (
+                {"filename": "a.tar.xz", "length": 10},
+                "..",
+                "Filename and MD5 must not contain a path",
+            ),
+        ),
+    )
+    def test_create_bad(
+        self, client, server_config, pbench_drb_token, query, md5, message
+    ):
+        headers = {"Content-MD5": md5} if md5 else {}
+        response = client.post(
+            self.gen_uri(server_config),
+            headers=self.gen_headers(pbench_drb_token, **headers),
+            query_string=query,
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["message"] == message
+
+    def test_unknown_session(self, client, server_config, pbench_drb_token):
+        response = client.get(
+            self.gen_uri(server_config, "nosuch"),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert response.json["message"] == "No upload session 'nosuch'"
+
+    def test_other_user(
+        self, client, server_config, pbench_drb_token, pbench_admin_token, tarball
+    ):
+        """A session is visible only to the user who created it"""
+        datafile, _, md5 = tarball
+        response = self.create(client, server_config, pbench_drb_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+        response = client.get(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_admin_token),
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    @pytest.mark.freeze_time("1970-01-01")
+    def test_upload(
+        self, client, server_config, pbench_drb_token, tarball, mock_backup
+    ):
+        """Transfer a tarball in out-of-order ranges, retrying one range, and
+        complete the upload.
+        """
+        datafile, _, md5 = tarball
+        name = Dataset.stem(datafile)
+        data = datafile.read_bytes()
+        length = len(data)
+        half = length // 2
+
+        response = self.create(client, server_config, pbench_drb_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED, repr(response.text)
+        assert response.json == {
+            "name": datafile.name,
+            "resource_id": md5,
+            "length": length,
+            "received": [],
+        }
+        assert response.headers["location"].endswith(f"/upload/session/{md5}")
+
+        # Creating the same session again resumes it
+        response = self.create(client, server_config, pbench_drb_token, datafile, md5)
+        assert response.status_code == HTTPStatus.OK
+
+        response = self.send(
+            client, server_config, pbench_drb_token, md5, data[half:], half, length
+        )
+        assert response.status_code == HTTPStatus.OK, repr(response.text)
+        assert response.json["received"] == [[half, length - 1]]
+
+        # A range which doesn't match its MD5 isn't recorded, and doesn't
+        # overwrite the range already received.
+        response = self.send(
+            client,
+            server_config,
+            pbench_drb_token,
+            md5,
+            b"x" * length,
+            0,
+            length,
+            **{"Content-MD5": "bad"},
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["message"].endswith("does not match expected bad")
+        session_dir = (
+            server_config.ARCHIVE
+            / CacheManager.TEMPORARY
+            / UploadSession.SESSIONS
+            / md5
+        )
+        assert (session_dir / UploadSession.DATA).read_bytes()[half:] == data[half:]
+        assert sorted(p.name for p in session_dir.iterdir()) == [
+            UploadSession.DATA,
+            UploadSession.RANGES,
+            UploadSession.STATE,
+        ]
+
+        # Completing the upload requires all ranges
+        response = client.post(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.status_code == HTTPStatus.CONFLICT
+        assert response.json == {
+            "message": f"Upload of {datafile.name} is incomplete",
+            "received": [[half, length - 1]],
+        }
+        with pytest.raises(DatasetNotFound):
+            Dataset.query(resource_id=md5)
+
+        response = self.send(
+            client,
+            server_config,
+            pbench_drb_token,
+            md5,
+            data[:half],
+            0,
+            length,
+            **{"Content-MD5": hashlib.md5(data[:half]).hexdigest()},
+        )
+        assert response.status_code == HTTPStatus.OK, repr(response.text)
+        assert response.json["received"] == [[0, length - 1]]
+
+        response = client.get(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json["received"] == [[0, length - 1]]
+
+        response = client.post(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.status_code == HTTPStatus.CREATED, repr(response.text)
+        assert response.json["message"] == "File successfully uploaded"
+        assert response.json["resource_id"] == md5
+        assert self.cachemanager_create_path.name == datafile.name
+
+        dataset = Dataset.query(resource_id=md5)
+        assert dataset.name == name
+        audit = Audit.query()
+        assert [(a.name, a.status) for a in audit] == [
+            ("upload", AuditStatus.BEGIN),
+            ("upload", AuditStatus.SUCCESS),
+        ]
+
+        # The session is gone once the upload is complete
+        assert not (
+            server_config.ARCHIVE
+            / CacheManager.TEMPORARY
+            / UploadSession.SESSIONS
+            / md5
+        ).exists()
+        response = client.get(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    @pytest.mark.parametrize(
+        "content_range,status",
+        (
+            ("bytes 0-9", HTTPStatus.BAD_REQUEST),
+            ("bytes 5-4/{length}", HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE),
+            ("bytes 0-{length}/{length}", HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE),
+            ("bytes 0-9/1", HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE),
+            ("bytes 0-9/{length}", HTTPStatus.BAD_REQUEST),
+        ),
+    )
+    def test_bad_range(
+        self, client, server_config, pbench_drb_token, tarball, content_range, status
+    ):
+        datafile, _, md5 = tarball
+        length = datafile.stat().st_size
+        self.create(client, server_config, pbench_drb_token, datafile, md5)
+        response = client.put(
+            self.gen_uri(server_config, md5),
+            data=b"x" * 5,
+            headers=self.gen_headers(
+                pbench_drb_token,
+                **{"Content-Range": content_range.format(length=length)},
+            ),
+        )
+        assert response.status_code == status
+        response = client.get(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.json["received"] == []
+
+    def test_delete(self, client, server_config, pbench_drb_token, tarball):
+        datafile, _, md5 = tarball
+        self.create(client, server_config, pbench_drb_token, datafile, md5)
+        response = client.delete(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json == {
+            "message": f"Upload session for {datafile.name} removed"
+        }
+        response = client.get(
+            self.gen_uri(server_config, md5),
+            headers=self.gen_headers(pbench_drb_token),
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_expire(self, client, server_config, pbench_drb_token, tarball):
+        """An inactive session is removed when a session is next created"""
+        datafile, _, md5 = tarball
+        response = self.create(client, server_config, pbench_drb_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+        response = self.create(client, server_config, pbench_drb_token, datafile, md5)
+        assert response.status_code == HTTPStatus.OK
+
+        session_dir = (
+            server_config.ARCHIVE
+            / CacheManager.TEMPORARY
+            / UploadSession.SESSIONS
+            / md5
+        )
+        (session_dir / UploadSession.RANGES / "0-9").touch()
+        stale = time.time() - 49 * 60 * 60
+        os.utime(session_dir, (stale, stale))
+
+        # The expired session, with its received ranges, is replaced by a
+        # new one.
+        response = self.create(client, server_config, pbench_drb_token, datafile, md5)
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json["received"] == []
+
+    def test_active_not_expired(self, client, server_config, pbench_drb_token, tarball):
+        """A session which is still receiving ranges isn't expired"""
+        datafile, _, md5 = tarball
+        data = datafile.read_bytes()
+        self.create(client, server_config, pbench_drb_token, datafile, md5)
+        session_dir = (
+            server_config.ARCHIVE
+            / CacheManager.TEMPORARY
+            / UploadSession.SESSIONS
+            / md5
+        )
+        stale = time.time() - 49 * 60 * 60
+        os.utime(session_dir, (stale, stale))
+
+        response = self.send(
+            client, server_config, pbench_drb_token, md5, data[:10], 0, len(data)
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert session_dir.stat().st_mtime > stale
+
+        # Resuming the session keeps the range received.
+        response = self.create(client, server_config, pbench_drb_token, datafile, md5)
+        assert response.status_code == HTTPStatus.OK
+        assert response.json["received"] == [[0, 9]]
+
+    def test_conflict(self, client, server_config, pbench_drb_token, tarball):
+        """A session for the same tarball with different parameters conflicts"""
+        datafile, _, md5 = tarball
+        self.create(client, server_config, pbench_drb_token, datafile, md5)
+        response = client.post(
+            self.gen_uri(server_config),
+            headers=self.gen_headers(pbench_drb_token, **{"Content-MD5": md5}),
+            query_string={"filename": datafile.name, "length": 1},
+        )
+        assert response.status_code == HTTPStatus.CONFLICT
+        assert response.json["message"] == "Dataset is currently being uploaded"